@@ -1,14 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from modules.rate_limit import RateLimitMiddleware
 
 app = FastAPI(root_path="/api/v1")
 
+# Added first so it runs inside CORS and 429 responses carry the CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:4200", "https://medipol.app"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 tags_metadata = [
@@ -26,6 +31,55 @@ tags_metadata = [
     },
 ]
 
+
+@app.on_event("startup")
+def apply_indexes():
+    from crud.indexes import ensure_indexes
+
+    ensure_indexes()
+
+
+@app.on_event("startup")
+async def start_order_events():
+    from modules.events import start_event_source
+
+    app.state.order_event_watcher = await start_event_source()
+
+
+@app.on_event("startup")
+async def start_order_archival():
+    import asyncio
+    from crud.archive import archival_scheduler
+
+    app.state.order_archival = asyncio.create_task(archival_scheduler())
+
+
+@app.on_event("startup")
+async def start_session_invalidation():
+    from modules.sessions import start_invalidation_channel
+
+    app.state.session_invalidation = await start_invalidation_channel()
+
+
+@app.on_event("startup")
+async def start_outbox_dispatcher():
+    import asyncio
+    from crud.outbox import outbox_dispatcher
+
+    app.state.outbox_dispatcher = asyncio.create_task(outbox_dispatcher())
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    from modules.security import shutdown_hash_pool
+
+    shutdown_hash_pool()
+    for name in ("order_event_watcher", "order_archival", "session_invalidation", "outbox_dispatcher"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+
+
 from routes.authentication.routes import *
 from routes.user.routes import *
 from routes.admin.routes import *
@@ -33,4 +87,6 @@ from routes.content.routes import *
 from routes.order.routes import *
 from routes.order_list.routes import *
 from routes.manifacturer_pool.routes import *
-from routes.manifacturer_process.routes import *
\ No newline at end of file
+from routes.manifacturer_process.routes import *
+from routes.order_search.routes import *
+from routes.events.routes import *
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Concurrency benchmark for the async routes.
+
+Start the API, then run from backend/app:
+    BENCH_TOKEN=<access token> python -m benchmarks.async_concurrency --url http://localhost:8000 --path /order/list
+
+Throughput should grow with the number of in-flight requests as long as the
+routes do not block the event loop on database round trips.
+"""
+import argparse
+import asyncio
+import os
+import time
+import httpx
+
+
+async def run_level(client: httpx.AsyncClient, path: str, concurrency: int, total: int) -> dict:
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main(args) -> None:
+    headers = {"Authorization": f"Bearer {os.getenv('BENCH_TOKEN', '')}"}
+    limits = httpx.Limits(max_connections=max(args.levels))
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=60) as client:
+        print(f"{'in-flight':>10} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'errors':>8}")
+        for level in args.levels:
+            result = await run_level(client, args.path, level, args.requests)
+            print(
+                f"{result['concurrency']:>10} {result['rps']:>10.1f} {result['p50_ms']:>10.1f} "
+                f"{result['p95_ms']:>10.1f} {result['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure throughput against in-flight requests")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/order/list")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+"""
+Startup cost of the API: import time and resident memory of `import app`.
+
+Run from backend/app (MONGODB_URI/DB_NAME as for the API; clients connect lazily):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --with-geometry   # plus the lazily imported geometry stack
+
+Each measurement runs in a fresh interpreter with -X importtime, which reports every module's
+self and cumulative import time on stderr. Self times are summed per top-level package and the
+slowest packages are listed, so a
+module that starts importing a heavy dependency at startup shows up here. Without --with-geometry
+the run fails (exit 1) when one of the packages in LAZY_PACKAGES was imported by `import app`.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+GEOMETRY_MODULES = ["numpy", "trimesh", "matplotlib.pyplot", "mpl_toolkits.mplot3d.art3d", "stl"]
+
+# Only imported where they are used (geometry jobs, redmail on first send), never by `import app`
+LAZY_PACKAGES = ["matplotlib", "numpy", "trimesh", "stl", "redmail"]
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+{extra}
+elapsed = time.perf_counter() - started
+# ru_maxrss is KiB on Linux, bytes on macOS
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps({{"seconds": elapsed, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20}}))
+"""
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Microseconds per top-level package imported, from -X importtime output"""
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        # Everything is nested under `import app`, so self times (not the cumulative ones) are summed
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        totals[name.strip().split(".")[0]] += float(self_us)
+    return totals
+
+
+def measure(with_geometry: bool) -> dict:
+    extra = "\n".join(f"import {module}" for module in GEOMETRY_MODULES) if with_geometry else ""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(extra=extra)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    summary["packages"] = parse_importtime(result.stderr)
+    return summary
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--with-geometry", action="store_true")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.with_geometry) for _ in range(args.runs)]
+    seconds = [run["seconds"] for run in runs]
+    rss = [run["max_rss_mb"] for run in runs]
+    print(f"import app: median {statistics.median(seconds):.3f}s, min {min(seconds):.3f}s over {args.runs} runs")
+    print(f"max RSS:    median {statistics.median(rss):.1f} MB")
+
+    packages: Dict[str, List[float]] = defaultdict(list)
+    for run in runs:
+        for package, micros in run["packages"].items():
+            packages[package].append(micros)
+    print("\nslowest top-level packages (median ms, self time of their modules):")
+    ranked = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for package, micros in ranked[: args.top]:
+        print(f"  {package:<30} {statistics.median(micros) / 1000:9.1f}")
+
+    if args.with_geometry:
+        return 0
+    eager = [package for package in LAZY_PACKAGES if package in packages]
+    if eager:
+        print(f"\nFAIL: import app imports {', '.join(eager)}, which must stay lazy", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Hot/cold order archival.
+
+Orders that were finished (ready to take or cancelled) more than archive_after_days ago are
+moved from orders to orders_archive, so the hot collection only holds in-flight work.
+A batch is first upserted into the archive and only then deleted from orders; a crash in
+between leaves a copy in both, which the next run simply upserts and deletes again.
+
+Readers use find_order_async / find_orders_page_async, which fall back to the archive.
+
+Run once from backend/app:
+    python -m crud.archive
+"""
+import asyncio
+import heapq
+import logging
+from datetime import timedelta
+from typing import List, Optional
+from pymongo import DESCENDING, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+from crud import async_databases
+from crud.codec import utcnow
+from modules.config import config
+from modules.pagination import keyset_sort, sort_key
+from routes.order.models import OrderStatus
+
+ARCHIVE_LOCK_ID = "order_archival"
+FINISHED_STATUSES = [OrderStatus.READY_TO_TAKE.value, OrderStatus.CANCELLED.value]
+
+
+def archivable_query(archive_after_days: int) -> dict:
+    return {
+        "status": {"$in": FINISHED_STATUSES},
+        "last_updated": {"$lt": utcnow() - timedelta(days=archive_after_days)},
+    }
+
+
+# ==================== ARCHIVAL JOB ====================
+async def archive_batch(query: dict, batch_size: int) -> int:
+    batch = await async_databases.orders.find(query).limit(batch_size).to_list(length=batch_size)
+    if not batch:
+        return 0
+
+    await async_databases.orders_archive.bulk_write(
+        [ReplaceOne({"_id": order["_id"]}, order, upsert=True) for order in batch],
+        ordered=False,
+    )
+    # Same filter again: an order touched since it was read stays hot and is re-copied next run
+    result = await async_databases.orders.delete_many(
+        {"$and": [query, {"_id": {"$in": [order["_id"] for order in batch]}}]}
+    )
+    return result.deleted_count
+
+
+async def _acquire_lock(ttl_seconds: float) -> bool:
+    """Only one API worker runs the job per interval"""
+    now = utcnow()
+    try:
+        await async_databases.scheduler_locks.update_one(
+            {"_id": ARCHIVE_LOCK_ID, "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # Duplicate key on the upsert: another worker holds an unexpired lock
+        return False
+
+
+async def run_archival(archive_after_days: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    query = archivable_query(archive_after_days or config.archive_after_days)
+    batch_size = batch_size or config.archive_batch_size
+
+    archived = 0
+    while True:
+        moved = await archive_batch(query, batch_size)
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+async def archival_scheduler() -> None:
+    interval = config.archive_interval_minutes * 60
+    while True:
+        try:
+            if await _acquire_lock(interval):
+                archived = await run_archival()
+                if archived:
+                    logging.info(f"Archived {archived} finished orders")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Order archival failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+# ==================== READ-THROUGH ====================
+async def find_order_async(query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+    order = await async_databases.orders.find_one(query, projection)
+    if order is None:
+        order = await async_databases.orders_archive.find_one(query, projection)
+    return order
+
+
+async def find_orders_page_async(query: dict, sort_field: str, limit: int) -> List[dict]:
+    """
+    Up to limit documents (all of them for 0) of query across orders and orders_archive, newest first
+    by (sort_field, _id). Both collections are read with the same keyset filter, so cursors work across the two.
+    """
+    sort = keyset_sort(sort_field, DESCENDING)
+    hot, cold = await asyncio.gather(
+        async_databases.orders.find(query).sort(sort).limit(limit).to_list(length=limit or None),
+        async_databases.orders_archive.find(query).sort(sort).limit(limit).to_list(length=limit or None),
+    )
+
+    page, seen = [], set()
+    # Both lists are already in MongoDB's order, the key reproduces it for legacy and missing values too
+    for doc in heapq.merge(hot, cold, key=lambda doc: sort_key(doc, sort_field), reverse=True):
+        # An archival interrupted between copy and delete leaves the order in both
+        if doc["_id"] in seen:
+            continue
+        seen.add(doc["_id"])
+        page.append(doc)
+        if len(page) == limit:
+            break
+    return page
+
+
+if __name__ == "__main__":
+    print(f"Archived {asyncio.run(run_archival())} finished orders")
@@ -0,0 +1,23 @@
+import os
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+
+# Non-blocking handles for the async routes, mirrors crud/databases.py
+client = AsyncIOMotorClient(os.getenv("MONGODB_URI", ""))
+
+db = client[os.getenv("DB_NAME", "")]
+users = db["users"]
+orders = db["orders"]
+orders_archive = db["orders_archive"]
+manufacturer_data = db["manufacturer_data"]
+media_index = db["media_index"]
+order_stats_daily = db["order_stats_daily"]
+customer_stats = db["customer_stats"]
+scheduler_locks = db["scheduler_locks"]
+session_invalidations = db["session_invalidations"]
+refresh_tokens = db["refresh_tokens"]
+stream_tickets = db["stream_tickets"]
+rate_limits = db["rate_limits"]
+outbox = db["outbox"]
+jobs = db["jobs"]
+
+fs = AsyncIOMotorGridFSBucket(db)
@@ -0,0 +1,48 @@
+"""
+Encoding of documents written to MongoDB.
+
+model_dump(mode='json') turns datetimes into ISO strings, which then sort and compare as text.
+to_document keeps them as datetime so pymongo stores BSON dates, and only reduces enums to their values.
+"""
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional
+from pydantic import BaseModel
+
+
+def utcnow() -> datetime:
+    """Naive UTC, the same form pymongo hands back when reading a BSON date"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_document(value):
+    if isinstance(value, BaseModel):
+        return to_document(value.model_dump())
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: to_document(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_document(item) for item in value]
+    return value
+
+
+def as_datetime(value) -> Optional[datetime]:
+    """
+    Decode a timestamp stored before the codec existed (ISO string or extended JSON).
+    Routes read stored timestamps through it too, so documents the migration has not reached
+    yet still render. Returns None for anything it cannot parse.
+    """
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, dict) and "$date" in value:
+        return as_datetime(value["$date"])
+    if isinstance(value, str):
+        try:
+            return as_datetime(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        except ValueError:
+            try:
+                return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,68 @@
+"""
+Per-customer order counters in customer_stats: completed, cancelled and total_spend.
+
+Finalize and cancel $inc them in the same request, so views read one small document
+instead of counting the customer's orders.
+"""
+import logging
+from typing import Dict
+from crud import async_databases
+from crud.codec import utcnow
+
+EMPTY_CUSTOMER_STATS = {"completed": 0, "cancelled": 0, "total_spend": 0.0}
+
+
+async def record_customer_stats(user_id: str, counters: Dict[str, float]) -> None:
+    """$inc the customer's counters; never fails the transition itself"""
+    try:
+        await async_databases.customer_stats.update_one(
+            {"user_id": user_id},
+            {"$inc": counters, "$set": {"updated_at": utcnow()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logging.error(f"Failed to record customer stats for {user_id}: {str(e)}")
+
+
+async def get_customer_stats_async(user_id: str) -> dict:
+    stats = await async_databases.customer_stats.find_one({"user_id": user_id}, {"_id": 0})
+    return {**EMPTY_CUSTOMER_STATS, **(stats or {})}
+
+
+def customer_stats_pipeline() -> list:
+    """
+    Recompute every customer's counters from orders and orders_archive and merge them into customer_stats.
+    Finalizes and cancels landing while it runs can be overwritten by the merge, run it with the API stopped.
+    """
+    finished = {"$match": {"$or": [
+        {"order_timing_table.ready_to_take": {"$ne": None}},
+        {"is_cancelled": True},
+    ]}}
+    is_ready = {"$ne": [{"$ifNull": ["$ready_to_take", None]}, None]}
+    return [
+        finished,
+        {"$unionWith": {"coll": "orders_archive", "pipeline": [finished]}},
+        # An archival interrupted between copy and delete leaves the order in both
+        {"$group": {
+            "_id": "$_id",
+            "user_id": {"$first": "$user_id"},
+            "ready_to_take": {"$first": "$order_timing_table.ready_to_take"},
+            "is_cancelled": {"$first": "$is_cancelled"},
+            "final_price": {"$first": "$final_price"},
+        }},
+        {"$group": {
+            "_id": "$user_id",
+            "completed": {"$sum": {"$cond": [is_ready, 1, 0]}},
+            "cancelled": {"$sum": {"$cond": [{"$eq": ["$is_cancelled", True]}, 1, 0]}},
+            "total_spend": {"$sum": {"$cond": [is_ready, {"$ifNull": ["$final_price", 0]}, 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id",
+            "completed": 1,
+            "cancelled": 1,
+            "total_spend": 1,
+            "updated_at": "$$NOW",
+        }},
+        {"$merge": {"into": "customer_stats", "on": "user_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
@@ -9,6 +9,16 @@ deleted_users = db["deleted_users"]
 files_db = db["files_db"]
 general_settings = db["general_settings"]
 orders = db["orders"]
+orders_archive = db["orders_archive"]
 manufacturer_data = db["manufacturer_data"]
+media_index = db["media_index"]
+order_stats_daily = db["order_stats_daily"]
+customer_stats = db["customer_stats"]
+session_invalidations = db["session_invalidations"]
+refresh_tokens = db["refresh_tokens"]
+stream_tickets = db["stream_tickets"]
+rate_limits = db["rate_limits"]
+outbox = db["outbox"]
+jobs = db["jobs"]
 
 fs = gridfs.GridFS(db)
@@ -0,0 +1,238 @@
+"""
+Declarative index registry for every hot query path.
+
+Indexes are applied idempotently at API startup, or from backend/app with:
+    python -m crud.indexes            # create missing indexes
+    python -m crud.indexes --check    # create, then explain() the hot queries
+"""
+import argparse
+import logging
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from crud.databases import db
+
+ORDER_RECEIVED_TS = "order_timing_table.order_received.timestamp"
+ORDER_ASSIGNED_TS = "order_timing_table.assigned_to_manufacturer.timestamp"
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "deleted_users": [
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    "orders": [
+        IndexModel([("order_id", ASCENDING)], name="order_id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)],
+            name="user_received_id",
+        ),
+        IndexModel(
+            [("manufacturer_id", ASCENDING), ("is_cancelled", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING)],
+            name="manufacturer_cancelled_received",
+        ),
+        IndexModel(
+            [("manufacturer_id", ASCENDING), ("is_cancelled", ASCENDING), (ORDER_ASSIGNED_TS, DESCENDING), ("_id", DESCENDING)],
+            name="manufacturer_cancelled_assigned",
+        ),
+        IndexModel([(ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)], name="received_id"),
+        IndexModel(
+            [("manufacturer_id", ASCENDING), ("status", ASCENDING), ("last_updated", DESCENDING)],
+            name="manufacturer_status_updated",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("last_updated", DESCENDING)],
+            name="user_status_updated",
+        ),
+        IndexModel([("status", ASCENDING), ("last_updated", ASCENDING)], name="status_updated"),
+        IndexModel([("preview_id", ASCENDING)], name="preview_id"),
+        # order search: each leading equality filter followed by the received-date sort
+        IndexModel([("status", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)], name="status_received_id"),
+        IndexModel(
+            [("order_detail.material", ASCENDING), ("order_detail.color", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING)],
+            name="material_color_received",
+        ),
+        IndexModel(
+            [("order_type", ASCENDING), ("order_detail.brand", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING)],
+            name="type_brand_received",
+        ),
+        IndexModel([("manufacturer_id", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)], name="manufacturer_received_id"),
+    ],
+    "orders_archive": [
+        IndexModel([("order_id", ASCENDING)], name="order_id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), (ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)],
+            name="user_received_id",
+        ),
+        IndexModel([("preview_id", ASCENDING)], name="preview_id"),
+    ],
+    "manufacturer_data": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "files_db": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("content_type", ASCENDING), ("usage", ASCENDING)], name="content_type_usage"),
+        IndexModel([("content_type", ASCENDING), ("added_date", DESCENDING), ("_id", DESCENDING)], name="content_type_added"),
+    ],
+    "general_settings": [
+        IndexModel([("field", ASCENDING)], name="field_unique", unique=True),
+    ],
+    "media_index": [
+        IndexModel([("logical_id", ASCENDING)], name="logical_id_unique", unique=True),
+    ],
+    "order_stats_daily": [
+        IndexModel(
+            [("day", ASCENDING), ("manufacturer_id", ASCENDING), ("material", ASCENDING), ("order_type", ASCENDING)],
+            name="bucket_unique",
+            unique=True,
+        ),
+        IndexModel([("manufacturer_id", ASCENDING), ("day", ASCENDING)], name="manufacturer_day"),
+    ],
+    "customer_stats": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "refresh_tokens": [
+        IndexModel([("family_id", ASCENDING)], name="family_id"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "stream_tickets": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)], name="status_locked_until"),
+        IndexModel([("purge_at", ASCENDING)], name="purge_at_ttl", expireAfterSeconds=0),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("kind", ASCENDING), ("run_after", ASCENDING)], name="status_kind_run_after"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        IndexModel([("purge_at", ASCENDING)], name="purge_at_ttl", expireAfterSeconds=0),
+    ],
+    "fs.files": [
+        IndexModel([("metadata.original_file_id", ASCENDING)], name="metadata_original_file_id", sparse=True),
+        IndexModel([("metadata.file_id", ASCENDING)], name="metadata_file_id", sparse=True),
+    ],
+}
+
+# (collection, description, filter, sort) of the queries run on every request or listing
+HOT_QUERIES = [
+    ("users", "session user", {"id": "x", "role": {"$in": ["user", "admin", "manager", "manufacturer"]}}, None),
+    ("users", "login by email", {"email": "x"}, None),
+    ("users", "register by username", {"username": "x"}, None),
+    ("orders", "order by id", {"order_id": "x"}, None),
+    ("orders", "customer orders", {"user_id": "x"}, [(ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)]),
+    (
+        "orders",
+        "unassigned pool",
+        {
+            "$and": [
+                {"$or": [{"manufacturer_id": ""}, {"manufacturer_id": {"$exists": False}}, {"manufacturer_id": None}]},
+                {"is_cancelled": {"$ne": True}},
+                {"rejected_manufacturers": {"$nin": ["x"]}},
+            ]
+        },
+        [(ORDER_RECEIVED_TS, DESCENDING)],
+    ),
+    ("orders", "adopted orders", {"manufacturer_id": "x", "is_cancelled": False}, [(ORDER_ASSIGNED_TS, DESCENDING), ("_id", DESCENDING)]),
+    ("orders", "manufacturer orders by status", {"manufacturer_id": "x", "status": "Produced"}, [("last_updated", DESCENDING)]),
+    ("orders", "customer orders by status", {"user_id": "x", "status": "Cancelled"}, [("last_updated", DESCENDING)]),
+    ("orders", "search by short number", {"order_id": {"$regex": "^1a2b3c4d"}}, None),
+    ("orders", "search by status", {"status": "Produced"}, [(ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)]),
+    ("orders", "search by material", {"order_detail.material": "PLA"}, [(ORDER_RECEIVED_TS, DESCENDING)]),
+    ("orders", "archival candidates", {"status": {"$in": ["Ready to Take", "Cancelled"]}, "last_updated": {"$lt": "x"}}, None),
+    ("orders_archive", "archived customer orders", {"user_id": "x"}, [(ORDER_RECEIVED_TS, DESCENDING), ("_id", DESCENDING)]),
+    ("manufacturer_data", "manufacturer details", {"user_id": "x"}, None),
+    ("fs.files", "preview by original file", {"metadata.original_file_id": "x", "metadata.type": "preview"}, None),
+    ("fs.files", "product image by file id", {"metadata.file_id": "x"}, None),
+    ("media_index", "media by logical id", {"logical_id": "x"}, None),
+    ("customer_stats", "customer counters", {"user_id": "x"}, None),
+    ("refresh_tokens", "token family", {"family_id": "x"}, None),
+    ("jobs", "due jobs", {"status": "queued", "kind": {"$in": ["render_preview"]}, "run_after": {"$lte": "x"}}, [("run_after", ASCENDING)]),
+    ("outbox", "due e-mails", {"status": "pending", "next_attempt_at": {"$lte": "x"}}, [("next_attempt_at", ASCENDING)]),
+    ("order_stats_daily", "daily stats range", {"day": {"$gte": "x", "$lt": "y"}}, None),
+]
+
+
+def ensure_collection_indexes(collection: str) -> Dict[str, Optional[str]]:
+    """
+    Create the registered indexes of one collection one by one, so a failing index does not
+    keep the others from being built. Maps each index name to None, or to the error it failed with.
+    """
+    results = {}
+    for model in INDEXES[collection]:
+        name = model.document["name"]
+        try:
+            db[collection].create_indexes([model])
+            results[name] = None
+        except OperationFailure as e:
+            # e.g. duplicate data blocking a unique index, or IndexOptionsConflict with an
+            # existing index of the same keys; keep the API up and report it
+            logging.error(f"Creating index {name} on {collection} failed: {str(e)}")
+            results[name] = str(e)
+    return results
+
+
+def ensure_indexes() -> Dict[str, Dict[str, Optional[str]]]:
+    """Create every registered index; existing ones with the same spec are left untouched"""
+    return {collection: ensure_collection_indexes(collection) for collection in INDEXES}
+
+
+def _find_stages(plan, stage: str) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            return True
+        return any(_find_stages(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_find_stages(value, stage) for value in plan)
+    return False
+
+
+def check_hot_queries() -> List[dict]:
+    """explain() every hot query and report the ones whose winning plan still does a COLLSCAN"""
+    report = []
+    for collection, description, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        report.append({
+            "collection": collection,
+            "query": description,
+            "collscan": _find_stages(plan, "COLLSCAN"),
+        })
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply the index registry")
+    parser.add_argument("--check", action="store_true", help="explain() the hot queries afterwards")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for collection, results in ensure_indexes().items():
+        for name, error in results.items():
+            if error:
+                failures += 1
+                print(f"[FAILED] {collection}.{name}: {error}")
+            else:
+                print(f"[ok] {collection}.{name}")
+
+    if not args.check:
+        return 1 if failures else 0
+
+    for result in check_hot_queries():
+        state = "COLLSCAN" if result["collscan"] else "ok"
+        failures += result["collscan"]
+        print(f"[{state}] {result['collection']}: {result['query']}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""
+Mongo-backed job queue for the geometry worker (worker.py).
+
+A job is claimed with one find_one_and_update that sets a lease, so each job runs on one worker.
+The worker extends the lease with heartbeats while it runs. A job whose lease expires, because
+its worker died, is claimed again. Every claim counts as an attempt. Failures are retried with
+exponential backoff until max_attempts, then the job is parked as dead for inspection.
+Finished jobs are purged by a TTL index after JOB_RETENTION_DAYS.
+"""
+from datetime import timedelta
+from typing import List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from crud import async_databases
+from crud.codec import utcnow
+from crud.databases import jobs
+from modules.config import config
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+JOB_RETENTION_DAYS = 7
+MAX_BACKOFF_SECONDS = 600
+
+
+def job_document(kind: str, payload: dict) -> dict:
+    now = utcnow()
+    return {
+        "kind": kind,
+        "payload": payload,
+        "status": QUEUED,
+        "attempts": 0,
+        "max_attempts": config.job_max_attempts,
+        "run_after": now,
+        "lease_until": None,
+        "worker_id": None,
+        "result": None,
+        "error": "",
+        "created_at": now,
+    }
+
+
+def enqueue_job(kind: str, payload: dict) -> str:
+    return str(jobs.insert_one(job_document(kind, payload)).inserted_id)
+
+
+async def enqueue_job_async(kind: str, payload: dict) -> str:
+    return str((await async_databases.jobs.insert_one(job_document(kind, payload))).inserted_id)
+
+
+async def get_job_async(job_id: str) -> Optional[dict]:
+    try:
+        return await async_databases.jobs.find_one({"_id": ObjectId(job_id)})
+    except InvalidId:
+        return None
+
+
+# ==================== WORKER SIDE ====================
+def claim_job(worker_id: str, kinds: List[str]) -> Optional[dict]:
+    now = utcnow()
+    return jobs.find_one_and_update(
+        {
+            "kind": {"$in": kinds},
+            "$or": [
+                {"status": QUEUED, "run_after": {"$lte": now}},
+                {"status": RUNNING, "lease_until": {"$lt": now}},
+            ],
+        },
+        {
+            "$set": {
+                "status": RUNNING,
+                "worker_id": worker_id,
+                "started_at": now,
+                "lease_until": now + timedelta(seconds=config.job_lease_seconds),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def heartbeat(job: dict) -> bool:
+    """Extend the lease; False once another worker has taken the job over"""
+    result = jobs.update_one(
+        {"_id": job["_id"], "worker_id": job["worker_id"], "status": RUNNING},
+        {"$set": {"lease_until": utcnow() + timedelta(seconds=config.job_lease_seconds)}},
+    )
+    return result.matched_count == 1
+
+
+def _finish(job: dict, update: dict) -> None:
+    # Guarded on the lease holder, a worker that lost the job must not overwrite its state
+    jobs.update_one(
+        {"_id": job["_id"], "worker_id": job["worker_id"], "status": RUNNING},
+        {"$set": {**update, "lease_until": None}},
+    )
+
+
+def complete_job(job: dict, result: Optional[dict]) -> None:
+    now = utcnow()
+    _finish(job, {
+        "status": DONE,
+        "result": result,
+        "finished_at": now,
+        "purge_at": now + timedelta(days=JOB_RETENTION_DAYS),
+    })
+
+
+def fail_job(job: dict, error: str) -> None:
+    now = utcnow()
+    if job["attempts"] >= job.get("max_attempts", config.job_max_attempts):
+        _finish(job, {"status": DEAD, "error": error, "finished_at": now})
+        return
+    backoff = min(config.job_retry_base_seconds * 2 ** (job["attempts"] - 1), MAX_BACKOFF_SECONDS)
+    _finish(job, {"status": QUEUED, "error": error, "run_after": now + timedelta(seconds=backoff)})
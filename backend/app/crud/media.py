@@ -0,0 +1,136 @@
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Dict, Optional
+from bson import ObjectId
+from crud.databases import db, fs, media_index
+from crud import async_databases
+
+
+class MediaKind(str, Enum):
+    model = "model"
+    preview = "preview"
+    product_image = "product_image"
+    content = "content"
+    profile_picture = "profile_picture"
+
+
+def media_document(
+    logical_id: str,
+    blob_id: ObjectId,
+    kind: MediaKind,
+    content_type: Optional[str] = None,
+    length: int = 0,
+    filename: str = "",
+    owner_id: str = "",
+    order_id: str = "",
+) -> dict:
+    return {
+        "logical_id": logical_id,
+        "blob_id": blob_id,
+        "kind": kind.value,
+        "content_type": content_type or "application/octet-stream",
+        "length": length,
+        "filename": filename,
+        "owner_id": owner_id,
+        "order_id": order_id,
+    }
+
+
+def _register_update(entry: dict, variants: Optional[Dict[str, str]] = None) -> dict:
+    update = {
+        "$set": dict(entry),
+        "$setOnInsert": {"created_at": datetime.utcnow()},
+    }
+    for name, logical_id in (variants or {}).items():
+        update["$set"][f"variants.{name}"] = logical_id
+    return update
+
+
+def register_media(entry: dict, variants: Optional[Dict[str, str]] = None) -> None:
+    """Insert or refresh the index entry of a logical file"""
+    media_index.update_one(
+        {"logical_id": entry["logical_id"]}, _register_update(entry, variants), upsert=True
+    )
+
+
+def add_media_variant(logical_id: str, name: str, variant_logical_id: str) -> None:
+    media_index.update_one(
+        {"logical_id": logical_id},
+        {"$set": {f"variants.{name}": variant_logical_id}},
+    )
+
+
+GRIDFS_FILES = "fs.files"
+_LEGACY_PROJECTION = {"contentType": 1, "length": 1, "filename": 1, "metadata": 1}
+
+
+def _legacy_entry(logical_id: str, file_doc: Optional[dict]) -> Optional[dict]:
+    """Index entry for a blob stored before the media index, whose logical id is its GridFS _id"""
+    if not file_doc:
+        return None
+    metadata = file_doc.get("metadata") or {}
+    return media_document(
+        logical_id,
+        file_doc["_id"],
+        MediaKind.content,
+        content_type=file_doc.get("contentType") or metadata.get("contentType"),
+        length=file_doc.get("length", 0),
+        filename=file_doc.get("filename", ""),
+    )
+
+
+def resolve_media(logical_id: str) -> Optional[dict]:
+    if not logical_id:
+        return None
+    entry = media_index.find_one({"logical_id": logical_id})
+    if entry is None and ObjectId.is_valid(logical_id):
+        entry = _legacy_entry(logical_id, db[GRIDFS_FILES].find_one({"_id": ObjectId(logical_id)}, _LEGACY_PROJECTION))
+    return entry
+
+
+def open_media(entry: dict):
+    """Open the GridFS blob behind an index entry, iterating it yields the stored chunks"""
+    return fs.get(entry["blob_id"])
+
+
+def remove_media(logical_id: str, delete_blob: bool = True) -> None:
+    entry = media_index.find_one_and_delete({"logical_id": logical_id})
+    if not delete_blob:
+        return
+    if entry:
+        fs.delete(entry["blob_id"])
+    elif logical_id and ObjectId.is_valid(logical_id):
+        # Not indexed (stored before the media index), the logical id is the blob id
+        fs.delete(ObjectId(logical_id))
+
+
+# ==================== ASYNC VARIANTS ====================
+async def register_media_async(entry: dict, variants: Optional[Dict[str, str]] = None) -> None:
+    await async_databases.media_index.update_one(
+        {"logical_id": entry["logical_id"]}, _register_update(entry, variants), upsert=True
+    )
+
+
+async def resolve_media_async(logical_id: str) -> Optional[dict]:
+    if not logical_id:
+        return None
+    entry = await async_databases.media_index.find_one({"logical_id": logical_id})
+    if entry is None and ObjectId.is_valid(logical_id):
+        file_doc = await async_databases.db[GRIDFS_FILES].find_one({"_id": ObjectId(logical_id)}, _LEGACY_PROJECTION)
+        entry = _legacy_entry(logical_id, file_doc)
+    return entry
+
+
+async def iter_grid_out_async(grid_out) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        yield chunk
+
+
+async def stream_media_async(entry: dict) -> AsyncIterator[bytes]:
+    """Yield the GridFS chunks behind an index entry without buffering the whole file"""
+    grid_out = await async_databases.fs.open_download_stream(entry["blob_id"])
+    async for chunk in iter_grid_out_async(grid_out):
+        yield chunk
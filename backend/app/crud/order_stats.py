@@ -0,0 +1,159 @@
+"""
+Daily order rollups in order_stats_daily, one document per (day, manufacturer, material, order_type).
+
+Transitions $inc the counters of the day they happen on, so analytics read O(days) documents.
+rebuild_order_stats() recomputes the whole collection from orders and orders_archive, with the
+same bucketing.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from crud import async_databases
+from crud.codec import as_datetime, utcnow
+from crud.databases import db, order_stats_daily, orders, orders_archive
+from crud.indexes import INDEXES
+
+STATS_COLLECTION = "order_stats_daily"
+
+COUNTER_FIELDS = [
+    "created",
+    "assigned",
+    "started",
+    "produced",
+    "completed",
+    "cancelled",
+    "estimated_weight",
+    "estimated_revenue",
+    "revenue",
+    "filament_used",
+]
+
+
+def day_of(when: datetime) -> datetime:
+    return datetime(when.year, when.month, when.day)
+
+
+def stats_key(order: dict, when: datetime) -> dict:
+    detail = order.get("order_detail") or {}
+    return {
+        "day": day_of(when),
+        "manufacturer_id": order.get("manufacturer_id") or "",
+        "material": detail.get("material") or "",
+        "order_type": order.get("order_type") or "",
+    }
+
+
+# ==================== COUNTERS PER TRANSITION ====================
+def created_counters(order: dict) -> Dict[str, float]:
+    estimations = order.get("estimations") or {}
+    return {
+        "created": 1,
+        "estimated_weight": estimations.get("estimated_weight") or 0.0,
+        "estimated_revenue": estimations.get("estimated_cost") or 0.0,
+    }
+
+
+def completed_counters(order: dict, sign: int = 1) -> Dict[str, float]:
+    return {
+        "completed": sign,
+        "revenue": sign * (order.get("final_price") or 0.0),
+        "filament_used": sign * (order.get("actual_filament_usage") or 0.0),
+    }
+
+
+async def record_order_stats(order: dict, counters: Dict[str, float], when: Optional[datetime] = None) -> None:
+    """$inc the bucket of the order on the day of the transition; never fails the transition itself"""
+    try:
+        await async_databases.order_stats_daily.update_one(
+            stats_key(order, when or utcnow()),
+            {"$inc": counters},
+            upsert=True,
+        )
+    except Exception as e:
+        logging.error(f"Failed to record order stats for {order.get('order_id', 'unknown')}: {str(e)}")
+
+
+# ==================== REBUILD ====================
+def _timestamp(order: dict, key: str) -> Optional[datetime]:
+    entry = (order.get("order_timing_table") or {}).get(key) or {}
+    return as_datetime(entry.get("timestamp"))
+
+
+def order_contributions(order: dict):
+    """(bucket key, counters) of every transition an order went through, mirroring the live updates"""
+    received = _timestamp(order, "order_received")
+    if received:
+        # Orders are created before any manufacturer adopts them
+        yield stats_key({**order, "manufacturer_id": ""}, received), created_counters(order)
+    for key, counter in (
+        ("assigned_to_manufacturer", "assigned"),
+        ("started_manufacturing", "started"),
+        ("produced", "produced"),
+    ):
+        when = _timestamp(order, key)
+        if when:
+            yield stats_key(order, when), {counter: 1}
+    ready = _timestamp(order, "ready_to_take")
+    if ready:
+        yield stats_key(order, ready), completed_counters(order)
+    if order.get("is_cancelled") and isinstance(order.get("last_updated"), datetime):
+        yield stats_key(order, order["last_updated"]), {"cancelled": 1}
+
+
+def rebuild_order_stats() -> int:
+    """
+    Recompute every bucket from orders and orders_archive into a scratch collection, then swap it in.
+    Transitions that $inc the live collection while this runs are lost by the swap, so run it with
+    the API and workers stopped.
+    """
+    buckets: Dict[Tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    projection = {
+        "order_id": 1, "manufacturer_id": 1, "order_type": 1, "order_detail.material": 1,
+        "estimations": 1, "final_price": 1, "actual_filament_usage": 1,
+        "order_timing_table": 1, "is_cancelled": 1, "last_updated": 1,
+    }
+
+    seen = set()
+    for collection in (orders, orders_archive):
+        for order in collection.find({}, projection).batch_size(1000):
+            # An archival interrupted between copy and delete leaves the order in both
+            if order["_id"] in seen:
+                continue
+            seen.add(order["_id"])
+            for key, counters in order_contributions(order):
+                bucket = buckets[(key["day"], key["manufacturer_id"], key["material"], key["order_type"])]
+                for field, value in counters.items():
+                    bucket[field] += value
+
+    scratch = db[f"{STATS_COLLECTION}_rebuild"]
+    scratch.drop()
+    documents = [
+        {"day": day, "manufacturer_id": manufacturer_id, "material": material, "order_type": order_type, **counters}
+        for (day, manufacturer_id, material, order_type), counters in buckets.items()
+    ]
+    if not documents:
+        order_stats_daily.delete_many({})
+        return 0
+
+    scratch.insert_many(documents)
+    scratch.rename(STATS_COLLECTION, dropTarget=True)
+    # The swapped-in collection carries no indexes yet
+    order_stats_daily.create_indexes(INDEXES[STATS_COLLECTION])
+    return len(documents)
+
+
+# ==================== READS ====================
+def stats_match(start: datetime, end: datetime, **filters) -> dict:
+    match = {"day": {"$gte": day_of(start), "$lte": day_of(end)}}
+    match.update({field: value for field, value in filters.items() if value is not None})
+    return match
+
+
+def stats_pipeline(match: dict, group_by: str) -> list:
+    """Sum every counter of the matching buckets, grouped by one of the bucket key fields"""
+    return [
+        {"$match": match},
+        {"$group": {"_id": f"${group_by}", **{field: {"$sum": f"${field}"} for field in COUNTER_FIELDS}}},
+        {"$sort": {"_id": 1}},
+    ]
@@ -0,0 +1,178 @@
+"""
+E-mail outbox.
+
+Requests only insert a message into the outbox collection. The dispatcher running in every API
+worker claims due messages one at a time with find_one_and_update, right before sending each (so a
+lease only has to outlive one send), sends them over one persistent SMTP connection and retries
+failures with exponential backoff. A message claimed by a worker that died is picked up again
+once its lease expires; outcomes are only recorded by the current lease holder. Messages with an
+expires_at (password reset links) are failed rather than sent or retried past it.
+Sent messages are purged by a TTL index after OUTBOX_RETENTION_DAYS.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+from uuid import uuid4
+from pymongo import ReturnDocument
+from crud import async_databases
+from crud.codec import utcnow
+from crud.databases import outbox
+from modules.config import config
+from modules.mailer import Mailer
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+LEASE_SECONDS = 120
+OUTBOX_RETENTION_DAYS = 7
+MAX_BACKOFF_SECONDS = 3600
+IDLE_DISCONNECT_SECONDS = 60
+
+
+def email_document(
+    receivers: List[str], subject: str, html: str, kind: str, expires_in: Optional[timedelta] = None
+) -> dict:
+    now = utcnow()
+    return {
+        "receivers": receivers,
+        "subject": subject,
+        "html": html,
+        "kind": kind,
+        "status": PENDING,
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now,
+        # Messages carrying a short-lived link are pointless once it has expired
+        "expires_at": now + expires_in if expires_in else None,
+        "locked_until": None,
+        "lease_id": None,
+        "last_error": "",
+    }
+
+
+def enqueue_email(
+    receivers: List[str], subject: str, html: str, kind: str = "", expires_in: Optional[timedelta] = None
+) -> None:
+    outbox.insert_one(email_document(receivers, subject, html, kind, expires_in))
+
+
+async def enqueue_email_async(
+    receivers: List[str], subject: str, html: str, kind: str = "", expires_in: Optional[timedelta] = None
+) -> None:
+    await async_databases.outbox.insert_one(email_document(receivers, subject, html, kind, expires_in))
+
+
+# ==================== DISPATCHER ====================
+async def claim_message() -> Optional[dict]:
+    """Claim one due message, right before sending it; the lease covers a single send"""
+    now = utcnow()
+    return await async_databases.outbox.find_one_and_update(
+        {
+            "$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": SENDING, "locked_until": {"$lt": now}},
+            ]
+        },
+        {
+            "$set": {
+                "status": SENDING,
+                "locked_until": now + timedelta(seconds=LEASE_SECONDS),
+                "lease_id": str(uuid4()),
+            }
+        },
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(config.email_retry_base_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+
+def is_expired(message: dict, when: datetime) -> bool:
+    return bool(message.get("expires_at")) and message["expires_at"] <= when
+
+
+def result_update(message: dict, error: Optional[Exception], now: datetime) -> dict:
+    if error is None:
+        return {
+            "status": SENT,
+            "sent_at": now,
+            "purge_at": now + timedelta(days=OUTBOX_RETENTION_DAYS),
+            "locked_until": None,
+        }
+
+    attempts = message.get("attempts", 0) + 1
+    next_attempt_at = now + timedelta(seconds=backoff_seconds(attempts))
+    # No retry past the expiry of the message either
+    gave_up = attempts >= config.email_max_attempts or is_expired(message, next_attempt_at)
+    if gave_up:
+        logging.error(f"Giving up on e-mail {message['_id']} after {attempts} attempts: {str(error)}")
+    return {
+        "status": FAILED if gave_up else PENDING,
+        "attempts": attempts,
+        "last_error": str(error),
+        "next_attempt_at": next_attempt_at,
+        "locked_until": None,
+    }
+
+
+async def _record(message: dict, update: dict) -> None:
+    # Guarded on the lease: a worker whose lease ran out must not overwrite the new holder's outcome
+    await async_databases.outbox.update_one(
+        {"_id": message["_id"], "lease_id": message["lease_id"]}, {"$set": update}
+    )
+
+
+def _send(mailer: Mailer, message: dict) -> Optional[Exception]:
+    try:
+        mailer.send(message["receivers"], message["subject"], message["html"])
+        return None
+    except Exception as e:
+        mailer.close()
+        return e
+
+
+async def dispatch_batch(mailer: Mailer) -> int:
+    """Send up to email_batch_size due messages over the open connection, returns how many were claimed"""
+    claimed = 0
+    while claimed < config.email_batch_size:
+        message = await claim_message()
+        if message is None:
+            break
+        claimed += 1
+
+        if is_expired(message, utcnow()):
+            await _record(message, {"status": FAILED, "last_error": "Expired before it could be sent", "locked_until": None})
+            continue
+
+        # smtplib blocks, the send runs off the event loop
+        error = await asyncio.to_thread(_send, mailer, message)
+        await _record(message, result_update(message, error, utcnow()))
+    return claimed
+
+
+async def outbox_dispatcher() -> None:
+    mailer = Mailer()
+    idle_since = None
+    try:
+        while True:
+            try:
+                if await dispatch_batch(mailer):
+                    idle_since = None
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"E-mail outbox dispatch failed: {str(e)}")
+
+            # Keep the connection across bursts, but not open forever while nothing is queued
+            idle_since = idle_since or utcnow()
+            if (utcnow() - idle_since).total_seconds() > IDLE_DISCONNECT_SECONDS:
+                await asyncio.to_thread(mailer.close)
+            await asyncio.sleep(config.email_poll_seconds)
+    finally:
+        mailer.close()
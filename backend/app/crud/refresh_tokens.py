@@ -0,0 +1,80 @@
+"""
+Rotating refresh tokens.
+
+Only the SHA-256 of a token is stored, as the document _id. Every refresh marks the presented
+token used and issues a new one in the same family. Presenting an already used token means it was
+copied, so the whole family is revoked, its access tokens included. Expired tokens are removed by the TTL index on expires_at.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+from typing import Iterable, Optional, Tuple
+from uuid import uuid4
+from starlette.concurrency import run_in_threadpool
+from crud import async_databases
+from crud.codec import utcnow
+from crud.databases import refresh_tokens, users
+from modules.config import config
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def issue_refresh_token(user_id: str, family_id: Optional[str] = None) -> Tuple[str, str]:
+    """(token, family id); a new family is started at login"""
+    token = secrets.token_urlsafe(32)
+    family_id = family_id or str(uuid4())
+    now = utcnow()
+    await async_databases.refresh_tokens.insert_one({
+        "_id": token_hash(token),
+        "family_id": family_id,
+        "user_id": user_id,
+        "created_at": now,
+        "expires_at": now + timedelta(days=config.refresh_token_expire_days),
+        "used_at": None,
+        "revoked": False,
+    })
+    return token, family_id
+
+
+async def consume_refresh_token(token: str) -> Optional[dict]:
+    """
+    Mark a valid token used and return its document, or None when it is unknown, expired or revoked.
+    A token that was already used revokes its family.
+    """
+    now = utcnow()
+    document = await async_databases.refresh_tokens.find_one_and_update(
+        {"_id": token_hash(token), "used_at": None, "revoked": False, "expires_at": {"$gt": now}},
+        {"$set": {"used_at": now}},
+    )
+    if document:
+        return document
+
+    stale = await async_databases.refresh_tokens.find_one({"_id": token_hash(token)}, {"family_id": 1, "used_at": 1})
+    if stale and stale.get("used_at"):
+        # modules.sessions imports this module
+        from modules.sessions import revoke_token_family
+
+        await revoke_family_async(stale["family_id"])
+        # Access tokens already issued to the family stop passing get_session on every worker
+        await run_in_threadpool(revoke_token_family, stale["family_id"])
+    return None
+
+
+async def revoke_family_async(family_id: str) -> None:
+    await async_databases.refresh_tokens.update_many({"family_id": family_id}, {"$set": {"revoked": True}})
+
+
+async def family_of(token: str) -> Optional[str]:
+    document = await async_databases.refresh_tokens.find_one({"_id": token_hash(token)}, {"family_id": 1})
+    return document["family_id"] if document else None
+
+
+def revoke_user_tokens(user_ids: Iterable[str]) -> None:
+    """Bump token_version, so issued access tokens stop validating, and revoke every refresh token"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    users.update_many({"id": {"$in": user_ids}}, {"$inc": {"token_version": 1}})
+    refresh_tokens.update_many({"user_id": {"$in": user_ids}}, {"$set": {"revoked": True}})
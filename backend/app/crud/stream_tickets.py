@@ -0,0 +1,35 @@
+"""
+Single-use tickets for the order event stream.
+
+EventSource cannot send an Authorization header, and an access token in the URL ends up in proxy
+and access logs. The client trades its access token for a ticket instead: it is valid for
+STREAM_TICKET_SECONDS and deleted when the stream opens, so a logged URL cannot be replayed.
+Only the SHA-256 of a ticket is stored; expired ones are removed by the TTL index on expires_at.
+"""
+import secrets
+from datetime import timedelta
+from typing import Optional
+from crud import async_databases
+from crud.codec import utcnow
+from crud.refresh_tokens import token_hash
+
+STREAM_TICKET_SECONDS = 30
+
+
+async def issue_stream_ticket(claims: dict) -> str:
+    """claims of the access token the ticket was bought with, checked again when it is redeemed"""
+    ticket = secrets.token_urlsafe(32)
+    await async_databases.stream_tickets.insert_one({
+        "_id": token_hash(ticket),
+        "claims": claims,
+        "expires_at": utcnow() + timedelta(seconds=STREAM_TICKET_SECONDS),
+    })
+    return ticket
+
+
+async def redeem_stream_ticket(ticket: str) -> Optional[dict]:
+    """The claims of a valid ticket, which is used up; None when unknown, expired or already used"""
+    document = await async_databases.stream_tickets.find_one_and_delete(
+        {"_id": token_hash(ticket), "expires_at": {"$gt": utcnow()}}
+    )
+    return document["claims"] if document else None
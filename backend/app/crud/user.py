@@ -1,4 +1,7 @@
-from crud.databases import users
+import re
+from typing import Dict, Iterable, List, Optional
+from crud.databases import users, deleted_users
+from crud import async_databases
 from models.user import User
 from bson import ObjectId
 
@@ -24,3 +27,72 @@ class UserAPI:
     def get(self) -> User:
         self.update_user()
         return self.user
+
+
+USER_DIRECTORY_PROJECTION = {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "email": 1}
+
+
+def _directory_ids(user_ids: Iterable[str]) -> List[str]:
+    return list({user_id for user_id in user_ids if user_id})
+
+
+def full_name(user_doc: Optional[dict], default: str = "Unknown") -> str:
+    if not user_doc:
+        return default
+    name = f"{user_doc.get('first_name', '')} {user_doc.get('last_name', '')}".strip()
+    return name or default
+
+
+def get_user_directory(
+    user_ids: Iterable[str], include_deleted: bool = False
+) -> Dict[str, dict]:
+    """Fetch the listed users in one $in query instead of one find_one per row"""
+    ids = _directory_ids(user_ids)
+    if not ids:
+        return {}
+
+    directory = {
+        doc["id"]: doc
+        for doc in users.find({"id": {"$in": ids}}, USER_DIRECTORY_PROJECTION)
+    }
+    missing = [user_id for user_id in ids if user_id not in directory]
+    if include_deleted and missing:
+        for doc in deleted_users.find({"id": {"$in": missing}}, USER_DIRECTORY_PROJECTION):
+            directory.setdefault(doc["id"], doc)
+    return directory
+
+
+async def get_user_directory_async(user_ids: Iterable[str]) -> Dict[str, dict]:
+    ids = _directory_ids(user_ids)
+    if not ids:
+        return {}
+
+    cursor = async_databases.users.find({"id": {"$in": ids}}, USER_DIRECTORY_PROJECTION)
+    return {doc["id"]: doc async for doc in cursor}
+
+
+async def get_manufacturer_directory_async(user_ids: Iterable[str]) -> Dict[str, dict]:
+    """manufacturer_data documents of the listed manufacturers, keyed by user_id"""
+    ids = _directory_ids(user_ids)
+    if not ids:
+        return {}
+
+    cursor = async_databases.manufacturer_data.find({"user_id": {"$in": ids}}, {"_id": 0})
+    return {doc["user_id"]: doc async for doc in cursor}
+
+
+async def find_user_ids_by_name_async(name: str, limit: int = 200) -> List[str]:
+    """ids of users whose first or last name starts with every word of name, case-insensitive"""
+    terms = [re.escape(term) for term in name.split() if term]
+    if not terms:
+        return []
+
+    query = {"$and": [
+        {"$or": [
+            {"first_name": {"$regex": f"^{term}", "$options": "i"}},
+            {"last_name": {"$regex": f"^{term}", "$options": "i"}},
+        ]}
+        for term in terms
+    ]}
+    cursor = async_databases.users.find(query, {"_id": 0, "id": 1}).limit(limit)
+    return [doc["id"] async for doc in cursor]
@@ -0,0 +1,22 @@
+"""
+Backfill customer_stats from the orders and orders_archive collections.
+
+Stop the API first: the merge replaces counters, finalizes and cancels recorded meanwhile may be lost.
+
+Run from backend/app:
+    python -m migrations.backfill_customer_stats
+"""
+from crud.customer_stats import customer_stats_pipeline
+from crud.databases import customer_stats, orders
+from crud.indexes import INDEXES
+
+
+def run() -> int:
+    # $merge on user_id needs the unique index to exist first
+    customer_stats.create_indexes(INDEXES["customer_stats"])
+    orders.aggregate(customer_stats_pipeline())
+    return customer_stats.count_documents({})
+
+
+if __name__ == "__main__":
+    print(f"customer_stats holds {run()} customers")
@@ -0,0 +1,96 @@
+"""
+Backfill media_index from the files already stored in GridFS.
+
+Run from backend/app:
+    python -m migrations.backfill_media_index
+"""
+from datetime import datetime
+from pymongo import UpdateOne
+from crud.databases import db, files_db, media_index, users
+from crud.media import MediaKind, media_document
+
+BATCH_SIZE = 500
+MODEL_EXTENSIONS = (".stl", ".obj", ".3mf")
+
+
+def classify(grid_file: dict, content_ids: set, profile_picture_ids: set) -> tuple:
+    """Return (logical_id, kind) of a fs.files document"""
+    blob_id = str(grid_file["_id"])
+    metadata = grid_file.get("metadata") or {}
+    filename = (grid_file.get("filename") or "").lower()
+
+    if metadata.get("type") == "preview":
+        return blob_id, MediaKind.preview
+    if metadata.get("file_id"):
+        return metadata["file_id"], MediaKind.product_image
+    if blob_id in content_ids:
+        return blob_id, MediaKind.content
+    if blob_id in profile_picture_ids:
+        return blob_id, MediaKind.profile_picture
+    if filename.endswith(MODEL_EXTENSIONS):
+        return blob_id, MediaKind.model
+    return blob_id, MediaKind.content
+
+
+def build_operations(grid_file: dict, content_ids: set, profile_picture_ids: set) -> list:
+    logical_id, kind = classify(grid_file, content_ids, profile_picture_ids)
+    metadata = grid_file.get("metadata") or {}
+
+    entry = media_document(
+        logical_id,
+        grid_file["_id"],
+        kind,
+        content_type=grid_file.get("contentType"),
+        length=grid_file.get("length", 0),
+        filename=grid_file.get("filename", ""),
+        owner_id=grid_file.get("user_id") or metadata.get("uploaded_by", ""),
+        order_id=metadata.get("order_id", ""),
+    )
+    operations = [
+        UpdateOne(
+            {"logical_id": logical_id},
+            {
+                "$set": entry,
+                "$setOnInsert": {"created_at": grid_file.get("uploadDate", datetime.utcnow())},
+            },
+            upsert=True,
+        )
+    ]
+
+    if kind == MediaKind.preview and metadata.get("original_file_id"):
+        operations.append(
+            UpdateOne(
+                {"logical_id": metadata["original_file_id"]},
+                {"$set": {"variants.preview": logical_id}},
+            )
+        )
+    return operations
+
+
+def run(batch_size: int = BATCH_SIZE) -> int:
+    content_ids = {doc["id"] for doc in files_db.find({}, {"id": 1}) if doc.get("id")}
+    profile_picture_ids = {
+        doc["pp"] for doc in users.find({"pp": {"$nin": ["", None]}}, {"pp": 1})
+    }
+
+    projection = {"filename": 1, "contentType": 1, "length": 1, "uploadDate": 1, "user_id": 1, "metadata": 1}
+    operations, processed = [], 0
+
+    # Previews go last so their variant updates land on already indexed models
+    for query in ({"metadata.type": {"$ne": "preview"}}, {"metadata.type": "preview"}):
+        for grid_file in db["fs.files"].find(query, projection).batch_size(batch_size):
+            operations.extend(build_operations(grid_file, content_ids, profile_picture_ids))
+            processed += 1
+            if len(operations) >= batch_size:
+                media_index.bulk_write(operations, ordered=True)
+                operations = []
+
+        if operations:
+            media_index.bulk_write(operations, ordered=True)
+            operations = []
+
+    return processed
+
+
+if __name__ == "__main__":
+    print(f"media_index backfilled from {run()} GridFS files")
@@ -0,0 +1,63 @@
+"""
+Backfill the denormalized status, current_step and last_updated fields of orders.
+
+Run from backend/app:
+    python -m migrations.backfill_order_status
+"""
+from datetime import datetime
+from pymongo import UpdateOne
+from crud.codec import as_datetime, utcnow
+from crud.databases import orders
+from routes.order.status import ORDER_STEPS, derive_status
+
+BATCH_SIZE = 500
+
+
+def last_updated_of(order: dict) -> datetime:
+    """Existing last_updated if it parses, otherwise the latest timing table timestamp"""
+    last_updated = as_datetime(order.get("last_updated"))
+    if last_updated:
+        return last_updated
+
+    timing_table = order.get("order_timing_table") or {}
+    timestamps = [
+        as_datetime((timing_table.get(key) or {}).get("timestamp"))
+        for key, _ in ORDER_STEPS
+    ]
+    timestamps = [ts for ts in timestamps if ts]
+    return max(timestamps) if timestamps else utcnow()
+
+
+def build_operation(order: dict) -> UpdateOne:
+    status, current_step = derive_status(order)
+    return UpdateOne(
+        {"_id": order["_id"]},
+        {"$set": {
+            "status": status.value,
+            "current_step": current_step,
+            "last_updated": last_updated_of(order),
+        }},
+    )
+
+
+def run(batch_size: int = BATCH_SIZE) -> int:
+    # Orders without a status, or with the old string last_updated written by assign_order
+    query = {"$or": [{"status": {"$exists": False}}, {"last_updated": {"$type": "string"}}]}
+    projection = {"order_timing_table": 1, "is_cancelled": 1, "last_updated": 1}
+    operations, processed = [], 0
+
+    for order in orders.find(query, projection).batch_size(batch_size):
+        operations.append(build_operation(order))
+        processed += 1
+        if len(operations) >= batch_size:
+            orders.bulk_write(operations, ordered=False)
+            operations = []
+
+    if operations:
+        orders.bulk_write(operations, ordered=False)
+
+    return processed
+
+
+if __name__ == "__main__":
+    print(f"status backfilled on {run()} orders")
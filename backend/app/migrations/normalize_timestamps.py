@@ -0,0 +1,139 @@
+"""
+Convert the string timestamps of orders to BSON dates.
+
+Orders are walked in _id order and the last processed _id is checkpointed in the
+migrations collection after every batch, so an interrupted run continues where it stopped.
+
+Legacy strings were written with datetime.now(), the local time of the API server without an
+offset. They are read in the local zone of the machine running the migration, with its DST rules
+for each date. When that is not the zone of the server that wrote them (containers usually run in
+UTC), pass the offset explicitly. Strings carrying an offset and extended JSON dates are already
+unambiguous and converted as is.
+
+Run from backend/app:
+    python -m migrations.normalize_timestamps                      # resume from the checkpoint
+    python -m migrations.normalize_timestamps --restart            # ignore the checkpoint
+    python -m migrations.normalize_timestamps --utc-offset +03:00  # strings were written in UTC+3
+"""
+import argparse
+from datetime import datetime, tzinfo
+from typing import List, Optional
+from pymongo import ASCENDING, UpdateOne
+from crud.codec import as_datetime, utcnow
+from crud.databases import db, orders
+from routes.order.status import ORDER_STEPS
+
+MIGRATION_ID = "normalize_timestamps"
+BATCH_SIZE = 500
+
+migrations = db["migrations"]
+
+TIMESTAMP_FIELDS = [f"order_timing_table.{key}.timestamp" for key, _ in ORDER_STEPS] + [
+    "last_updated",
+    "product_image_uploaded_at",
+]
+
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def parse_offset(value: str) -> tzinfo:
+    """'+03:00' / '-0530' to a fixed offset zone"""
+    try:
+        return datetime.strptime(value, "%z").tzinfo
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid UTC offset: {value!r}, expected e.g. +03:00")
+
+
+def to_utc(value, zone: Optional[tzinfo] = None) -> Optional[datetime]:
+    """Naive UTC of a legacy timestamp; strings without an offset are local time of zone (or this machine)"""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None and parsed.tzinfo is None:
+            # astimezone() on a naive datetime assumes the local zone of this machine
+            return as_datetime(parsed.replace(tzinfo=zone) if zone else parsed.astimezone())
+    return as_datetime(value)
+
+
+def build_operation(order: dict, zone: Optional[tzinfo] = None) -> Optional[UpdateOne]:
+    """$set of every timestamp still stored as a string, None if the order is already clean"""
+    update = {}
+    for field in TIMESTAMP_FIELDS:
+        value = _get(order, field)
+        if isinstance(value, (str, dict)):
+            converted = to_utc(value, zone)
+            if converted:
+                update[field] = converted
+    if not update:
+        return None
+    return UpdateOne({"_id": order["_id"]}, {"$set": update})
+
+
+def _checkpoint(last_id, processed: int, converted: int, done: bool = False) -> None:
+    migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {
+            "$set": {"last_id": last_id, "done": done, "updated_at": utcnow()},
+            "$inc": {"processed": processed, "converted": converted},
+        },
+        upsert=True,
+    )
+
+
+def _flush(operations: List[UpdateOne]) -> int:
+    if not operations:
+        return 0
+    return orders.bulk_write(operations, ordered=False).modified_count
+
+
+def run(batch_size: int = BATCH_SIZE, restart: bool = False, zone: Optional[tzinfo] = None) -> dict:
+    if restart:
+        migrations.delete_one({"_id": MIGRATION_ID})
+
+    state = migrations.find_one({"_id": MIGRATION_ID}) or {}
+    query = {"_id": {"$gt": state["last_id"]}} if state.get("last_id") else {}
+    projection = {field: 1 for field in TIMESTAMP_FIELDS}
+
+    operations, processed, last_id = [], 0, state.get("last_id")
+    for order in orders.find(query, projection).sort("_id", ASCENDING).batch_size(batch_size):
+        operation = build_operation(order, zone)
+        if operation:
+            operations.append(operation)
+        processed += 1
+        last_id = order["_id"]
+
+        if processed % batch_size == 0:
+            _checkpoint(last_id, batch_size, _flush(operations))
+            operations = []
+
+    _checkpoint(last_id, processed % batch_size, _flush(operations), done=True)
+    return migrations.find_one({"_id": MIGRATION_ID})
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert order timestamps to BSON dates")
+    parser.add_argument("--restart", action="store_true", help="start over instead of resuming")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--utc-offset",
+        type=parse_offset,
+        default=None,
+        help="offset of the server that wrote the strings without one (default: local zone of this machine)",
+    )
+    args = parser.parse_args(argv)
+
+    state = run(batch_size=args.batch_size, restart=args.restart, zone=args.utc_offset)
+    print(f"{state.get('processed', 0)} orders checked, {state.get('converted', 0)} converted")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,12 @@
+"""
+Recompute order_stats_daily from the orders and orders_archive collections.
+
+Needs the BSON date timestamps written by migrations.normalize_timestamps. Stop the API and the
+workers first: counters they $inc during the rebuild are lost when the result is swapped in.
+Run from backend/app:
+    python -m migrations.rebuild_order_stats
+"""
+from crud.order_stats import rebuild_order_stats
+
+if __name__ == "__main__":
+    print(f"order_stats_daily rebuilt with {rebuild_order_stats()} buckets")
@@ -40,6 +40,8 @@ class User(BaseModel):
     username: str
     pp: Optional[str] = ""
     role: UserRoles = UserRoles.user
+    # Bumped to revoke every token issued to the user
+    token_version: int = 0
 
 
 class UserRegister(BaseModel):
@@ -1,9 +1,48 @@
+from typing import List
 from pydantic import BaseModel
 
 
 class Config(BaseModel):
     version: str
     secret_key: str
+    # orders finished longer ago than this move to orders_archive
+    archive_after_days: int = 90
+    archive_interval_minutes: int = 60
+    archive_batch_size: int = 500
+    # seconds a validated session is served from the per-worker cache
+    session_cache_ttl: int = 30
+    session_cache_size: int = 10000
+    # broadcast session invalidations to the other API workers through a capped collection
+    session_invalidation_channel: bool = True
+    # bcrypt cost; stored hashes with another cost are rehashed on the next login
+    bcrypt_rounds: int = 12
+    # threads hashing/verifying passwords for requests, 0 uses one per CPU
+    password_hash_workers: int = 0
+    # hash requests waiting beyond this are refused with 503
+    password_hash_queue: int = 64
+    # access tokens are short-lived and renewed with rotating refresh tokens
+    access_token_expire_minutes: int = 15
+    refresh_token_expire_days: int = 14
+    # "memory" counts per API worker, "mongo" shares the counters between workers
+    rate_limit_storage: str = "memory"
+    # take the client address from X-Forwarded-For, only behind a proxy that sets it
+    rate_limit_trust_forwarded: bool = False
+    # see modules/rate_limit.py RateLimitRule
+    rate_limits: List[dict] = []
+    # e-mail outbox dispatcher
+    email_poll_seconds: float = 2
+    email_batch_size: int = 20
+    email_retry_base_seconds: int = 30
+    email_max_attempts: int = 8
+    # render previews on the geometry worker (worker.py) instead of inside the upload request
+    geometry_worker: bool = False
+    worker_processes: int = 2
+    # a worker process is replaced after this many jobs
+    worker_max_jobs: int = 50
+    job_lease_seconds: int = 60
+    job_max_attempts: int = 3
+    job_retry_base_seconds: int = 10
+    job_poll_seconds: float = 1
 
 
 class Message(BaseModel):
@@ -0,0 +1,155 @@
+"""
+Order event feed.
+
+Transitions publish OrderEvents to an in-process broker that fans them out to the open
+event streams. When MongoDB runs as a replica set the events come from a change stream on
+orders instead, so every API worker sees the transitions made by every other worker; local
+publishing is then switched off to avoid sending each event twice.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Optional, Set
+from pydantic import BaseModel
+from crud import async_databases
+from crud.codec import utcnow
+
+SUBSCRIBER_QUEUE_SIZE = 100
+WATCH_RETRY_SECONDS = 5
+
+
+class OrderEventType(str, Enum):
+    created = "created"
+    assigned = "assigned"
+    rejected = "rejected"
+    status_changed = "status_changed"
+    cancelled = "cancelled"
+    # Sent to the other manufacturers when an order is adopted, carries only the order_id
+    left_pool = "left_pool"
+
+
+class OrderEvent(BaseModel):
+    type: OrderEventType
+    order_id: str
+    user_id: str = ""
+    manufacturer_id: str = ""
+    status: Optional[str] = None
+    current_step: Optional[int] = None
+    rejected_by: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+    @classmethod
+    def from_order(cls, type: OrderEventType, order: dict, **extra) -> "OrderEvent":
+        return cls(
+            type=type,
+            order_id=order.get("order_id", ""),
+            user_id=order.get("user_id", ""),
+            manufacturer_id=order.get("manufacturer_id") or "",
+            status=order.get("status"),
+            current_step=order.get("current_step"),
+            timestamp=order.get("last_updated") or utcnow(),
+            **extra,
+        )
+
+
+class Subscription:
+    def __init__(self, view: Callable[[OrderEvent], Optional[OrderEvent]]):
+        # The event as this subscriber may see it, None to skip it
+        self.view = view
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Set when events were dropped because the client is not reading, it should refetch its lists
+        self.overflowed = False
+
+
+class EventBroker:
+    def __init__(self):
+        self._subscriptions: Set[Subscription] = set()
+        self.change_streams = False
+
+    def subscribe(self, view: Callable[[OrderEvent], Optional[OrderEvent]]) -> Subscription:
+        subscription = Subscription(view)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def publish(self, event: OrderEvent) -> None:
+        for subscription in list(self._subscriptions):
+            visible = subscription.view(event)
+            if visible is None:
+                continue
+            try:
+                subscription.queue.put_nowait(visible)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+
+broker = EventBroker()
+
+
+def publish_order_event(type: OrderEventType, order: dict, **extra) -> None:
+    """Called by the transitions; a no-op while the change stream is the event source"""
+    if broker.change_streams:
+        return
+    broker.publish(OrderEvent.from_order(type, order, **extra))
+
+
+# ==================== CHANGE STREAM ====================
+def events_from_change(change: dict) -> list:
+    order = change.get("fullDocument")
+    if not order:
+        return []
+
+    if change["operationType"] == "insert":
+        return [OrderEvent.from_order(OrderEventType.created, order)]
+    if change["operationType"] not in ("update", "replace"):
+        return []
+
+    fields = (change.get("updateDescription") or {}).get("updatedFields") or {}
+    if "is_cancelled" in fields:
+        return [OrderEvent.from_order(OrderEventType.cancelled, order)]
+    if "manufacturer_id" in fields:
+        return [OrderEvent.from_order(OrderEventType.assigned, order)]
+    if any(field.startswith("rejected_manufacturers") for field in fields):
+        rejected = order.get("rejected_manufacturers") or []
+        return [OrderEvent.from_order(OrderEventType.rejected, order, rejected_by=rejected[-1] if rejected else None)]
+    if "status" in fields:
+        return [OrderEvent.from_order(OrderEventType.status_changed, order)]
+    return []
+
+
+async def _watch_orders() -> None:
+    resume_token = None
+    while True:
+        try:
+            async with async_databases.orders.watch(
+                [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+                full_document="updateLookup",
+                resume_after=resume_token,
+            ) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    for event in events_from_change(change):
+                        broker.publish(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Order change stream interrupted: {str(e)}")
+            await asyncio.sleep(WATCH_RETRY_SECONDS)
+
+
+async def start_event_source() -> Optional[asyncio.Task]:
+    """Use a change stream when the deployment supports one, otherwise keep local publishing"""
+    try:
+        hello = await async_databases.client.admin.command("hello")
+    except Exception as e:
+        logging.error(f"Could not detect the MongoDB topology, using local order events: {str(e)}")
+        return None
+
+    if not hello.get("setName"):
+        return None
+
+    broker.change_streams = True
+    return asyncio.create_task(_watch_orders())
@@ -0,0 +1,69 @@
+"""
+Incremental serializers for streaming exports.
+
+Rows are produced one document at a time from a server-side cursor and flushed in
+chunks of about FLUSH_BYTES, optionally gzip compressed, so memory stays constant
+however many documents are exported.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List
+from bson import json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from modules.pagination import field_value
+
+FLUSH_BYTES = 64 * 1024
+
+
+def ndjson_rows(documents: Iterable[dict]) -> Iterator[str]:
+    for doc in documents:
+        yield json_util.dumps(doc, json_options=RELAXED_JSON_OPTIONS) + "\n"
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_rows(documents: Iterable[dict], columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for doc in documents:
+        writer.writerow([_csv_value(field_value(doc, column)) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_chunks(rows: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    pending, size = [], 0
+
+    def flush() -> bytes:
+        data = "".join(pending).encode("utf-8")
+        pending.clear()
+        return compressor.compress(data) if compressor else data
+
+    for row in rows:
+        pending.append(row)
+        size += len(row)
+        if size >= FLUSH_BYTES:
+            size = 0
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,57 @@
+"""
+SMTP sending for the e-mail outbox.
+
+One Mailer keeps a single authenticated SMTP connection open between batches and reconnects when
+the server drops it, instead of a connect, TLS handshake and login per e-mail.
+
+redmail is imported on first connect: it pulls in matplotlib and numpy (for embedding plots),
+which `import app` must not pay for.
+"""
+import logging
+import smtplib
+from os import getenv
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from redmail import EmailSender
+
+
+def sender_address() -> str:
+    return getenv("HELPER_EMAIL", "")
+
+
+class Mailer:
+    def __init__(self):
+        self._sender: Optional["EmailSender"] = None
+
+    def _connected(self) -> "EmailSender":
+        if self._sender is None:
+            from redmail import EmailSender
+
+            sender = EmailSender(
+                host=getenv("HELPER_EMAIL_HOST"),
+                port=int(getenv("HELPER_EMAIL_PORT", "587")),
+                username=getenv("HELPER_EMAIL"),
+                password=getenv("HELPER_EMAIL_PASSWORD"),
+            )
+            # While connected, redmail sends every message over this connection
+            sender.connect()
+            self._sender = sender
+        return self._sender
+
+    def send(self, receivers: List[str], subject: str, html: str) -> None:
+        try:
+            self._connected().send(sender=sender_address(), receivers=receivers, subject=subject, html=html)
+        except smtplib.SMTPServerDisconnected:
+            # Idle connections get dropped by the server, retry once on a fresh one
+            self.close()
+            self._connected().send(sender=sender_address(), receivers=receivers, subject=subject, html=html)
+
+    def close(self) -> None:
+        if self._sender is None:
+            return
+        try:
+            self._sender.close()
+        except Exception as e:
+            logging.warning(f"Closing the SMTP connection failed: {str(e)}")
+        self._sender = None
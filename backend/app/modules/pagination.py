@@ -0,0 +1,144 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+from bson import ObjectId, json_util
+from fastapi import HTTPException
+from pymongo import DESCENDING
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def page_size(limit: Optional[int]) -> Optional[int]:
+    """None keeps the listing unpaged, for clients that do not send a limit"""
+    if limit is None:
+        return None
+    if limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def fetch_limit(limit: Optional[int]) -> int:
+    """Documents to fetch for a page: one extra to detect a next page, 0 (no limit) when unpaged"""
+    return 0 if limit is None else limit + 1
+
+
+def field_value(doc: dict, field: str):
+    value = doc
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+# MongoDB sorts mixed types by type first: null (and missing) < numbers < strings < objects < arrays
+# < binary < ObjectId < booleans < dates. Checked in order; bool before int as it subclasses it.
+BSON_TYPE_RANKS = [
+    (type(None), 1),
+    (bool, 8),
+    ((int, float), 2),
+    (str, 3),
+    (dict, 4),
+    ((list, tuple), 5),
+    (bytes, 6),
+    (ObjectId, 7),
+    (datetime, 9),
+]
+
+
+# $type aliases of each rank, used to match the values $lt / $gt skip over (rank 1 is {field: None})
+BSON_TYPE_ALIASES = {
+    2: ["double", "int", "long", "decimal"],
+    3: ["string"],
+    4: ["object"],
+    5: ["array"],
+    6: ["binData"],
+    7: ["objectId"],
+    8: ["bool"],
+    9: ["date"],
+    10: ["timestamp", "regex"],
+}
+
+
+def bson_rank(value) -> int:
+    for types, rank in BSON_TYPE_RANKS:
+        if isinstance(value, types):
+            return rank
+    return 10
+
+
+def sort_key(doc: dict, sort_field: str) -> Tuple:
+    """Python sort key matching MongoDB's order of (sort_field, _id), safe for mixed and missing values"""
+    value = field_value(doc, sort_field)
+    rank = bson_rank(value)
+    # Values of one rank compare with each other, except documents and arrays which only tie
+    comparable = value if rank in (2, 3, 6, 7, 8, 9) else 0
+    return (rank, comparable, doc["_id"])
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    """Opaque cursor holding the (sort key, _id) of the last document of a page"""
+    payload = json_util.dumps({"v": field_value(doc, sort_field), "id": doc["_id"]})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[object, object]:
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return payload["v"], payload["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_sort(sort_field: str, direction: int = DESCENDING) -> List[tuple]:
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+
+def keyset_query(query: dict, sort_field: str, cursor: Optional[str], direction: int = DESCENDING) -> dict:
+    """Restrict query to the documents after the cursor in (sort_field, _id) order"""
+    if not cursor:
+        return query
+
+    value, last_id = decode_cursor(cursor)
+    op = "$lt" if direction == DESCENDING else "$gt"
+
+    if sort_field == "_id":
+        after = {"_id": {op: last_id}}
+    else:
+        after = {"$or": _after_value(sort_field, value, last_id, direction)}
+    return {"$and": [query, after]} if query else after
+
+
+def _after_value(sort_field: str, value, last_id, direction: int) -> List[dict]:
+    """
+    $lt / $gt only match values of the same type as the cursor's, so values of the other types
+    that sort after it (null and missing last when descending) are matched by type.
+    """
+    descending = direction == DESCENDING
+    op = "$lt" if descending else "$gt"
+    ties = {sort_field: value, "_id": {op: last_id}}
+    if value is None:
+        # {field: None} matches null and missing, which MongoDB sorts as equal and below every type
+        return [ties] if descending else [ties, {sort_field: {"$ne": None}}]
+
+    rank = bson_rank(value)
+    ranks = range(2, rank) if descending else range(rank + 1, 11)
+    types = [alias for other in ranks for alias in BSON_TYPE_ALIASES.get(other, [])]
+    after = [{sort_field: {op: value}}, ties]
+    after += [{sort_field: {"$type": alias}} for alias in types]
+    if descending:
+        after.append({sort_field: None})
+    return after
+
+
+def split_page(docs: List[dict], limit: Optional[int], sort_field: str) -> Tuple[List[dict], Optional[str]]:
+    """Docs are fetched with fetch_limit(limit); the extra one only signals that a next page exists"""
+    if limit is None or len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], sort_field)
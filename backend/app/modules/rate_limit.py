@@ -0,0 +1,235 @@
+"""
+Rate limiting for the endpoints that hash passwords or send e-mail.
+
+A pure ASGI middleware counts requests with a sliding window per client IP and, where the rule
+names an account field, per account. The estimate for a window is the current window's count
+plus the previous window's count weighted by how much of it still overlaps. A request over
+the limit gets 429 with Retry-After and is not counted.
+
+Rules come from config.yaml (rate_limits). Counters live in process memory, or with
+rate_limit_storage: mongo in the rate_limits collection (expired by a TTL index) so that
+all API workers share them.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from modules.config import config
+
+MAX_INSPECTED_BODY = 64 * 1024
+
+
+class RateLimitRule(BaseModel):
+    path: str
+    methods: List[str] = ["POST"]
+    limit: int
+    window_seconds: int
+    # "ip" and/or "account"; account is read from account_field of the query string or body
+    per: List[str] = ["ip"]
+    account_field: Optional[str] = None
+
+
+# ==================== STORAGE ====================
+class MemoryStore:
+    def __init__(self):
+        self._counts: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    async def get(self, keys: List[str]) -> List[int]:
+        now = time.monotonic()
+        with self._lock:
+            return [self._live(key, now) for key in keys]
+
+    def _live(self, key: str, now: float) -> int:
+        expires_at, count = self._counts.get(key, (0.0, 0))
+        return count if expires_at >= now else 0
+
+    async def increment(self, key: str, ttl: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._counts[key] = (now + ttl, self._live(key, now) + 1)
+            if now >= self._next_sweep:
+                self._next_sweep = now + 60
+                self._counts = {k: v for k, v in self._counts.items() if v[0] >= now}
+
+
+class MongoStore:
+    def __init__(self):
+        from crud import async_databases
+
+        self._collection = async_databases.rate_limits
+
+    async def get(self, keys: List[str]) -> List[int]:
+        counts = {doc["_id"]: doc["count"] async for doc in self._collection.find({"_id": {"$in": keys}})}
+        return [counts.get(key, 0) for key in keys]
+
+    async def increment(self, key: str, ttl: float) -> None:
+        from crud.codec import utcnow
+
+        await self._collection.update_one(
+            {"_id": key},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": utcnow() + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+
+
+def create_store():
+    return MongoStore() if config.rate_limit_storage == "mongo" else MemoryStore()
+
+
+# ==================== MIDDLEWARE ====================
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, rules: Optional[List[RateLimitRule]] = None, store=None):
+        self.app = app
+        self.rules = rules if rules is not None else [RateLimitRule(**rule) for rule in config.rate_limits]
+        self._store = store
+
+    @property
+    def store(self):
+        # Created on first use, the Mongo store needs the event loop's client
+        if self._store is None:
+            self._store = create_store()
+        return self._store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        rule = self._match(scope) if scope["type"] == "http" else None
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        if "account" in rule.per and rule.account_field:
+            body, receive = await _buffer_body(receive)
+
+        subjects = [f"ip:{_client_ip(scope)}"] if "ip" in rule.per else []
+        account = _account(scope, body, rule.account_field) if "account" in rule.per else None
+        if account:
+            subjects.append(f"account:{account.lower()}")
+
+        try:
+            retry_after = await self._check(rule, subjects)
+        except Exception as e:
+            # Throttling must not take the endpoints down with the store
+            logging.error(f"Rate limit check failed, allowing request: {str(e)}")
+            retry_after = None
+
+        if retry_after is not None:
+            response = JSONResponse(
+                {"detail": "Too many requests, please try again later."},
+                status_code=429,
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+    def _match(self, scope: Scope) -> Optional[RateLimitRule]:
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        for rule in self.rules:
+            if path == rule.path and scope["method"] in rule.methods:
+                return rule
+        return None
+
+    async def _check(self, rule: RateLimitRule, subjects: List[str]) -> Optional[int]:
+        """Seconds to wait when any subject is over the limit, otherwise count the request and return None"""
+        window = rule.window_seconds
+        now = time.time()
+        current = int(now // window)
+        elapsed = now - current * window
+        overlap = 1 - elapsed / window
+
+        keys = []
+        for subject in subjects:
+            keys += [f"{rule.path}|{subject}|{current}", f"{rule.path}|{subject}|{current - 1}"]
+        counts = await self.store.get(keys)
+
+        retry_after = 0
+        for index in range(0, len(keys), 2):
+            in_window, previous = counts[index], counts[index + 1]
+            if in_window + previous * overlap < rule.limit:
+                continue
+            if in_window >= rule.limit:
+                # This window becomes the previous one, then enough of it has to slide out
+                wait = window - elapsed + window * (1 - rule.limit / in_window)
+            elif previous == 0:
+                wait = window - elapsed
+            else:
+                # When enough of the previous window has slid out
+                wait = window * (1 - (rule.limit - in_window) / previous) - elapsed
+            # The estimate has to drop below the limit, reaching it is still refused
+            retry_after = max(retry_after, math.floor(max(wait, 0)) + 1)
+        if retry_after:
+            return retry_after
+
+        for key in keys[::2]:
+            # Kept for two windows, as the next window reads it as the previous one
+            await self.store.increment(key, 2 * window)
+        return None
+
+
+def _client_ip(scope: Scope) -> str:
+    if config.rate_limit_trust_forwarded:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _account(scope: Scope, body: bytes, field: Optional[str]) -> Optional[str]:
+    if not field:
+        return None
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(field)
+    if values:
+        return values[0]
+    if not body:
+        return None
+
+    content_type = ""
+    for name, value in scope.get("headers", []):
+        if name == b"content-type":
+            content_type = value.decode("latin-1")
+    try:
+        if content_type.startswith("application/json"):
+            value = json.loads(body).get(field)
+            return value if isinstance(value, str) else None
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            values = parse_qs(body.decode("utf-8"))
+            return values[field][0] if field in values else None
+    except (ValueError, AttributeError):
+        return None
+    return None
+
+
+async def _buffer_body(receive: Receive) -> Tuple[bytes, Receive]:
+    """Read the request body, and a receive that replays it to the application"""
+    chunks, size, messages = [], 0, []
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        size += len(chunks[-1])
+        if not message.get("more_body") or size > MAX_INSPECTED_BODY:
+            break
+
+    async def replay() -> Message:
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    body = b"".join(chunks)
+    return (body if size <= MAX_INSPECTED_BODY else b""), replay
@@ -0,0 +1,158 @@
+"""
+Password hashing.
+
+bcrypt costs a few hundred milliseconds of CPU per hash. Request handlers hash and verify on a
+dedicated, bounded thread pool (bcrypt releases the GIL), so a burst of logins queues there
+instead of taking over the threadpool every sync route runs on; when the queue is full the
+request is refused with 503. Bulk hashing is spread over a process pool.
+
+pwd_context pins the bcrypt cost to config.bcrypt_rounds; verify_and_update reports hashes with
+another cost so login can rehash them.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from modules.config import config
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=config.bcrypt_rounds,
+    # Hashes made with any other cost count as outdated
+    bcrypt__min_rounds=config.bcrypt_rounds,
+    bcrypt__max_rounds=config.bcrypt_rounds,
+)
+
+HASH_WORKERS = os.cpu_count() or 1
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(valid, new hash when the stored one uses an outdated cost)"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# ==================== REQUEST PATH ====================
+class HashingPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def submit(self, function: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-in requests, please try again shortly.",
+                headers={"Retry-After": "1"},
+            )
+
+        queued_at = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_seconds += time.monotonic() - queued_at
+            try:
+                return function(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def run(self, function: Callable, *args):
+        """From sync code: bounded like the async callers, the calling thread waits"""
+        return self.submit(function, *args).result()
+
+    async def run_async(self, function: Callable, *args):
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_wait_ms": round(1000 * self.wait_seconds / started, 1) if started else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+hashing_pool = HashingPool(
+    workers=config.password_hash_workers or HASH_WORKERS,
+    max_pending=config.password_hash_queue,
+)
+
+
+def hash_password_bounded(password: str) -> str:
+    return hashing_pool.run(hash_password, password)
+
+
+def verify_password_bounded(plain_password: str, hashed_password: str) -> bool:
+    return hashing_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await hashing_pool.run_async(verify_and_update, plain_password, hashed_password)
+
+
+# ==================== BULK ====================
+def hash_pool() -> ProcessPoolExecutor:
+    """Created on first use, so workers that never import users do not start hashing processes"""
+    global _hash_pool
+    if _hash_pool is None:
+        # spawn: forking once the API's threads (Mongo monitors, thread pools) run can copy held locks
+        _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _hash_pool
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords in parallel, results in the order of the input"""
+    if len(passwords) <= 1:
+        return [hash_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (HASH_WORKERS * 4))
+    return list(hash_pool().map(hash_password, passwords, chunksize=chunksize))
+
+
+def shutdown_hash_pool() -> None:
+    global _hash_pool
+    hashing_pool.shutdown()
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
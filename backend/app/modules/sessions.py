@@ -0,0 +1,133 @@
+"""
+Session cache for get_session.
+
+Validated User objects are cached per token subject (the user id) for session_cache_ttl seconds.
+Code that changes a user calls invalidate_session(user_id). Besides dropping the local entry, that
+appends the id to the capped session_invalidations collection, which every API worker tails, so
+the other workers drop theirs too. Without the channel, the TTL bounds how stale a cached session can get.
+
+Token revocation rides on the same channel: revoking a user bumps their token_version, which the
+reloaded session no longer matches, and a logout adds the refresh token family to revoked_families
+for as long as the access tokens of that family can live.
+"""
+import asyncio
+import logging
+from typing import Callable, Iterable, List, Optional
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from crud import async_databases
+from crud.codec import utcnow
+from crud.databases import session_invalidations
+from crud.refresh_tokens import revoke_user_tokens
+from models.user import User
+from modules.cache import TTLCache
+from modules.config import config
+
+INVALIDATIONS_COLLECTION = "session_invalidations"
+INVALIDATIONS_SIZE_BYTES = 1024 * 1024
+TAIL_RETRY_SECONDS = 5
+
+session_cache = TTLCache(config.session_cache_ttl, maxsize=config.session_cache_size)
+revoked_families = TTLCache(config.access_token_expire_minutes * 60, maxsize=100000)
+
+
+def cached_session(user_id: str, load: Callable[[str], Optional[User]]) -> Optional[User]:
+    """
+    The User of user_id from the cache, loaded with load on a miss.
+    Always a copy: routes blank out hashed_password and id on the object they get.
+    """
+    user = session_cache.get(user_id)
+    if user is None:
+        user = load(user_id)
+        if not user:
+            return None
+        session_cache.set(user_id, user)
+    return user.model_copy()
+
+
+def _apply(entry: dict) -> None:
+    if entry.get("user_id"):
+        session_cache.invalidate(entry["user_id"])
+    if entry.get("family_id"):
+        revoked_families.set(entry["family_id"], True)
+
+
+def _broadcast(entries: List[dict]) -> None:
+    for entry in entries:
+        _apply(entry)
+    if not entries or not config.session_invalidation_channel:
+        return
+    try:
+        now = utcnow()
+        session_invalidations.insert_many([{**entry, "at": now} for entry in entries])
+    except Exception as e:
+        logging.error(f"Failed to broadcast session invalidation: {str(e)}")
+
+
+def invalidate_sessions(user_ids: Iterable[str]) -> None:
+    _broadcast([{"user_id": user_id} for user_id in user_ids if user_id])
+
+
+def invalidate_session(user_id: str) -> None:
+    invalidate_sessions([user_id])
+
+
+def revoke_sessions(user_ids: Iterable[str]) -> None:
+    """Log the users out everywhere: every access and refresh token issued so far stops working"""
+    user_ids = [user_id for user_id in user_ids if user_id]
+    revoke_user_tokens(user_ids)
+    invalidate_sessions(user_ids)
+
+
+def revoke_token_family(family_id: str) -> None:
+    _broadcast([{"family_id": family_id}])
+
+
+def is_family_revoked(family_id: Optional[str]) -> bool:
+    return bool(family_id) and revoked_families.get(family_id) is not None
+
+
+# ==================== CROSS-WORKER CHANNEL ====================
+async def _ensure_channel() -> None:
+    try:
+        await async_databases.db.create_collection(
+            INVALIDATIONS_COLLECTION, capped=True, size=INVALIDATIONS_SIZE_BYTES
+        )
+        # A tailable cursor on an empty capped collection dies at once, start it with a marker
+        await async_databases.session_invalidations.insert_one({"user_id": "", "at": utcnow()})
+    except CollectionInvalid:
+        pass
+
+
+async def _tail_invalidations() -> None:
+    last_id = None
+    while True:
+        try:
+            if last_id is None:
+                latest = await async_databases.session_invalidations.find_one(sort=[("$natural", -1)])
+                last_id = latest["_id"] if latest else None
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            cursor = async_databases.session_invalidations.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                async for entry in cursor:
+                    last_id = entry["_id"]
+                    _apply(entry)
+            await asyncio.sleep(TAIL_RETRY_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Session invalidation channel interrupted: {str(e)}")
+            # Entries may have been missed, anything cached could be stale
+            session_cache.clear()
+            await asyncio.sleep(TAIL_RETRY_SECONDS)
+
+
+async def start_invalidation_channel() -> Optional[asyncio.Task]:
+    if not config.session_invalidation_channel:
+        return None
+    try:
+        await _ensure_channel()
+    except Exception as e:
+        logging.error(f"Could not set up the session invalidation channel: {str(e)}")
+        return None
+    return asyncio.create_task(_tail_invalidations())
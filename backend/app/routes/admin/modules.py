@@ -0,0 +1,424 @@
+import csv
+import itertools
+import logging
+import re
+from uuid import uuid4
+from enum import Enum
+from typing import IO, Callable, Dict, Iterator, List, NamedTuple, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, EmailStr, ValidationError
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from crud.databases import client, deleted_users, manufacturer_data, orders, orders_archive, users
+from models.user import AccountStatus, User, UserRoles
+from modules.security import hash_passwords
+
+MAX_BULK_USERS = 1000
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 200
+MAX_IMPORT_ROWS = 10000
+IMPORT_COLUMNS = ["first_name", "last_name", "email", "username", "password"]
+
+
+class BulkUserAction(str, Enum):
+    activate = "activate"
+    suspend = "suspend"
+    set_role = "set_role"
+    delete = "delete"
+
+
+class BulkUserFilter(BaseModel):
+    """Restricted filter expression, raw Mongo queries are not accepted from the client"""
+    role: Optional[UserRoles] = None
+    status: Optional[AccountStatus] = None
+    activated: Optional[bool] = None
+    email_domain: Optional[str] = None
+
+
+class BulkUserRequest(BaseModel):
+    action: BulkUserAction
+    user_ids: List[str] = []
+    filter: Optional[BulkUserFilter] = None
+    role: Optional[UserRoles] = None
+
+
+class BulkUserResult(BaseModel):
+    user_id: str
+    ok: bool
+    detail: str = ""
+
+
+class BulkUserResponse(BaseModel):
+    action: BulkUserAction
+    requested: int
+    succeeded: int
+    results: List[BulkUserResult]
+
+
+def filter_query(user_filter: BulkUserFilter) -> dict:
+    query = {}
+    if user_filter.role:
+        query["role"] = user_filter.role.value
+    if user_filter.status:
+        query["status"] = user_filter.status.value
+    if user_filter.activated is not None:
+        query["activated"] = user_filter.activated
+    if user_filter.email_domain:
+        query["email"] = {"$regex": f"@{re.escape(user_filter.email_domain.lstrip('@'))}$", "$options": "i"}
+    if not query:
+        raise HTTPException(status_code=400, detail="Filter must restrict at least one field")
+    return query
+
+
+def resolve_targets(request: BulkUserRequest, admin_id: str):
+    """(user documents to change, results of the ids that are skipped)"""
+    if bool(request.user_ids) == bool(request.filter):
+        raise HTTPException(status_code=400, detail="Give either user_ids or filter")
+
+    if request.user_ids:
+        query = {"id": {"$in": list(dict.fromkeys(request.user_ids))}}
+    else:
+        query = filter_query(request.filter)
+
+    targets = list(users.find(query).limit(MAX_BULK_USERS + 1))
+    if len(targets) > MAX_BULK_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_USERS} users per request")
+
+    skipped = []
+    found = {doc["id"] for doc in targets}
+    for user_id in request.user_ids:
+        if user_id not in found:
+            skipped.append(BulkUserResult(user_id=user_id, ok=False, detail="User not found"))
+
+    # Admins cannot lock themselves out through a bulk operation
+    if any(doc["id"] == admin_id for doc in targets):
+        skipped.append(BulkUserResult(user_id=admin_id, ok=False, detail="Cannot change your own account"))
+        targets = [doc for doc in targets if doc["id"] != admin_id]
+
+    return targets, skipped
+
+
+def transactions_supported() -> bool:
+    return client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+
+def run_in_transaction(callback: Callable) -> None:
+    """Run callback(session) inside a transaction where the deployment has them, plainly otherwise"""
+    if not transactions_supported():
+        callback(None)
+        return
+    with client.start_session() as session:
+        session.with_transaction(callback)
+
+
+def _failed_indexes(error: BulkWriteError) -> Dict[int, str]:
+    return {e["index"]: e.get("errmsg", "Write failed") for e in error.details.get("writeErrors", [])}
+
+
+def _update_set(request: BulkUserRequest) -> dict:
+    if request.action == BulkUserAction.activate:
+        return {"activated": True, "status": AccountStatus.normal.value}
+    if request.action == BulkUserAction.suspend:
+        return {"status": AccountStatus.suspend.value}
+    if not request.role:
+        raise HTTPException(status_code=400, detail="role is required for set_role")
+    return {"role": request.role.value}
+
+
+def bulk_update_users(request: BulkUserRequest, targets: List[dict]) -> List[BulkUserResult]:
+    update = {"$set": _update_set(request)}
+    operations = [UpdateOne({"id": doc["id"]}, update) for doc in targets]
+    failed: Dict[int, str] = {}
+
+    def write(session):
+        nonlocal failed
+        try:
+            users.bulk_write(operations, ordered=False, session=session)
+        except BulkWriteError as e:
+            failed = _failed_indexes(e)
+
+    if operations:
+        run_in_transaction(write)
+
+    return [
+        BulkUserResult(user_id=doc["id"], ok=index not in failed, detail=failed.get(index, ""))
+        for index, doc in enumerate(targets)
+    ]
+
+
+def bulk_delete_users(targets: List[dict]) -> List[BulkUserResult]:
+    """Copy the users into deleted_users with one insert_many, then delete the copied ones"""
+    failed: Dict[int, str] = {}
+
+    def write(session):
+        nonlocal failed
+        failed = {}
+        copies = [{key: value for key, value in doc.items() if key != "_id"} for doc in targets]
+        try:
+            deleted_users.insert_many(copies, ordered=False, session=session)
+        except BulkWriteError as e:
+            failed = _failed_indexes(e)
+            if session is not None:
+                # Abort the transaction, nothing is deleted
+                raise
+        # Without a transaction only users whose copy was written are deleted
+        operations = [DeleteOne({"id": doc["id"]}) for index, doc in enumerate(targets) if index not in failed]
+        if operations:
+            users.bulk_write(operations, ordered=False, session=session)
+
+    if targets:
+        try:
+            run_in_transaction(write)
+        except BulkWriteError as e:
+            logging.error(f"Bulk user delete aborted: {str(e)}")
+            return [
+                BulkUserResult(user_id=doc["id"], ok=False, detail=failed.get(index, "Aborted with the batch"))
+                for index, doc in enumerate(targets)
+            ]
+
+    return [
+        BulkUserResult(user_id=doc["id"], ok=index not in failed, detail=failed.get(index, ""))
+        for index, doc in enumerate(targets)
+    ]
+
+
+# ==================== EXPORT ====================
+class ExportDataset(str, Enum):
+    users = "users"
+    orders = "orders"
+    manufacturer_data = "manufacturer_data"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class ExportSpec(NamedTuple):
+    projection: dict
+    csv_columns: List[str]
+
+
+EXPORT_SPECS: Dict[ExportDataset, ExportSpec] = {
+    ExportDataset.users: ExportSpec(
+        # Password hashes never leave the database
+        {"_id": 0, "hashed_password": 0},
+        ["id", "email", "username", "first_name", "last_name", "role", "status", "activated"],
+    ),
+    ExportDataset.orders: ExportSpec(
+        {"_id": 0},
+        [
+            "order_id", "user_id", "manufacturer_id", "status", "current_step", "is_cancelled",
+            "order_type", "quantity", "order_detail.material", "order_detail.brand", "order_detail.color",
+            "estimations.estimated_weight", "estimations.estimated_cost", "final_price",
+            "actual_filament_usage", "order_timing_table.order_received.timestamp", "last_updated",
+        ],
+    ),
+    ExportDataset.manufacturer_data: ExportSpec(
+        {"_id": 0},
+        ["user_id", "company", "name", "phone"],
+    ),
+}
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def export_projection(dataset: ExportDataset, export_format: ExportFormat) -> dict:
+    """CSV reads only its columns, NDJSON every field the dataset allows"""
+    spec = EXPORT_SPECS[dataset]
+    if export_format == ExportFormat.csv:
+        return {"_id": 0, **{column: 1 for column in spec.csv_columns}}
+    return spec.projection
+
+
+def export_documents(dataset: ExportDataset, export_format: ExportFormat, include_archived: bool = False) -> Iterator[dict]:
+    """Server-side cursors over the dataset in _id order, fetched EXPORT_BATCH_SIZE documents at a time"""
+    projection = export_projection(dataset, export_format)
+    collection = {
+        ExportDataset.users: users,
+        ExportDataset.orders: orders,
+        ExportDataset.manufacturer_data: manufacturer_data,
+    }[dataset]
+
+    documents = collection.find({}, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    if dataset == ExportDataset.orders and include_archived:
+        # Cursors do not query until iterated, so the archive is read only after the hot collection
+        archived = orders_archive.find({}, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+        return itertools.chain(documents, archived)
+    return documents
+
+
+# ==================== IMPORT ====================
+class ImportUserRow(BaseModel):
+    first_name: str
+    last_name: str
+    email: EmailStr
+    username: str
+    password: str
+    role: UserRoles = UserRoles.user
+
+
+class ImportRowResult(BaseModel):
+    row: int
+    email: str = ""
+    ok: bool
+    user_id: str = ""
+    detail: str = ""
+
+
+class UserImportResponse(BaseModel):
+    total: int
+    created: int
+    results: List[ImportRowResult]
+
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+def check_import_file(stream: IO[str]) -> None:
+    """
+    Decode and count the whole file before anything is inserted, so a file that is too long or
+    not UTF-8 is refused as a whole instead of failing halfway. Leaves the stream rewound.
+    """
+    try:
+        reader = csv.DictReader(stream)
+        missing = [column for column in IMPORT_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+        for index, _ in enumerate(reader):
+            if index >= MAX_IMPORT_ROWS:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_IMPORT_ROWS} rows per import")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded CSV")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Malformed CSV: {str(e)}")
+    stream.seek(0)
+
+
+def parse_import_rows(stream: IO[str]) -> Iterator[tuple]:
+    """
+    (row number, ImportUserRow or None, ImportRowResult or None) for every data row, read one at a time.
+    Rows that fail validation or repeat an email/username of an earlier row come with their failed result.
+    """
+    reader = csv.DictReader(stream)
+    seen_emails, seen_usernames = set(), set()
+    for index, raw in enumerate(reader):
+        row_number = index + 2  # The header is line 1
+
+        values = {key: (value or "").strip() for key, value in raw.items() if key}
+        if not values.get("role"):
+            values.pop("role", None)
+        email = values.get("email", "")
+        if any(not values.get(column) for column in IMPORT_COLUMNS):
+            yield row_number, None, ImportRowResult(row=row_number, email=email, ok=False, detail="Empty required field")
+            continue
+        try:
+            row = ImportUserRow(**values)
+        except ValidationError as e:
+            yield row_number, None, ImportRowResult(row=row_number, email=email, ok=False, detail=_validation_detail(e))
+            continue
+
+        if row.email in seen_emails or row.username in seen_usernames:
+            yield row_number, None, ImportRowResult(row=row_number, email=email, ok=False, detail="Duplicate in file")
+            continue
+        seen_emails.add(row.email)
+        seen_usernames.add(row.username)
+        yield row_number, row, None
+
+
+def _existing_conflicts(rows: List[ImportUserRow]) -> Dict[str, str]:
+    """email of every row that clashes with an existing account -> reason"""
+    emails = [row.email for row in rows]
+    usernames = [row.username for row in rows]
+    taken_emails, taken_usernames = set(), set()
+    for doc in users.find(
+        {"$or": [{"email": {"$in": emails}}, {"username": {"$in": usernames}}]},
+        {"_id": 0, "email": 1, "username": 1},
+    ):
+        taken_emails.add(doc.get("email"))
+        taken_usernames.add(doc.get("username"))
+
+    conflicts = {}
+    for row in rows:
+        if row.email in taken_emails:
+            conflicts[row.email] = "Email already registered"
+        elif row.username in taken_usernames:
+            conflicts[row.email] = "Username already registered"
+    return conflicts
+
+
+def import_user_batch(batch: List[tuple], activate: bool) -> List[ImportRowResult]:
+    """Hash the passwords of a batch in the process pool and insert the accounts with one insert_many"""
+    conflicts = _existing_conflicts([row for _, row in batch])
+    results: Dict[int, ImportRowResult] = {}
+    pending = []
+    for row_number, row in batch:
+        if row.email in conflicts:
+            results[row_number] = ImportRowResult(row=row_number, email=row.email, ok=False, detail=conflicts[row.email])
+        else:
+            pending.append((row_number, row))
+
+    hashes = hash_passwords([row.password for _, row in pending])
+    documents = [
+        jsonable_encoder(
+            User(
+                id=str(uuid4()),
+                first_name=row.first_name,
+                last_name=row.last_name,
+                email=row.email,
+                username=row.username,
+                hashed_password=hashed_password,
+                activated=activate,
+                status=AccountStatus.normal,
+                role=row.role,
+            )
+        )
+        for (_, row), hashed_password in zip(pending, hashes)
+    ]
+
+    failed: Dict[int, str] = {}
+    if documents:
+        try:
+            users.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Accounts registered since the conflict check hit the unique email/username indexes
+            failed = {
+                index: "Email or username already registered" if message.startswith("E11000") else message
+                for index, message in _failed_indexes(e).items()
+            }
+
+    for index, ((row_number, row), document) in enumerate(zip(pending, documents)):
+        if index in failed:
+            results[row_number] = ImportRowResult(row=row_number, email=row.email, ok=False, detail=failed[index])
+        else:
+            results[row_number] = ImportRowResult(row=row_number, email=row.email, ok=True, user_id=document["id"])
+    return [results[row_number] for row_number, _ in batch]
+
+
+def import_users(stream: IO[str], activate: bool = False) -> UserImportResponse:
+    check_import_file(stream)
+    results: List[ImportRowResult] = []
+    batch: List[tuple] = []
+
+    for row_number, row, failure in parse_import_rows(stream):
+        if failure:
+            results.append(failure)
+            continue
+        batch.append((row_number, row))
+        if len(batch) == IMPORT_BATCH_SIZE:
+            results.extend(import_user_batch(batch, activate))
+            batch = []
+    if batch:
+        results.extend(import_user_batch(batch, activate))
+
+    results.sort(key=lambda result: result.row)
+    return UserImportResponse(
+        total=len(results),
+        created=sum(result.ok for result in results),
+        results=results,
+    )
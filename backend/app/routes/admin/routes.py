@@ -1,14 +1,48 @@
-from fastapi import Depends, HTTPException, status
+import io
+from datetime import date, datetime
+from enum import Enum
+from typing import Optional
+from fastapi import Depends, File, HTTPException, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from routes.user.user_functions import get_user_with_id
-from models.user import User, UserRoles
+from models.user import AccountStatus, User, UserRoles
 from routes.authentication.auth_modules import get_session
 from crud.databases import (
     users,
     deleted_users,
     general_settings,
+    order_stats_daily,
+)
+from crud.codec import utcnow
+from crud.order_stats import COUNTER_FIELDS, stats_match, stats_pipeline
+from routes.admin.modules import (
+    BulkUserAction,
+    BulkUserRequest,
+    BulkUserResponse,
+    EXPORT_MEDIA_TYPES,
+    EXPORT_SPECS,
+    ExportDataset,
+    ExportFormat,
+    UserImportResponse,
+    bulk_delete_users,
+    bulk_update_users,
+    export_documents,
+    import_users,
+    resolve_targets,
 )
 from app import app
+from modules.security import hashing_pool
+from modules.sessions import invalidate_session, invalidate_sessions, revoke_sessions
+from modules.export import csv_rows, encode_chunks, ndjson_rows
+from modules.pagination import (
+    NEXT_CURSOR_HEADER,
+    fetch_limit,
+    keyset_query,
+    keyset_sort,
+    page_size,
+    split_page,
+)
 
 
 def insufficient_auth():
@@ -24,13 +58,28 @@ class CompanyName(BaseModel):
 
 # user manager
 @app.get("/admin/get_users/", tags=["administration"])
-def get_users(user: User = Depends(get_session)):
+def get_users(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user: User = Depends(get_session),
+):
 
     if user.role != UserRoles.admin:
         raise insufficient_auth()
 
+    limit = page_size(limit)
+    page = list(
+        users.find(keyset_query({}, "_id", cursor))
+        .sort(keyset_sort("_id"))
+        .limit(fetch_limit(limit))
+    )
+    page, next_cursor = split_page(page, limit, "_id")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
     users_ = []
-    for user_ in users.find({}):
+    for user_ in page:
         user = User(**user_)
         user.hashed_password = ""
         users_.append(user)
@@ -46,13 +95,18 @@ def get_update_user(user: User, session_user: User = Depends(get_session)):
         raise insufficient_auth()
 
     updated_data = user.dict(
-        exclude_unset=True, exclude={"id", "hashed_password", "pp"}
+        exclude_unset=True, exclude={"id", "hashed_password", "pp", "token_version"}
     )
 
     users.find_one_and_update(
         {"id": user.id},
         {"$set": updated_data},
     )
+    if user.status == AccountStatus.suspend or not user.activated:
+        # Existing tokens must not outlive the suspension
+        revoke_sessions([user.id])
+    else:
+        invalidate_session(user.id)
     return "ok updated"
 
 @app.delete("/admin/delete_user/", tags=["administration"])
@@ -65,9 +119,63 @@ def delete_user_route(user_id: str, user: User = Depends(get_session)):
     user_db.pop("_id")
     deleted_users.insert_one(user_db)
     users.delete_one({"id": user_id})
+    revoke_sessions([user_id])
     return "ok"
 
 
+@app.post("/admin/users/bulk/", tags=["administration"], response_model=BulkUserResponse)
+def bulk_users_route(request: BulkUserRequest, user: User = Depends(get_session)):
+    """
+    Activate, suspend, change the role of or delete many users at once,
+    selected by user_ids or by a filter (role, status, activated, email_domain).
+    Runs as one bulk_write (deletes also one insert_many into deleted_users), transactional where available.
+    """
+
+    if user.role != UserRoles.admin:
+        raise insufficient_auth()
+
+    targets, skipped = resolve_targets(request, user.id)
+    if request.action == BulkUserAction.delete:
+        results = bulk_delete_users(targets)
+    else:
+        results = bulk_update_users(request, targets)
+    changed = [result.user_id for result in results if result.ok]
+    if request.action in (BulkUserAction.suspend, BulkUserAction.delete):
+        revoke_sessions(changed)
+    else:
+        invalidate_sessions(changed)
+
+    results.extend(skipped)
+    return BulkUserResponse(
+        action=request.action,
+        requested=len(results),
+        succeeded=sum(result.ok for result in results),
+        results=results,
+    )
+
+
+@app.post("/admin/users/import/", tags=["administration"], response_model=UserImportResponse)
+def import_users_route(
+    file: UploadFile = File(...),
+    activate: bool = False,
+    user: User = Depends(get_session),
+):
+    """
+    Create accounts from a CSV with first_name, last_name, email, username, password and an optional role column.
+    Rows are validated as they are read; a bad row is reported without failing the others.
+    """
+
+    if user.role != UserRoles.admin:
+        raise insufficient_auth()
+
+    # utf-8-sig drops the BOM spreadsheet exports start with
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return import_users(stream, activate=activate)
+    finally:
+        stream.detach()
+
+
 @app.post("/admin/company_name/", tags=["administration"])
 def update_company_name(company_name: CompanyName, user: User = Depends(get_session)):
 
@@ -95,3 +203,113 @@ def get_company_name() -> str:
         return res.get("name")
     else:
         return ""
+
+
+# order analytics
+MAX_STATS_DAYS = 366
+
+
+class StatsGroupBy(str, Enum):
+    manufacturer_id = "manufacturer_id"
+    material = "material"
+    order_type = "order_type"
+
+
+def stats_range(start: date, end: date):
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= MAX_STATS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_STATS_DAYS} days")
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+
+
+@app.get("/admin/stats/daily", tags=["administration"])
+def get_daily_stats(
+    start: date,
+    end: date,
+    manufacturer_id: Optional[str] = None,
+    material: Optional[str] = None,
+    order_type: Optional[str] = None,
+    user: User = Depends(get_session),
+):
+    """Per-day order counts, revenue and material usage from the order_stats_daily rollups"""
+
+    if user.role != UserRoles.admin:
+        raise insufficient_auth()
+
+    match = stats_match(
+        *stats_range(start, end),
+        manufacturer_id=manufacturer_id,
+        material=material,
+        order_type=order_type,
+    )
+    return [
+        {"day": row["_id"].date().isoformat(), **{field: row[field] for field in COUNTER_FIELDS}}
+        for row in order_stats_daily.aggregate(stats_pipeline(match, "day"))
+    ]
+
+
+@app.get("/admin/stats/breakdown", tags=["administration"])
+def get_stats_breakdown(
+    start: date,
+    end: date,
+    group_by: StatsGroupBy = StatsGroupBy.manufacturer_id,
+    user: User = Depends(get_session),
+):
+    """Totals over a date range, split by manufacturer, material or order type"""
+
+    if user.role != UserRoles.admin:
+        raise insufficient_auth()
+
+    match = stats_match(*stats_range(start, end))
+    return [
+        {group_by.value: row["_id"], **{field: row[field] for field in COUNTER_FIELDS}}
+        for row in order_stats_daily.aggregate(stats_pipeline(match, group_by.value))
+    ]
+
+
+@app.get("/admin/metrics/password_hashing", tags=["administration"])
+def get_password_hashing_metrics(user: User = Depends(get_session)):
+    """Queue depth and throughput of the password hashing pool of this API worker"""
+
+    if user.role != UserRoles.admin:
+        raise insufficient_auth()
+
+    return hashing_pool.stats()
+
+
+# ==================== EXPORT ====================
+@app.get("/admin/export/{dataset}", tags=["administration"])
+def export_dataset(
+    dataset: ExportDataset,
+    format: ExportFormat = ExportFormat.ndjson,
+    gzip: bool = False,
+    include_archived: bool = False,
+    user: User = Depends(get_session),
+):
+    """
+    Stream a whole collection as NDJSON or CSV. Documents are serialized as the cursor yields them,
+    so the export runs in constant memory whatever the collection size.
+    """
+
+    if user.role != UserRoles.admin:
+        raise insufficient_auth()
+
+    documents = export_documents(dataset, format, include_archived)
+    if format == ExportFormat.csv:
+        rows = csv_rows(documents, EXPORT_SPECS[dataset].csv_columns)
+    else:
+        rows = ndjson_rows(documents)
+
+    filename = f"{dataset.value}_{utcnow():%Y%m%d}.{format.value}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    # A sync generator, so Starlette iterates the cursor in the threadpool
+    return StreamingResponse(
+        encode_chunks(rows, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -3,21 +3,34 @@ from typing import Annotated, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
+from crud import async_databases
 from crud.databases import users
-from models.user import User, UserRoles
+from crud.refresh_tokens import issue_refresh_token
+from models.user import AccountStatus, User, UserRoles
 from modules.config import config
+from modules.security import (
+    hash_password_bounded,
+    verify_and_update_async,
+    verify_password_bounded,
+)
+from modules.sessions import cached_session, is_family_revoked
 
 SECRET_KEY = config.secret_key
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 180
+ACCESS_TOKEN_EXPIRE_MINUTES = config.access_token_expire_minutes
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: str = ""
+    expires_in: int = 0
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -28,16 +41,15 @@ class UserInDB(User):
     hashed_password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_password_bounded(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hash_password_bounded(password)
 
 
 def get_user(email: str) -> User:
@@ -50,8 +62,9 @@ def get_user_with_username(username: str, role: UserRoles = None) -> User:
     user: dict = users.find_one(
         {"id": username, "role": {"$in": ["user", "admin", "manager", "manufacturer"]}}
     )
-    if user:
-        user_ = User(**user)
+    if not user:
+        return None
+    user_ = User(**user)
 
     if role:
         if user_.role == role:
@@ -62,12 +75,22 @@ def get_user_with_username(username: str, role: UserRoles = None) -> User:
     return user_
 
 
-def authenticate_user(email: str, password: str):
-    user = get_user(email)
-    if not user:
+async def authenticate_user_async(email: str, password: str):
+    """Verify the login off the event loop, and rehash the password when its bcrypt cost is outdated"""
+    user_doc = await async_databases.users.find_one({"email": email})
+    if not user_doc:
         return False
-    if not verify_password(password, user.hashed_password):
+    user = User(**user_doc)
+    valid, new_hash = await verify_and_update_async(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # Guarded on the old hash so a concurrent password change is not overwritten
+        await async_databases.users.update_one(
+            {"id": user.id, "hashed_password": user.hashed_password},
+            {"$set": {"hashed_password": new_hash}},
+        )
+        user.hashed_password = new_hash
     return user
 
 
@@ -86,6 +109,26 @@ def decode_jwt_token(token: str) -> dict:
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
 
+async def issue_tokens(user: User, family_id: Optional[str] = None) -> Token:
+    """
+    A short-lived access token and a refresh token of the same family.
+    The access token carries the user's token_version and the family, which get_session checks.
+    """
+    refresh_token, family_id = await issue_refresh_token(user.id, family_id)
+    access_token = create_jwt_token(
+        data={"sub": user.id, "ver": user.token_version, "fam": family_id},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    user = user.model_copy(update={"hashed_password": "", "pp": ""})
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user=user,
+        refresh_token=refresh_token,
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
 def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -112,20 +155,32 @@ def get_current_active_user(current_user: Annotated[User, Depends(get_current_us
     return current_user
 
 
-def get_session(token: str = Depends(oauth2_scheme)):
+def session_from_claims(payload: dict) -> User:
+    """The user of already decoded access token claims, 401 once they are revoked or outdated"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    username: str = payload.get("sub")  # Extract "sub" claim
+    if username is None or is_family_revoked(payload.get("fam")):
+        raise credentials_exception
+    user = cached_session(username, lambda user_id: get_user_with_username(username=user_id))
+    # Tokens issued before a revocation carry an older version; suspension also ends open sessions
+    if user is None or payload.get("ver", 0) != user.token_version or user.status == AccountStatus.suspend:
+        raise credentials_exception
+    return user
+
+
+def get_session(token: str = Depends(oauth2_scheme)):
     try:
-        payload = decode_jwt_token(token)
-        username: str = payload.get("sub")  # Extract "sub" claim
-        if username is None:
-            raise credentials_exception
-        return get_user_with_username(username=username)
+        return session_from_claims(decode_jwt_token(token))
     except JWTError:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 
 def get_admin_role_session(token: str = Depends(oauth2_scheme)):
@@ -1,7 +1,11 @@
 from app import app
 from models.user import AccountStatus
 from routes.authentication.auth_modules import *
+from crud import async_databases
+from crud.refresh_tokens import consume_refresh_token, family_of, revoke_family_async
+from modules.sessions import revoke_token_family
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 
 
 @app.get("/check_auth/", response_model=bool, tags=["user authentication"])
@@ -19,8 +23,9 @@ def user_pass_conditions_check(user: User) -> str:
 
 
 @app.post("/token/", response_model=Token, tags=["user authentication"])
-def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    # Async so a burst of logins waits on the hashing pool, not on the shared threadpool
+    user = await authenticate_user_async(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -32,10 +37,38 @@ def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depen
     if condition:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=condition)
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_jwt_token(
-        data={"sub": user.id}, expires_delta=access_token_expires
+    return await issue_tokens(user)
+
+
+@app.post("/token/refresh/", response_model=Token, tags=["user authentication"])
+async def refresh_access_token(data: RefreshRequest):
+    """Trade a refresh token for a new access token and a new refresh token; each refresh token works once"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    user.hashed_password = ""
-    user.pp = ""
-    return Token(access_token=access_token, token_type="bearer", user=user)
+
+    refresh = await consume_refresh_token(data.refresh_token)
+    if not refresh:
+        raise credentials_exception
+
+    user_doc = await async_databases.users.find_one({"id": refresh["user_id"]})
+    if not user_doc:
+        raise credentials_exception
+    user = User(**user_doc)
+    if user_pass_conditions_check(user=user):
+        await revoke_family_async(refresh["family_id"])
+        raise credentials_exception
+
+    return await issue_tokens(user, refresh["family_id"])
+
+
+@app.post("/logout/", response_model=bool, tags=["user authentication"])
+async def logout(data: RefreshRequest):
+    """End the session of a refresh token, its access tokens included"""
+    family_id = await family_of(data.refresh_token)
+    if family_id:
+        await revoke_family_async(family_id)
+        await run_in_threadpool(revoke_token_family, family_id)
+    return True
@@ -1,13 +1,13 @@
 from typing import List
-from bson import ObjectId
 from models.user import User
 from routes.content.models import FileModel, FileModelLite
-from crud.databases import files_db, users, deleted_users, fs
+from crud.databases import files_db, users, deleted_users
+from crud.media import remove_media
 
 
 def remove_user_files():
     for file in files_db.find({"content_type": "user"}):
-        fs.delete(ObjectId(file.get("id")))
+        remove_media(file.get("id"))
     files_db.delete_many({"content_type": "user"})
 
 
@@ -1,15 +1,23 @@
-import io
 from datetime import datetime
 from typing import List
-from bson import ObjectId
-from fastapi import Depends, File, UploadFile
+from typing import Optional
+from fastapi import Depends, File, HTTPException, Response, UploadFile
 from fastapi.responses import StreamingResponse
 from routes.content.models import ContentTypes, FileModel, FileModelLite, FileTypes
 from models.user import User, UserRoles
 from routes.authentication.auth_modules import get_session
-from crud.databases import users, fs, files_db
+from crud.databases import fs, files_db
+from crud.media import MediaKind, media_document, register_media, resolve_media, open_media, remove_media
 from app import app
-from routes.content.modules import get_content_user
+from crud.user import get_user_directory
+from modules.pagination import (
+    NEXT_CURSOR_HEADER,
+    fetch_limit,
+    keyset_query,
+    keyset_sort,
+    page_size,
+    split_page,
+)
 
 
 @app.post("/user/content_upload/", tags=["user operations"])
@@ -42,6 +50,15 @@ def user_upload_file_route(
             usage="",
         )
         file_descriptions.append(file_model)
+        register_media(media_document(
+            file_model.id,
+            gridfs_file_id,
+            MediaKind.content,
+            content_type=file.content_type,
+            length=file_model.size,
+            filename=file.filename,
+            owner_id=user.id,
+        ))
 
     db_results = files_db.insert_many(
         [dict(file_data) for file_data in file_descriptions]
@@ -94,6 +111,15 @@ def content_upload_file_route(
                 usage="",
             )
             file_descriptions.append(file_model)
+            register_media(media_document(
+                file_model.id,
+                gridfs_file_id,
+                MediaKind.content,
+                content_type=file.content_type,
+                length=file_model.size,
+                filename=file.filename,
+                owner_id=user.id,
+            ))
 
         db_results = files_db.insert_many(
             [dict(file_data) for file_data in file_descriptions]
@@ -101,28 +127,44 @@ def content_upload_file_route(
 
         for file_data in file_descriptions:
             file_data: FileModel
-            file_data.added_by = User(
-                **users.find_one({"id": file_data.added_by})
-            ).email
+            file_data.added_by = user.email
 
         return file_descriptions
 
 
 @app.get("/content/general_file_list/", tags=["administrator content operations"])
-def get_general_file_list_route(user: User = Depends(get_session)) -> List[FileModel]:
+def get_general_file_list_route(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user: User = Depends(get_session),
+) -> List[FileModel]:
     data = []
     if user.role in [UserRoles.admin, UserRoles.manager]:
-        files_ = files_db.find(
+        limit = page_size(limit)
+        query = keyset_query(
             {
                 "content_type": {
                     "$in": [ContentTypes.administration, ContentTypes.general]
                 }
-            }
+            },
+            "added_date",
+            cursor,
+        )
+        page = list(files_db.find(query).sort(keyset_sort("added_date")).limit(fetch_limit(limit)))
+        page, next_cursor = split_page(page, limit, "added_date")
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+        files_ = [FileModel(**file) for file in page]
+        uploaders = get_user_directory(
+            (file_.added_by for file_ in files_), include_deleted=True
         )
 
-        for file in files_:
-            file_ = FileModel(**file)
-            file_.added_by = get_content_user(file_.added_by).email
+        for file_ in files_:
+            file_.added_by = uploaders.get(file_.added_by, {}).get(
+                "email", "User did not found in DB."
+            )
             data.append(file_)
 
         return data
@@ -142,7 +184,7 @@ def content_update_file_route(file: FileModel, user: User = Depends(get_session)
 def delete_file_route(file: FileModel, user: User = Depends(get_session)) -> str:
     if user.role in [UserRoles.admin, UserRoles.manager]:
         files_db.delete_one({"id": file.id})
-        fs.delete(ObjectId(file.id))
+        remove_media(file.id)
         return "ok"
 
 
@@ -157,16 +199,15 @@ def content_set_company_logo_route():
         }
     )
 
-    image_oid = ObjectId(file.get("id"))
-
-    # Fetch the file from GridFS
-    grid_out = fs.get(image_oid)
-
-    # Read image data
-    image_data = grid_out.read()
+    # Resolve the stored blob through the media index
+    media_entry = resolve_media(file.get("id")) if file else None
+    if not media_entry:
+        raise HTTPException(status_code=404, detail="Image not found")
 
     # Return the image as a StreamingResponse
-    return StreamingResponse(io.BytesIO(image_data), media_type="image/png")
+    return StreamingResponse(
+        open_media(media_entry), media_type=media_entry.get("content_type", "image/png")
+    )
 
 
 @app.get("/content/favicon", tags=["general media"])
@@ -180,16 +221,15 @@ def content_set_favicon_route():
         }
     )
 
-    image_oid = ObjectId(file.get("id"))
-
-    # Fetch the file from GridFS
-    grid_out = fs.get(image_oid)
-
-    # Read image data
-    image_data = grid_out.read()
+    # Resolve the stored blob through the media index
+    media_entry = resolve_media(file.get("id")) if file else None
+    if not media_entry:
+        raise HTTPException(status_code=404, detail="Image not found")
 
     # Return the image as a StreamingResponse
-    return StreamingResponse(io.BytesIO(image_data), media_type="image/png")
+    return StreamingResponse(
+        open_media(media_entry), media_type=media_entry.get("content_type", "image/png")
+    )
 
 
 """remove_user_files()
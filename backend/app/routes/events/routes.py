@@ -0,0 +1,100 @@
+import asyncio
+from typing import Callable, Optional
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from models.user import User, UserRoles
+from routes.authentication.auth_modules import decode_jwt_token, get_session, oauth2_scheme, session_from_claims
+from app import app
+from crud.stream_tickets import STREAM_TICKET_SECONDS, issue_stream_ticket, redeem_stream_ticket
+from modules.events import OrderEvent, OrderEventType, Subscription, broker
+
+KEEPALIVE_SECONDS = 15
+RECONNECT_MS = 5000
+
+
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
+
+async def get_stream_session(ticket: str) -> User:
+    """EventSource cannot send an Authorization header, the stream is opened with a ticket from /events/ticket"""
+    claims = await redeem_stream_ticket(ticket)
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    # A ticket does not outlive a revocation made since it was issued
+    return await run_in_threadpool(session_from_claims, claims)
+
+
+def order_event_view(user: User) -> Callable[[OrderEvent], Optional[OrderEvent]]:
+    """Which events a user may receive and how much of them, decided per role"""
+    if user.role in (UserRoles.admin, UserRoles.manager):
+        return lambda event: event
+
+    if user.role == UserRoles.manufacturer:
+        def view(event: OrderEvent) -> Optional[OrderEvent]:
+            # Their own orders
+            if event.manufacturer_id == user.id:
+                return event
+            if event.type == OrderEventType.rejected:
+                return event if event.rejected_by == user.id else None
+            if event.type == OrderEventType.assigned:
+                # Competitors only learn that the order left the pool, not who took it
+                return OrderEvent(type=OrderEventType.left_pool, order_id=event.order_id)
+            # The unassigned pool: new orders, and orders leaving it by cancellation
+            if event.type == OrderEventType.created or (
+                event.type == OrderEventType.cancelled and not event.manufacturer_id
+            ):
+                return event
+            return None
+        return view
+
+    return lambda event: event if event.user_id == user.id else None
+
+
+async def order_event_stream(request: Request, subscription: Subscription):
+    try:
+        yield f"retry: {RECONNECT_MS}\n\n"
+        while not await request.is_disconnected():
+            if subscription.overflowed:
+                # Events were dropped, the client refetches its lists instead of trusting the feed
+                subscription.overflowed = False
+                yield "event: resync\ndata: {}\n\n"
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event.type.value}\ndata: {event.model_dump_json(exclude={'user_id'})}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@app.post("/events/ticket", tags=["events"], response_model=StreamTicket)
+async def order_events_ticket(token: str = Depends(oauth2_scheme), user: User = Depends(get_session)):
+    """Single-use ticket for /events/orders?ticket=..., keeps the access token out of the URL"""
+    claims = decode_jwt_token(token)
+    ticket = await issue_stream_ticket({key: claims.get(key) for key in ("sub", "ver", "fam")})
+    return StreamTicket(ticket=ticket, expires_in=STREAM_TICKET_SECONDS)
+
+
+@app.get("/events/orders", tags=["events"])
+async def order_events(request: Request, user: User = Depends(get_stream_session)):
+    """
+    Server-Sent Events feed of order changes, replaces polling the order lists.
+    Manufacturers get the unassigned pool and their own orders, customers their own orders.
+    Event names: created, assigned, rejected, status_changed, cancelled, left_pool and resync.
+    Open it with a ticket from POST /events/ticket; tickets are single-use, so a client reconnecting
+    after an error gets a new one first.
+    """
+    subscription = broker.subscribe(order_event_view(user))
+    return StreamingResponse(
+        order_event_stream(request, subscription),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -1,5 +1,5 @@
 from fastapi import HTTPException, Depends
-from typing import List
+from typing import Dict, List
 import logging
 from routes.authentication.auth_modules import get_session
 from app import app
@@ -7,7 +7,14 @@ from datetime import datetime
 from pydantic import BaseModel
 from models.user import User, UserRoles
 from crud.databases import orders, users
+from crud import async_databases
+from crud.codec import as_datetime, utcnow
+from modules.cache import TTLCache
+from crud.user import full_name, get_user_directory
+from modules.pagination import fetch_limit, keyset_query, keyset_sort, page_size, split_page
 from routes.order.models import *
+from routes.order import state_machine
+from routes.order.status import order_status
 
 from pydantic import BaseModel
 from datetime import datetime
@@ -44,6 +51,7 @@ class UnassignedOrdersResponse(BaseModel):
     count: int
     orders: List[OrderSummary]
     timestamp: datetime
+    next_cursor: str | None = None
 
 class RejectOrderResponse(BaseModel):
     success: bool
@@ -76,12 +84,17 @@ def extract_order_detail_fields(order_doc: dict) -> dict:
 
 
 @app.get("/manufacturer/unassigned_orders/", tags=["manufacturer"], response_model=UnassignedOrdersResponse)
-def get_unassigned_orders(user: User = Depends(get_session)):
+def get_unassigned_orders(
+    limit: int | None = None,
+    cursor: str | None = None,
+    user: User = Depends(get_session)
+):
     """
-    Get all orders that don't have a manufacturer assigned yet.
+    Get orders that don't have a manufacturer assigned yet, one page at a time.
     Only accessible by users with manufacturer role.
     Orders are sorted by order_received timestamp (newest to oldest).
     Excludes cancelled orders and orders rejected by current manufacturer.
+    Unpaged without a limit; with one, pass next_cursor back as cursor to get the next page.
     """
     
     # Check if user has manufacturer role
@@ -94,7 +107,9 @@ def get_unassigned_orders(user: User = Depends(get_session)):
     try:
         # Find orders where manufacturer_id is empty or doesn't exist
         # AND current user is NOT in rejected_manufacturers array
-        unassigned_orders_raw = list(orders.find({
+        limit = page_size(limit)
+        sort_field = "order_timing_table.order_received.timestamp"
+        query = keyset_query({
             "$and": [
                 {
                     "$or": [
@@ -110,32 +125,23 @@ def get_unassigned_orders(user: User = Depends(get_session)):
                     ]
                 }
             ]
-        }).sort("order_timing_table.order_received.timestamp", -1))
+        }, sort_field, cursor)
+        unassigned_orders_raw = list(orders.find(query).sort(keyset_sort(sort_field)).limit(fetch_limit(limit)))
+        unassigned_orders_raw, next_cursor = split_page(unassigned_orders_raw, limit, sort_field)
         
+        # Resolve every customer name with a single batched query
+        customers = get_user_directory(order.get("user_id") for order in unassigned_orders_raw)
+
         # Convert to summary format
         order_summaries = []
         for order_data in unassigned_orders_raw:
             try:
                 # Get user information
-                user_id = order_data.get("user_id", "")
-                customer_name = "Unknown"
-                
-                if user_id:
-                    user_doc = users.find_one({"id": user_id})
-                    if user_doc and "first_name" in user_doc:
-                        customer_name = f"{user_doc.get('first_name')} {user_doc.get('last_name')}"
+                customer_name = full_name(customers.get(order_data.get("user_id", "")))
                 
                 # Extract order received timestamp
-                order_received_date = None
-                if "order_timing_table" in order_data and order_data["order_timing_table"]:
-                    order_received = order_data["order_timing_table"].get("order_received")
-                    if order_received and "timestamp" in order_received:
-                        timestamp_str = order_received["timestamp"]
-                        # Parse timestamp if it's a string
-                        if isinstance(timestamp_str, str):
-                            order_received_date = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                        else:
-                            order_received_date = timestamp_str
+                timing_table = order_data.get("order_timing_table") or {}
+                order_received_date = as_datetime((timing_table.get("order_received") or {}).get("timestamp"))
                 
                 # Create summary
                 order_id = order_data.get("order_id", "")
@@ -144,7 +150,7 @@ def get_unassigned_orders(user: User = Depends(get_session)):
                 summary = OrderSummary(
                     order_id=order_id,
                     order_id_short=order_id[:8] if order_id else "",
-                    preview_id=order_data.get("preview_id", ""),
+                    preview_id=order_data.get("preview_id") or "",
                     order_received_date=order_received_date,
                     customer_name=customer_name,
                     is_cancelled=order_data.get("is_cancelled", False),
@@ -161,9 +167,12 @@ def get_unassigned_orders(user: User = Depends(get_session)):
             success=True,
             count=len(order_summaries),
             orders=order_summaries,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            next_cursor=next_cursor
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching unassigned orders: {str(e)}")
         raise HTTPException(
@@ -172,7 +181,7 @@ def get_unassigned_orders(user: User = Depends(get_session)):
         )
 
 @app.post("/manufacturer/reject_order/{order_id}", tags=["manufacturer"], response_model=RejectOrderResponse)
-def reject_order(order_id: str, user: User = Depends(get_session)):
+async def reject_order(order_id: str, user: User = Depends(get_session)):
     """
     Reject an order by adding current manufacturer to rejected_manufacturers list.
     Only accessible by users with manufacturer role.
@@ -186,53 +195,8 @@ def reject_order(order_id: str, user: User = Depends(get_session)):
         )
     
     try:
-        # Find the order
-        order = orders.find_one({"order_id": order_id})
-        
-        if not order:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Order {order_id} not found"
-            )
-        
-        # Check if order already has a manufacturer
-        if order.get("manufacturer_id") and order.get("manufacturer_id") != "":
-            raise HTTPException(
-                status_code=400,
-                detail="Cannot reject an order that already has a manufacturer assigned"
-            )
-        
-        # Check if order is cancelled
-        if order.get("is_cancelled"):
-            raise HTTPException(
-                status_code=400,
-                detail="Cannot reject a cancelled order"
-            )
-        
-        # Get current rejected_manufacturers list or create new one
-        rejected_manufacturers = order.get("rejected_manufacturers", [])
-        
-        # Check if user already rejected this order
-        if user.id in rejected_manufacturers:
-            raise HTTPException(
-                status_code=400,
-                detail="You have already rejected this order"
-            )
-        
-        # Add current user to rejected_manufacturers
-        rejected_manufacturers.append(user.id)
-        
-        # Update order
-        result = orders.update_one(
-            {"order_id": order_id},
-            {"$set": {"rejected_manufacturers": rejected_manufacturers}}
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to reject order"
-            )
+        # Unassigned, not cancelled and not yet rejected by this manufacturer, checked in one atomic update
+        await state_machine.reject(order_id, user.id)
         
         logging.info(f"Order {order_id} rejected by manufacturer {user.id}")
         
@@ -264,7 +228,7 @@ class AssignOrderResponse(BaseModel):
 
 
 @app.post("/manufacturer/assign_order/{order_id}", tags=["manufacturer"], response_model=AssignOrderResponse)
-def assign_order(order_id: str, user: User = Depends(get_session)):
+async def assign_order(order_id: str, user: User = Depends(get_session)):
     """
     Assign (adopt) an order to the current manufacturer.
     Sets the manufacturer_id field to current user's ID.
@@ -279,58 +243,8 @@ def assign_order(order_id: str, user: User = Depends(get_session)):
         )
     
     try:
-        # Check if order exists
-        order = orders.find_one({"order_id": order_id})
-        
-        if not order:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Order {order_id} not found"
-            )
-        
-        # Check if order is cancelled
-        if order.get("is_cancelled", False):
-            raise HTTPException(
-                status_code=400,
-                detail="Cannot assign a cancelled order"
-            )
-        
-        # Check if order is already assigned to another manufacturer
-        existing_manufacturer_id = order.get("manufacturer_id")
-        if existing_manufacturer_id and existing_manufacturer_id != "":
-            # If already assigned to same manufacturer
-            if existing_manufacturer_id == user.id:
-                raise HTTPException(
-                    status_code=400,
-                    detail="You have already adopted this order"
-                )
-            # If assigned to different manufacturer
-            raise HTTPException(
-                status_code=409,
-                detail="This order has already been assigned to another manufacturer"
-            )
-        
-        # Assign the order to current manufacturer and update timeline
-        result = orders.update_one(
-            {"order_id": order_id},
-            {
-                "$set": {
-                    "manufacturer_id": user.id,
-                    "last_updated": datetime.now().isoformat(),
-                    "order_timing_table.assigned_to_manufacturer": {
-                        "user_id": user.id,
-                        "timestamp": datetime.now().isoformat(),
-                        "status": "Assigned to Manufacturer"
-                    }
-                }
-            }
-        )
-
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to assign order"
-            )
+        # Only one manufacturer can adopt an order: the update matches while it is still unassigned
+        await state_machine.assign(order_id, user.id)
         
         logging.info(f"✅ Order {order_id} assigned to manufacturer {user.id}")
         
@@ -449,7 +363,7 @@ class AdoptedOrderSummary(BaseModel):
     order_id: str
     order_id_short: str
     preview_id: str
-    assigned_date: str | None
+    assigned_date: datetime | None
     customer_name: str
     is_cancelled: bool
     current_status: str
@@ -477,12 +391,21 @@ class AdoptedOrdersResponse(BaseModel):
     count: int
     orders: list[AdoptedOrderSummary]
     timestamp: datetime
+    next_cursor: str | None = None
 
 
 @app.get("/manufacturer/adopted_orders/", tags=["manufacturer"], response_model=AdoptedOrdersResponse)
-def get_adopted_orders(user: User = Depends(get_session)):
+def get_adopted_orders(
+    limit: int | None = None,
+    cursor: str | None = None,
+    status: OrderStatus | None = None,
+    user: User = Depends(get_session)
+):
     """
-    Get all orders that have been adopted (assigned) to the current manufacturer.
+    Get orders that have been adopted (assigned) to the current manufacturer, one page at a time.
+    Sorted by assigned date (most recent first). Unpaged without a limit; with one, pass next_cursor
+    back as cursor to get the next page.
+    Optionally filtered by status, e.g. ?status=Produced
     """
     
     # Check if user has manufacturer role
@@ -493,37 +416,30 @@ def get_adopted_orders(user: User = Depends(get_session)):
         )
     
     try:
-        # Find all orders assigned to this manufacturer that are not cancelled
-        assigned_orders = list(orders.find({
+        # Find one page of orders assigned to this manufacturer that are not cancelled
+        limit = page_size(limit)
+        sort_field = "order_timing_table.assigned_to_manufacturer.timestamp"
+        base_query = {
             "manufacturer_id": user.id,
             "is_cancelled": False
-        }))
+        }
+        if status:
+            base_query["status"] = status.value
+        query = keyset_query(base_query, sort_field, cursor)
+        assigned_orders = list(orders.find(query).sort(keyset_sort(sort_field)).limit(fetch_limit(limit)))
+        assigned_orders, next_cursor = split_page(assigned_orders, limit, sort_field)
         
         order_summaries = []
+        customers = get_user_directory(order.get("user_id") for order in assigned_orders)
         
         for order in assigned_orders:
             # Get customer info
-            customer_id = order.get("user_id", "")
-            customer_name = "Unknown"
-            
-            if customer_id:
-                customer = users.find_one({"id": customer_id})
-                if customer:
-                    customer_name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
+            customer_name = full_name(customers.get(order.get("user_id", "")))
             
             # Get assigned date from timing table
             timing_table = order.get("order_timing_table", {})
             assigned_entry = timing_table.get("assigned_to_manufacturer")
-            assigned_date = assigned_entry.get("timestamp") if assigned_entry else None
-            
-            # Determine current status (last non-null timing entry)
-            current_status = "Assigned to Manufacturer"
-            if timing_table.get("ready_to_take"):
-                current_status = "Ready to Take"
-            elif timing_table.get("produced"):
-                current_status = "Produced"
-            elif timing_table.get("started_manufacturing"):
-                current_status = "Started Manufacturing"
+            assigned_date = as_datetime(assigned_entry.get("timestamp")) if assigned_entry else None
             
             # Create short order ID (first 8 chars)
             order_id_full = order.get("order_id", "")
@@ -534,22 +450,15 @@ def get_adopted_orders(user: User = Depends(get_session)):
             order_summaries.append(AdoptedOrderSummary(
                 order_id=order_id_full,
                 order_id_short=order_id_short,
-                preview_id=order.get("preview_id", "default_preview"),
+                preview_id=order.get("preview_id") or "default_preview",
                 assigned_date=assigned_date,
                 customer_name=customer_name,
                 is_cancelled=order.get("is_cancelled", False),
-                current_status=current_status,
+                current_status=order_status(order)[0].value,
 
                 # ✅ yeni alanlar
                 **extra
             ))
-
-        
-        # Sort by assigned date (most recent first)
-        order_summaries.sort(
-            key=lambda x: x.assigned_date if x.assigned_date else "",
-            reverse=True
-        )
         
         logging.info(f"✅ Retrieved {len(order_summaries)} adopted orders for manufacturer {user.id}")
         
@@ -557,12 +466,166 @@ def get_adopted_orders(user: User = Depends(get_session)):
             success=True,
             count=len(order_summaries),
             orders=order_summaries,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            next_cursor=next_cursor
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"❌ Error fetching adopted orders for manufacturer {user.id}: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch adopted orders: {str(e)}"
         )
+
+
+# ==================== DASHBOARD SUMMARY ====================
+SUMMARY_TTL_SECONDS = 15
+IN_PROGRESS_STATUSES = [
+    OrderStatus.ASSIGNED_TO_MANUFACTURER.value,
+    OrderStatus.STARTED_MANUFACTURING.value,
+    OrderStatus.PRODUCED.value,
+]
+
+summary_cache = TTLCache(ttl=SUMMARY_TTL_SECONDS)
+
+
+class MaterialBreakdown(BaseModel):
+    material: str | None = None
+    order_type: str | None = None
+    count: int
+
+
+class InProgressTotals(BaseModel):
+    count: int = 0
+    estimated_weight: float = 0.0
+    estimated_revenue: float = 0.0
+
+
+class PoolSummary(BaseModel):
+    count: int = 0
+    oldest_waiting_seconds: float | None = None
+
+
+class ManufacturerSummaryResponse(BaseModel):
+    success: bool
+    by_status: Dict[str, int]
+    by_material: List[MaterialBreakdown]
+    in_progress: InProgressTotals
+    pool: PoolSummary
+    timestamp: datetime
+
+
+def _timestamp_of_type(bson_type: str) -> dict:
+    timestamp = "$order_timing_table.order_received.timestamp"
+    return {"$cond": [{"$eq": [{"$type": timestamp}, bson_type]}, timestamp, None]}
+
+
+def manufacturer_summary_pipeline(manufacturer_id: str) -> list:
+    pool_match = {
+        "$and": [
+            state_machine.UNASSIGNED,
+            state_machine.NOT_CANCELLED,
+            {"rejected_manufacturers": {"$ne": manufacturer_id}},
+        ]
+    }
+    return [
+        # Own orders and the visible pool, both served by manufacturer_id prefixed indexes
+        {"$match": {"$or": [{"manufacturer_id": manufacturer_id}, pool_match]}},
+        {"$facet": {
+            "by_status": [
+                {"$match": {"manufacturer_id": manufacturer_id}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            ],
+            "by_material": [
+                {"$match": {"manufacturer_id": manufacturer_id, "is_cancelled": {"$ne": True}}},
+                {"$group": {
+                    "_id": {"material": "$order_detail.material", "order_type": "$order_type"},
+                    "count": {"$sum": 1},
+                }},
+                {"$sort": {"count": -1}},
+            ],
+            "in_progress": [
+                {"$match": {"manufacturer_id": manufacturer_id, "status": {"$in": IN_PROGRESS_STATUSES}}},
+                {"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "estimated_weight": {"$sum": "$estimations.estimated_weight"},
+                    "estimated_revenue": {"$sum": "$estimations.estimated_cost"},
+                }},
+            ],
+            "pool": [
+                {"$match": pool_match},
+                {"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    # $min ranks strings below dates, legacy string timestamps get their own minimum
+                    "oldest": {"$min": _timestamp_of_type("date")},
+                    "oldest_legacy": {"$min": _timestamp_of_type("string")},
+                }},
+            ],
+        }},
+    ]
+
+
+def build_manufacturer_summary(facets: dict) -> ManufacturerSummaryResponse:
+    in_progress = (facets.get("in_progress") or [{}])[0]
+    pool = (facets.get("pool") or [{}])[0]
+    # Unparseable legacy values are skipped rather than failing the summary
+    oldest = min(
+        filter(None, (as_datetime(pool.get("oldest")), as_datetime(pool.get("oldest_legacy")))),
+        default=None,
+    )
+
+    return ManufacturerSummaryResponse(
+        success=True,
+        by_status={row["_id"]: row["count"] for row in facets.get("by_status", []) if row["_id"]},
+        by_material=[
+            MaterialBreakdown(count=row["count"], **row["_id"])
+            for row in facets.get("by_material", [])
+        ],
+        in_progress=InProgressTotals(
+            count=in_progress.get("count", 0),
+            estimated_weight=round(in_progress.get("estimated_weight", 0.0), 2),
+            estimated_revenue=round(in_progress.get("estimated_revenue", 0.0), 2),
+        ),
+        pool=PoolSummary(
+            count=pool.get("count", 0),
+            oldest_waiting_seconds=(utcnow() - oldest).total_seconds() if oldest else None,
+        ),
+        timestamp=datetime.now(),
+    )
+
+
+@app.get("/manufacturer/summary", tags=["manufacturer"], response_model=ManufacturerSummaryResponse)
+async def get_manufacturer_summary(user: User = Depends(get_session)):
+    """
+    Dashboard numbers of the current manufacturer in one response: counts by status,
+    breakdown by material and order type, in-progress weight and revenue, and the unassigned pool.
+    Computed by a single aggregation and cached for a few seconds per manufacturer.
+    """
+    
+    # Check if user has manufacturer role
+    if user.role != UserRoles.manufacturer:
+        raise HTTPException(
+            status_code=403,
+            detail="Insufficient permissions. Only manufacturers can view the summary."
+        )
+    
+    cached = summary_cache.get(user.id)
+    if cached:
+        return cached
+    
+    try:
+        facets = await async_databases.orders.aggregate(manufacturer_summary_pipeline(user.id)).to_list(length=1)
+        summary = build_manufacturer_summary(facets[0] if facets else {})
+        summary_cache.set(user.id, summary)
+        return summary
+        
+    except Exception as e:
+        logging.error(f"❌ Error building summary for manufacturer {user.id}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to build summary: {str(e)}"
+        )
@@ -0,0 +1,125 @@
+import csv
+import io
+import zipfile
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional
+from bson import ObjectId
+from crud.async_databases import fs
+from routes.manifacturer_pool.routes import extract_order_detail_fields
+
+MANIFEST_FIELDS = [
+    "order_id",
+    "order_number",
+    "file_name",
+    "file_status",
+    "preview_name",
+    "order_type",
+    "quantity",
+    "material",
+    "brand",
+    "color",
+    "layer_height",
+    "infill",
+    "nozzle_size",
+    "bottom_texture",
+    "resin_type",
+    "uv_curing",
+    "notes",
+]
+
+
+class ZipStreamSink(io.RawIOBase):
+    """Unseekable sink for zipfile; written bytes are collected until drained."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _write_grid_file(
+    archive: zipfile.ZipFile, sink: ZipStreamSink, name: str, grid_out
+) -> AsyncIterator[bytes]:
+    """Copy a GridFS file into the archive chunk by chunk"""
+    info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    force_zip64 = grid_out.length >= zipfile.ZIP64_LIMIT
+
+    with archive.open(info, mode="w", force_zip64=force_zip64) as entry:
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            entry.write(chunk)
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def _open_grid_file(file_id: Optional[str]):
+    if not file_id:
+        return None
+    try:
+        return await fs.open_download_stream(ObjectId(file_id))
+    except Exception:
+        return None
+
+
+def build_manifest_csv(rows: Iterable[dict]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MANIFEST_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def stream_orders_zip(order_docs: AsyncIterable[dict], include_previews: bool = False) -> AsyncIterator[bytes]:
+    """
+    Build a ZIP archive on the fly from GridFS chunks.
+    Nothing is staged on disk; only the current chunk and the manifest rows stay in memory.
+    """
+    sink = ZipStreamSink()
+    manifest_rows = []
+
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for order in order_docs:
+            order_id = order.get("order_id", "")
+            order_number = order_id[:8].upper()
+            row = {
+                "order_id": order_id,
+                "order_number": "#" + order_number,
+                "notes": order.get("notes", ""),
+                **extract_order_detail_fields(order),
+            }
+
+            grid_out = await _open_grid_file(order.get("file_id"))
+            if grid_out:
+                row["file_name"] = f"{order_number}/order_{order_id}.stl"
+                row["file_status"] = "ok"
+                async for data in _write_grid_file(archive, sink, row["file_name"], grid_out):
+                    yield data
+            else:
+                row["file_name"] = ""
+                row["file_status"] = "missing"
+
+            if include_previews:
+                preview_out = await _open_grid_file(order.get("preview_id"))
+                if preview_out:
+                    row["preview_name"] = f"{order_number}/preview.png"
+                    async for data in _write_grid_file(archive, sink, row["preview_name"], preview_out):
+                        yield data
+
+            manifest_rows.append(row)
+
+        archive.writestr("manifest.csv", build_manifest_csv(manifest_rows))
+
+    yield sink.drain()
@@ -5,12 +5,17 @@ from models.user import User, UserRoles
 from routes.authentication.auth_modules import get_session
 from app import app
 from routes.order.models import *
-from crud.databases import orders, fs
-import uuid, io
+from crud.async_databases import orders, fs, users
+import uuid
 from bson import ObjectId
 from datetime import datetime
-from typing import Optional
-from routes.order.models import *
+from typing import List, Optional
+from routes.manifacturer_process.modules import stream_orders_zip
+from routes.order import state_machine
+from crud.codec import as_datetime, utcnow
+from crud.customer_stats import get_customer_stats_async
+from crud.archive import find_order_async
+from crud.media import MediaKind, media_document, register_media_async, resolve_media_async, stream_media_async, iter_grid_out_async
 
 # Color to Hex mapping dictionary
 COLOR_HEX_MAP: Dict[str, str] = {
@@ -49,7 +54,7 @@ async def get_order_details(
         raise HTTPException(status_code=403, detail="Only manufacturers can access this endpoint")
 
     # Find order (explicitly exclude rejected_manufacturers)
-    order = orders.find_one({"order_id": order_id}, {"rejected_manufacturers": 0})
+    order = await find_order_async({"order_id": order_id}, {"rejected_manufacturers": 0})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
@@ -58,16 +63,13 @@ async def get_order_details(
         raise HTTPException(status_code=403, detail="You are not assigned to this order")
 
     # Get customer info
-    from crud.databases import users
-    customer = users.find_one({"id": order["user_id"]})
+    customer = await users.find_one({"id": order["user_id"]})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    # Count customer's previous completed orders
-    order_history_count = orders.count_documents({
-        "user_id": order["user_id"],
-        "order_timing_table.ready_to_take": {"$exists": True}
-    })
+    # Customer's completed orders, kept up to date by finalize
+    customer_stats = await get_customer_stats_async(order["user_id"])
+    order_history_count = customer_stats["completed"]
 
     # Initials
     name_parts = customer.get("name", "Unknown User").split()
@@ -87,7 +89,7 @@ async def get_order_details(
     # Convenience dicts (JSON-safe)
     order_json = order_form.model_dump(mode="json")
     order_detail = order_json.get("order_detail", {})
-    timing_table = order_json.get("order_timing_table", {}) or {}
+    timing_table = order_clean.get("order_timing_table", {}) or {}
 
     # Material label
     material_label = f"{order_detail.get('material', 'N/A')} ({order_json.get('order_type', 'N/A')})"
@@ -104,23 +106,12 @@ async def get_order_details(
     steps = []
     for idx, (key, label) in enumerate(step_mapping, 1):
         entry = timing_table.get(key)
+        # Legacy entries may still hold ISO strings
+        timestamp = as_datetime(entry.get("timestamp")) if entry else None
 
-        if entry and entry.get("timestamp"):
-            ts = entry["timestamp"]
-            # entry["timestamp"] can be str or datetime-like
-            if isinstance(ts, str):
-                try:
-                    ts_obj = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                except ValueError:
-                    try:
-                        ts_obj = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%f")
-                    except ValueError:
-                        ts_obj = None
-            else:
-                ts_obj = ts
-
-            date_str = ts_obj.strftime("%B %d, %Y, %H:%M") if ts_obj else "-"
-            completed = True if ts_obj else False
+        if timestamp:
+            date_str = timestamp.strftime("%B %d, %Y, %H:%M")
+            completed = True
         else:
             date_str = "-"
             completed = False
@@ -133,19 +124,8 @@ async def get_order_details(
         })
 
     # ---- Order date formatting ----
-    order_date = (timing_table.get("order_received") or {}).get("timestamp")
-    if isinstance(order_date, str):
-        try:
-            order_date_obj = datetime.fromisoformat(order_date.replace("Z", "+00:00"))
-        except ValueError:
-            try:
-                order_date_obj = datetime.strptime(order_date, "%Y-%m-%dT%H:%M:%S.%f")
-            except ValueError:
-                order_date_obj = None
-    else:
-        order_date_obj = order_date if order_date else None
-
-    formatted_date = order_date_obj.strftime("%b %d, %Y") if order_date_obj else datetime.now().strftime("%b %d, %Y")
+    order_date = as_datetime((timing_table.get("order_received") or {}).get("timestamp")) or utcnow()
+    formatted_date = order_date.strftime("%b %d, %Y")
 
     # ---- Finalization (if exists) ----
     finalization = None
@@ -239,28 +219,8 @@ async def start_production(
     if user.role != UserRoles.manufacturer:
         raise HTTPException(status_code=403, detail="Only manufacturers can start production")
     
-    order = orders.find_one({"order_id": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.get("manufacturer_id") != user.id:
-        raise HTTPException(status_code=403, detail="Not your order")
-    
-    # Check if already started
-    if order.get("order_timing_table", {}).get("started_manufacturing"):
-        raise HTTPException(status_code=400, detail="Production already started")
-    
-    # Update timing table
-    timing_entry = OrderTimingEntry(
-        user_id=user.id,
-        timestamp=datetime.now(),
-        status=OrderStatus.STARTED_MANUFACTURING
-    )
-    
-    orders.update_one(
-        {"order_id": order_id},
-        {"$set": {"order_timing_table.started_manufacturing": timing_entry.model_dump(mode='json')}}
-    )
+    # Ownership and "not started yet" are checked by the update itself
+    await state_machine.start_production(order_id, user.id)
     
     return {"success": True, "message": "Production started successfully"}
 
@@ -276,32 +236,8 @@ async def complete_production(
     if user.role != "manufacturer":
         raise HTTPException(status_code=403, detail="Only manufacturers can complete production")
     
-    order = orders.find_one({"order_id": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.get("manufacturer_id") != user.id:
-        raise HTTPException(status_code=403, detail="Not your order")
-    
-    # Check if production was started
-    if not order.get("order_timing_table", {}).get("started_manufacturing"):
-        raise HTTPException(status_code=400, detail="Production not started yet")
-    
-    # Check if already completed
-    if order.get("order_timing_table", {}).get("produced"):
-        raise HTTPException(status_code=400, detail="Production already completed")
-    
-    # Update timing table
-    timing_entry = OrderTimingEntry(
-        user_id=user.id,
-        timestamp=datetime.now(),
-        status=OrderStatus.PRODUCED
-    )
-    
-    orders.update_one(
-        {"order_id": order_id},
-        {"$set": {"order_timing_table.produced": timing_entry.model_dump(mode='json')}}
-    )
+    # Ownership, "started" and "not produced yet" are checked by the update itself
+    await state_machine.complete_production(order_id, user.id)
     
     return {"success": True, "message": "Production completed successfully"}
 
@@ -318,7 +254,7 @@ async def upload_product_image(
     if user.role != "manufacturer":
         raise HTTPException(status_code=403, detail="Only manufacturers can upload images")
     
-    order = orders.find_one({"order_id": order_id})
+    order = await orders.find_one({"order_id": order_id})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -336,25 +272,35 @@ async def upload_product_image(
     image_data = await image.read()
     file_extension = image.filename.split('.')[-1] if '.' in image.filename else 'jpg'
     
-    gridfs_id = fs.put(
+    gridfs_id = await fs.upload_from_stream(
+        f"product_{order_id}_{file_id}.{file_extension}",
         image_data,
-        filename=f"product_{order_id}_{file_id}.{file_extension}",
-        content_type=image.content_type,
         metadata={
             "file_id": file_id,
             "order_id": order_id,
             "uploaded_by": user.id,
-            "uploaded_at": datetime.utcnow()
+            "uploaded_at": utcnow(),
+            "contentType": image.content_type,
         }
     )
+    await register_media_async(media_document(
+        file_id,
+        gridfs_id,
+        MediaKind.product_image,
+        content_type=image.content_type,
+        length=len(image_data),
+        filename=f"product_{order_id}_{file_id}.{file_extension}",
+        owner_id=user.id,
+        order_id=order_id,
+    ))
     
     # Update order with file_id
-    orders.update_one(
+    await orders.update_one(
         {"order_id": order_id},
         {
             "$set": {
                 "product_file_id": file_id,
-                "product_image_uploaded_at": datetime.utcnow()
+                "product_image_uploaded_at": utcnow()
             }
         }
     )
@@ -372,7 +318,7 @@ async def download_product_image(
 ):
     """Download product image as attachment"""
     
-    order = orders.find_one({"order_id": order_id})
+    order = await find_order_async({"order_id": order_id})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -386,16 +332,16 @@ async def download_product_image(
     if not file_id:
         raise HTTPException(status_code=404, detail="Product image not found")
     
-    grid_out = fs.find_one({"metadata.file_id": file_id})
-    if not grid_out:
+    media_entry = await resolve_media_async(file_id)
+    if not media_entry:
         raise HTTPException(status_code=404, detail="File not found")
     
     # attachment yerine inline kullanırsak tarayıcıda açılır
     return StreamingResponse(
-        io.BytesIO(grid_out.read()),
-        media_type=grid_out.content_type,
+        stream_media_async(media_entry),
+        media_type=media_entry.get("content_type"),
         headers={
-            "Content-Disposition": f"attachment; filename={grid_out.filename}"
+            "Content-Disposition": f"attachment; filename={media_entry.get('filename')}"
         }
     )
 
@@ -418,51 +364,29 @@ async def finalize_order(
     if user.role != "manufacturer":
         raise HTTPException(status_code=403, detail="Only manufacturers can finalize orders")
     
-    order = orders.find_one({"order_id": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.get("manufacturer_id") != user.id:
-        raise HTTPException(status_code=403, detail="Not your order")
-    
-    # Check if production is completed
-    if not order.get("order_timing_table", {}).get("produced"):
-        raise HTTPException(status_code=400, detail="Production must be completed first")
-    
-    # Update order with finalization data
-    timing_entry = OrderTimingEntry(
-        user_id=user.id,
-        timestamp=datetime.now(),
-        status=OrderStatus.READY_TO_TAKE
-    )
-    
-    orders.update_one(
-        {"order_id": order_id},
-        {"$set": {
-            "manufacturer_notes": data.notes_to_customer,
-            "delivery_address": data.delivery_address,
-            "actual_filament_usage": data.filament_usage,
-            "final_price": data.final_price,
-            "order_timing_table.ready_to_take": timing_entry.model_dump(mode='json')
-        }}
-    )
+    # Ownership and "produced" are checked by the update itself
+    await state_machine.finalize(order_id, user.id, {
+        "manufacturer_notes": data.notes_to_customer,
+        "delivery_address": data.delivery_address,
+        "actual_filament_usage": data.filament_usage,
+        "final_price": data.final_price,
+    })
     
     return {"success": True, "message": "Order finalized successfully"}
 
 
 # ==================== DOWNLOAD FILE ====================
 @app.get("/manufacturer/order/{order_id}/download_file")
-def download_order_file(
+async def download_order_file(
     order_id: str,
     user: User = Depends(get_session)
 ):
     """Download the STL file for the order"""
-    from fastapi.responses import StreamingResponse
     
     if user.role != UserRoles.manufacturer:
         raise HTTPException(status_code=403, detail="Only manufacturers can download files")
     
-    order = orders.find_one({"order_id": order_id})
+    order = await orders.find_one({"order_id": order_id})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -472,10 +396,10 @@ def download_order_file(
     # Get file from GridFS
     try:
         file_id = ObjectId(order["file_id"])
-        grid_out = fs.get(file_id)
+        grid_out = await fs.open_download_stream(file_id)
         
         return StreamingResponse(
-            io.BytesIO(grid_out.read()),
+            iter_grid_out_async(grid_out),
             media_type="application/octet-stream",
             headers={
                 "Content-Disposition": f"attachment; filename=order_{order_id}.stl"
@@ -483,3 +407,60 @@ def download_order_file(
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error downloading file: {str(e)}")
+
+
+# ==================== DOWNLOAD FILES AS ZIP ====================
+class OrderArchiveRequest(BaseModel):
+    order_ids: List[str] = []
+    all_started: bool = False
+    include_previews: bool = False
+
+@app.post("/manufacturer/orders/download_zip")
+async def download_orders_zip(
+    data: OrderArchiveRequest,
+    user: User = Depends(get_session)
+):
+    """Stream the STL files (and optionally previews) of several orders as one ZIP with a CSV manifest"""
+
+    if user.role != UserRoles.manufacturer:
+        raise HTTPException(status_code=403, detail="Only manufacturers can download files")
+
+    query = {"manufacturer_id": user.id, "is_cancelled": {"$ne": True}}
+    if data.all_started:
+        query["order_timing_table.started_manufacturing"] = {"$ne": None}
+        query["order_timing_table.produced"] = None
+    elif data.order_ids:
+        query["order_id"] = {"$in": data.order_ids}
+    else:
+        raise HTTPException(status_code=400, detail="Provide order_ids or set all_started")
+
+    # Validate the selection before streaming starts, errors cannot be reported mid-stream
+    found_ids = set(await orders.distinct("order_id", query))
+    if not found_ids:
+        raise HTTPException(status_code=404, detail="No orders to download")
+
+    missing_ids = [order_id for order_id in data.order_ids if order_id not in found_ids]
+    if not data.all_started and missing_ids:
+        raise HTTPException(status_code=404, detail=f"Orders not found or not yours: {', '.join(missing_ids)}")
+
+    order_docs = orders.find(
+        query,
+        {
+            "order_id": 1,
+            "file_id": 1,
+            "preview_id": 1,
+            "notes": 1,
+            "order_type": 1,
+            "quantity": 1,
+            "order_detail": 1,
+        },
+    ).sort("order_timing_table.order_received.timestamp", 1)
+
+    archive_name = f"orders_{datetime.now().strftime('%Y%m%d_%H%M')}.zip"
+    return StreamingResponse(
+        stream_orders_zip(order_docs, include_previews=data.include_previews),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={archive_name}"
+        }
+    )
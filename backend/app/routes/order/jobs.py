@@ -0,0 +1,52 @@
+"""
+Geometry jobs run by worker.py. Handlers take the job payload and return the job result.
+"""
+from bson import ObjectId
+from gridfs import GridFSBucket
+from crud.databases import db, orders
+from crud.media import MediaKind, add_media_variant, media_document, register_media
+from routes.order.modules import stl_to_png_bytes
+
+RENDER_PREVIEW = "render_preview"
+
+
+def render_preview(payload: dict) -> dict:
+    """Render the PNG preview of an uploaded STL, then link it to the model and to orders already placed with it"""
+    file_id = payload["file_id"]
+    owner_id = payload.get("owner_id", "")
+    bucket = GridFSBucket(db)
+
+    stl_content = bucket.open_download_stream(ObjectId(file_id)).read()
+    png_bytes = stl_to_png_bytes(stl_content)
+    if not png_bytes:
+        raise RuntimeError(f"Rendering {file_id} produced no image")
+
+    filename = f"preview_{file_id}.png"
+    preview_id = bucket.upload_from_stream(
+        filename,
+        png_bytes,
+        metadata={
+            "type": "preview",
+            "original_file_id": file_id,
+            "user_id": owner_id,
+            "contentType": "image/png",
+        },
+    )
+    register_media(media_document(
+        str(preview_id),
+        preview_id,
+        MediaKind.preview,
+        content_type="image/png",
+        length=len(png_bytes),
+        filename=filename,
+        owner_id=owner_id,
+    ))
+    add_media_variant(file_id, "preview", str(preview_id))
+    # The customer may have placed the order before the preview was ready
+    orders.update_many({"file_id": file_id, "preview_id": None}, {"$set": {"preview_id": str(preview_id)}})
+    return {"preview_id": str(preview_id)}
+
+
+JOB_HANDLERS = {
+    RENDER_PREVIEW: render_preview,
+}
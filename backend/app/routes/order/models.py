@@ -73,6 +73,7 @@ class OrderStatus(Enum):
     STARTED_MANUFACTURING = "Started Manufacturing"
     PRODUCED = "Produced"
     READY_TO_TAKE = "Ready to Take"
+    CANCELLED = "Cancelled"
 
 class OrderTimingEntry(BaseModel):
     user_id: str
@@ -99,6 +100,9 @@ class OrderFormMain(BaseModel):
     preview_id: str | None = None
     manufacturer_id: str = ""
     is_cancelled: bool = False
+    status: OrderStatus = OrderStatus.ORDER_RECEIVED
+    current_step: int = 1
+    last_updated: datetime | None = None
 
 
 # ==================== PRICING CONFIGURATION ====================
@@ -1,10 +1,29 @@
-import trimesh
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import io
-import numpy as np
+
+# The geometry stack (trimesh, matplotlib, numpy-stl) costs seconds of import time and 100+ MB
+# per worker, so it is imported on first use instead of when the routes are registered.
+
+
+def calculate_volume_from_stl(file_content: bytes) -> dict:
+    """Calculate volume from STL file"""
+    from stl import mesh
+
+    try:
+        stl_mesh = mesh.Mesh.from_file('temp', fh=io.BytesIO(file_content))
+        volume, cog, inertia = stl_mesh.get_mass_properties()
+        volume_cm3 = volume / 1000
+        
+        return {
+            "volume_mm3": round(volume, 2),
+            "volume_cm3": round(volume_cm3, 2)
+        }
+    except Exception as e:
+        print(f"Volume calculation error: {e}")
+        return {
+            "volume_mm3": 0,
+            "volume_cm3": 0
+        }
+
 
 def stl_to_png_bytes(
     stl_content: bytes,
@@ -14,6 +33,13 @@ def stl_to_png_bytes(
     """
     STL rendering with bg-neutral-800/50 background (Tailwind color)
     """
+    import numpy as np
+    import trimesh
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+
     try:
         # Load mesh
         mesh = trimesh.load(
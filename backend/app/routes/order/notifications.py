@@ -0,0 +1,24 @@
+import logging
+from os import getenv
+from crud import async_databases
+from crud.outbox import enqueue_email_async
+
+
+async def notify_order_ready(order: dict) -> None:
+    """Queue the 'ready to take' e-mail for the customer; never fails the transition itself"""
+    try:
+        customer = await async_databases.users.find_one({"id": order["user_id"]}, {"email": 1, "first_name": 1})
+        if not customer or not customer.get("email"):
+            return
+        short_id = order["order_id"][:8]
+        await enqueue_email_async(
+            receivers=[customer["email"]],
+            subject=f"{getenv('HELPER_EMAIL_APP_NAME', '')} - Order {short_id} is ready",
+            html=f"""
+                <h1>Hi {customer.get('first_name', '')}, your order {short_id} is ready to take.</h1>
+                <a href="{getenv('APP_URI', '')}/order" target="_blank">{getenv('APP_URI', '')}/order</a>
+            """,
+            kind="order_ready",
+        )
+    except Exception as e:
+        logging.error(f"Failed to queue the ready notification for {order.get('order_id', 'unknown')}: {str(e)}")
@@ -1,33 +1,21 @@
 from fastapi import Depends, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from models.user import User
 from routes.authentication.auth_modules import get_session
 from app import app
-from stl import mesh
 from routes.order.models import *
-from routes.order.modules import stl_to_png_bytes  
-from crud.databases import orders, fs
+from routes.order.modules import calculate_volume_from_stl, stl_to_png_bytes
+from crud.codec import to_document, utcnow
+from modules.events import OrderEventType, publish_order_event
+from crud.order_stats import created_counters, record_order_stats
+from crud.archive import find_order_async
+from crud.jobs import enqueue_job_async, get_job_async
+from modules.config import config
+from routes.order.jobs import RENDER_PREVIEW
+from crud.async_databases import orders, fs
+from crud.media import MediaKind, media_document, register_media_async, resolve_media_async, stream_media_async
 import uuid
-import io
 from bson import ObjectId
-from datetime import datetime
-
-def calculate_volume_from_stl(file_content: bytes) -> dict:
-    """Calculate volume from STL file"""
-    try:
-        stl_mesh = mesh.Mesh.from_file('temp', fh=io.BytesIO(file_content))
-        volume, cog, inertia = stl_mesh.get_mass_properties()
-        volume_cm3 = volume / 1000
-        
-        return {
-            "volume_mm3": round(volume, 2),
-            "volume_cm3": round(volume_cm3, 2)
-        }
-    except Exception as e:
-        print(f"Volume calculation error: {e}")
-        return {
-            "volume_mm3": 0,
-            "volume_cm3": 0
-        }
 
 @app.post("/order/upload-file")
 async def upload_file_route(
@@ -48,41 +36,59 @@ async def upload_file_route(
     try:
         file_content = await file.read()
         
-        # Calculate volume for STL files
+        # Calculate volume for STL files (CPU bound, kept off the event loop)
         file_metadata = {}
         if file_extension == '.stl':
-            file_metadata = calculate_volume_from_stl(file_content)
+            file_metadata = await run_in_threadpool(calculate_volume_from_stl, file_content)
         
         # Upload original file to GridFS
-        file_id = fs.put(
+        file_id = await fs.upload_from_stream(
+            file.filename,
             file_content,
-            filename=file.filename,
+            metadata={
+                **file_metadata,
+                "user_id": str(user.id),
+                "contentType": file.content_type,
+            }
+        )
+        model_entry = media_document(
+            str(file_id),
+            file_id,
+            MediaKind.model,
             content_type=file.content_type,
-            user_id=str(user.id),
-            upload_date=datetime.now(),
-            metadata=file_metadata
+            length=len(file_content),
+            filename=file.filename,
+            owner_id=str(user.id),
         )
         
         # Generate preview image from STL file
         preview_id = None
-        if file_extension == '.stl':
+        if file_extension == '.stl' and not config.geometry_worker:
             try:
                 # Generate PNG preview
-                png_bytes = stl_to_png_bytes(file_content)
+                png_bytes = await run_in_threadpool(stl_to_png_bytes, file_content)
                 
                 if png_bytes:
                     # Upload preview to GridFS with original_file_id reference
-                    preview_id = fs.put(
+                    preview_id = await fs.upload_from_stream(
+                        f"preview_{file_id}.png",
                         png_bytes,
-                        filename=f"preview_{file_id}.png",
-                        content_type="image/png",
-                        user_id=str(user.id),
-                        upload_date=datetime.now(),
                         metadata={
                             "type": "preview",
-                            "original_file_id": str(file_id)  # ✅ File ID kaydediliyor
+                            "original_file_id": str(file_id),  # ✅ File ID kaydediliyor
+                            "user_id": str(user.id),
+                            "contentType": "image/png",
                         }
                     )
+                    await register_media_async(media_document(
+                        str(preview_id),
+                        preview_id,
+                        MediaKind.preview,
+                        content_type="image/png",
+                        length=len(png_bytes),
+                        filename=f"preview_{file_id}.png",
+                        owner_id=str(user.id),
+                    ))
                     preview_id = str(preview_id)
                     print(f"Preview generated successfully: {preview_id}")
                     
@@ -90,11 +96,21 @@ async def upload_file_route(
                 print(f"Preview generation error: {preview_error}")
                 import traceback
                 traceback.print_exc()
+
+        await register_media_async(model_entry, variants={"preview": preview_id} if preview_id else None)
+
+        # With the geometry worker the preview is rendered later, clients poll /order/jobs/{id}
+        preview_job_id = None
+        if file_extension == '.stl' and config.geometry_worker:
+            preview_job_id = await enqueue_job_async(
+                RENDER_PREVIEW, {"file_id": str(file_id), "owner_id": str(user.id)}
+            )
         
         return {
             "success": True,
             "file_id": str(file_id),
             "preview_id": preview_id,
+            "preview_job_id": preview_job_id,
             "filename": file.filename,
             "message": "File uploaded successfully",
             "file_info": file_metadata
@@ -116,7 +132,7 @@ async def new_order_route(
         # Verify file exists
         try:
             file_obj_id = ObjectId(order_data.file_id)
-            file_data = fs.get(file_obj_id)
+            file_data = await fs.open_download_stream(file_obj_id)
         except Exception as file_error:
             print(f"File retrieval error: {file_error}")
             raise HTTPException(status_code=404, detail="File not found in database")
@@ -130,17 +146,13 @@ async def new_order_route(
         if volume_cm3 == 0:
             raise HTTPException(status_code=400, detail="File volume data not found. Please upload a valid STL file.")
         
-        # ✅ Find preview_id from GridFS using file_id
+        # ✅ Find preview_id through the media index entry of the uploaded file
         preview_id = None
         try:
-            # GridFS'te original_file_id metadata'sı ile preview'i ara
-            preview_file = fs.find_one({
-                "metadata.original_file_id": order_data.file_id,
-                "metadata.type": "preview"
-            })
+            model_entry = await resolve_media_async(order_data.file_id)
+            preview_id = ((model_entry or {}).get("variants") or {}).get("preview")
             
-            if preview_file:
-                preview_id = str(preview_file._id)
+            if preview_id:
                 print(f"Preview found for file_id {order_data.file_id}: {preview_id}")
             else:
                 print(f"No preview found for file_id {order_data.file_id}")
@@ -171,7 +183,7 @@ async def new_order_route(
         # Create initial timing entry for ORDER_RECEIVED status
         initial_timing_entry = OrderTimingEntry(
             user_id=str(user.id),
-            timestamp=datetime.now(),
+            timestamp=utcnow(),
             status=OrderStatus.ORDER_RECEIVED
         )
         
@@ -191,14 +203,17 @@ async def new_order_route(
             quantity=order_data.quantity,          # ✅ ekle    
             order_detail=order_data.order_detail,
             order_timing_table=timing_table,
-            preview_id=preview_id  # ✅ Otomatik bulunan preview_id
+            preview_id=preview_id,  # ✅ Otomatik bulunan preview_id
+            last_updated=initial_timing_entry.timestamp
         )
 
-        # Convert to dict and handle enum serialization
-        order_dict = order_form_main.model_dump(mode='json')
+        # Convert to dict, enums become values and timestamps stay BSON dates
+        order_dict = to_document(order_form_main)
         
         # Insert into database
-        result = orders.insert_one(order_dict)
+        result = await orders.insert_one(order_dict)
+        publish_order_event(OrderEventType.created, order_dict)
+        await record_order_stats(order_dict, created_counters(order_dict), order_dict["last_updated"])
         
         print(f"Order created successfully: {order_form_main.order_id}")
             
@@ -236,7 +251,7 @@ async def calculate_estimation_route(
     try:
         # Get file from GridFS
         file_obj_id = ObjectId(request.file_id)
-        file_data = fs.get(file_obj_id)
+        file_data = await fs.open_download_stream(file_obj_id)
         
         if not hasattr(file_data, 'metadata') or not file_data.metadata:
             raise HTTPException(status_code=400, detail="File metadata not found. Please upload an STL file.")
@@ -270,6 +285,20 @@ async def calculate_estimation_route(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Estimation failed: {str(e)}")
 
+@app.get("/order/jobs/{job_id}")
+async def get_job_status(job_id: str, user: User = Depends(get_session)):
+    """Status of a background geometry job started by one of the user's uploads"""
+    job = await get_job_async(job_id)
+    if not job or job["payload"].get("owner_id") != str(user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job_id,
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job.get("result"),
+    }
+
 @app.get("/order/preview/{preview_id}")
 async def get_preview_image(
     preview_id: str,
@@ -279,19 +308,20 @@ async def get_preview_image(
     try:
         from fastapi.responses import StreamingResponse
         
-        preview_obj_id = ObjectId(preview_id)
-        preview_data = fs.get(preview_obj_id)
+        preview_entry = await resolve_media_async(preview_id)
+        if not preview_entry:
+            raise HTTPException(status_code=404, detail="Preview not found")
         
         # ✅ Role-based access control
         if user.role == "user":
             # User sadece kendi preview'larına erişebilir
-            if hasattr(preview_data, 'user_id') and preview_data.user_id != str(user.id):
+            if preview_entry.get("owner_id") and preview_entry["owner_id"] != str(user.id):
                 raise HTTPException(status_code=403, detail="Access denied")
         
         elif user.role == "manufacturer":
             # ✅ Manufacturer sadece unassigned (manufacturer = "") order'lara erişebilir
             # Preview'ın hangi order'a ait olduğunu bul
-            order = orders.find_one({"preview_id": preview_id})
+            order = await find_order_async({"preview_id": preview_id})
             
             if not order:
                 raise HTTPException(status_code=404, detail="Order not found for this preview")
@@ -301,8 +331,8 @@ async def get_preview_image(
                 raise HTTPException(status_code=403, detail="This order is already assigned to another manufacturer")
         
         return StreamingResponse(
-            io.BytesIO(preview_data.read()),
-            media_type="image/png"
+            stream_media_async(preview_entry),
+            media_type=preview_entry.get("content_type", "image/png")
         )
         
     except HTTPException:
@@ -320,16 +350,17 @@ async def get_file_info(
     """Get file information from GridFS"""
     try:
         file_obj_id = ObjectId(file_id)
-        file_data = fs.get(file_obj_id)
+        file_data = await fs.open_download_stream(file_obj_id)
+        metadata = file_data.metadata or {}
         
         return {
             "success": True,
             "file_id": str(file_data._id),
             "filename": file_data.filename,
-            "content_type": file_data.content_type,
+            "content_type": file_data.content_type or metadata.get("contentType"),
             "upload_date": file_data.upload_date,
             "length": file_data.length,
-            "metadata": file_data.metadata if hasattr(file_data, 'metadata') else {}
+            "metadata": metadata
         }
     except Exception as e:
         print(f"File info error: {e}")
@@ -343,7 +374,7 @@ async def get_order_timeline(
 ):
     """Get complete timeline/history of an order"""
     try:
-        order = orders.find_one({"order_id": order_id})
+        order = await orders.find_one({"order_id": order_id})
         
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
@@ -0,0 +1,221 @@
+"""
+Order state machine.
+
+Every transition is a single find_one_and_update whose filter holds the precondition, so two
+requests racing on the same order cannot both win. The order is only read again when the update
+misses, to turn the failed precondition into the matching HTTP error.
+"""
+from typing import Callable, List, NamedTuple, Optional
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from crud.async_databases import orders
+from crud.codec import as_datetime, to_document, utcnow
+from routes.order.models import OrderStatus, OrderTimingEntry
+from routes.order.status import status_fields
+from modules.events import OrderEventType, publish_order_event
+from crud.order_stats import completed_counters, record_order_stats
+from crud.customer_stats import record_customer_stats
+from routes.order.notifications import notify_order_ready
+
+UNASSIGNED = {"$or": [{"manufacturer_id": ""}, {"manufacturer_id": {"$exists": False}}, {"manufacturer_id": None}]}
+NOT_CANCELLED = {"is_cancelled": {"$ne": True}}
+
+
+class Precondition(NamedTuple):
+    failed: Callable[[dict], bool]
+    status_code: int
+    detail: str
+
+
+def _timing(order: dict, key: str) -> Optional[dict]:
+    return (order.get("order_timing_table") or {}).get(key)
+
+
+def _is_cancelled(order: dict) -> bool:
+    return order.get("is_cancelled", False)
+
+
+def _transition_set(status: OrderStatus, key: str, user_id: str) -> dict:
+    """Timing table entry and denormalized status fields of one step, written together"""
+    entry = OrderTimingEntry(user_id=user_id, timestamp=utcnow(), status=status)
+    return {
+        f"order_timing_table.{key}": to_document(entry),
+        **status_fields(status, entry.timestamp),
+    }
+
+
+async def _diagnose(scope: dict, preconditions: List[Precondition]) -> None:
+    order = await orders.find_one(scope)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    for precondition in preconditions:
+        if precondition.failed(order):
+            raise HTTPException(status_code=precondition.status_code, detail=precondition.detail)
+    # Every precondition holds again, the order changed between the update and this read
+    raise HTTPException(status_code=409, detail="Order was modified concurrently, please retry")
+
+
+async def _transition(
+    scope: dict,
+    guard: dict,
+    update: dict,
+    preconditions: List[Precondition],
+    return_document: bool = ReturnDocument.AFTER,
+) -> dict:
+    order = await orders.find_one_and_update(
+        {**scope, **guard}, update, return_document=return_document
+    )
+    if order is None:
+        await _diagnose(scope, preconditions)
+    return order
+
+
+# ==================== MANUFACTURER POOL ====================
+async def assign(order_id: str, manufacturer_id: str) -> dict:
+    """Adopt an unassigned order, only one manufacturer can win"""
+    order = await _transition(
+        {"order_id": order_id},
+        {"$and": [UNASSIGNED, NOT_CANCELLED]},
+        {"$set": {
+            "manufacturer_id": manufacturer_id,
+            **_transition_set(OrderStatus.ASSIGNED_TO_MANUFACTURER, "assigned_to_manufacturer", manufacturer_id),
+        }},
+        [
+            Precondition(_is_cancelled, 400, "Cannot assign a cancelled order"),
+            Precondition(lambda o: o.get("manufacturer_id") == manufacturer_id, 400, "You have already adopted this order"),
+            Precondition(lambda o: bool(o.get("manufacturer_id")), 409, "This order has already been assigned to another manufacturer"),
+        ],
+    )
+    publish_order_event(OrderEventType.assigned, order)
+    await record_order_stats(order, {"assigned": 1}, order["last_updated"])
+    return order
+
+
+async def reject(order_id: str, manufacturer_id: str) -> dict:
+    """Hide an unassigned order from one manufacturer's pool"""
+    order = await _transition(
+        {"order_id": order_id},
+        {"$and": [UNASSIGNED, NOT_CANCELLED], "rejected_manufacturers": {"$ne": manufacturer_id}},
+        {"$addToSet": {"rejected_manufacturers": manufacturer_id}},
+        [
+            Precondition(lambda o: bool(o.get("manufacturer_id")), 400, "Cannot reject an order that already has a manufacturer assigned"),
+            Precondition(_is_cancelled, 400, "Cannot reject a cancelled order"),
+            Precondition(lambda o: manufacturer_id in (o.get("rejected_manufacturers") or []), 400, "You have already rejected this order"),
+        ],
+    )
+    publish_order_event(OrderEventType.rejected, order, rejected_by=manufacturer_id)
+    return order
+
+
+# ==================== MANUFACTURER PROCESS ====================
+def _owned_by(manufacturer_id: str) -> Precondition:
+    return Precondition(lambda o: o.get("manufacturer_id") != manufacturer_id, 403, "Not your order")
+
+
+_NOT_CANCELLED_PRECONDITION = Precondition(_is_cancelled, 400, "Order is cancelled")
+
+
+async def start_production(order_id: str, manufacturer_id: str) -> dict:
+    order = await _transition(
+        {"order_id": order_id},
+        {
+            "manufacturer_id": manufacturer_id,
+            "order_timing_table.started_manufacturing": None,
+            **NOT_CANCELLED,
+        },
+        {"$set": _transition_set(OrderStatus.STARTED_MANUFACTURING, "started_manufacturing", manufacturer_id)},
+        [
+            _owned_by(manufacturer_id),
+            _NOT_CANCELLED_PRECONDITION,
+            Precondition(lambda o: bool(_timing(o, "started_manufacturing")), 400, "Production already started"),
+        ],
+    )
+    publish_order_event(OrderEventType.status_changed, order)
+    await record_order_stats(order, {"started": 1}, order["last_updated"])
+    return order
+
+
+async def complete_production(order_id: str, manufacturer_id: str) -> dict:
+    order = await _transition(
+        {"order_id": order_id},
+        {
+            "manufacturer_id": manufacturer_id,
+            "order_timing_table.started_manufacturing": {"$ne": None},
+            "order_timing_table.produced": None,
+            **NOT_CANCELLED,
+        },
+        {"$set": _transition_set(OrderStatus.PRODUCED, "produced", manufacturer_id)},
+        [
+            _owned_by(manufacturer_id),
+            _NOT_CANCELLED_PRECONDITION,
+            Precondition(lambda o: not _timing(o, "started_manufacturing"), 400, "Production not started yet"),
+            Precondition(lambda o: bool(_timing(o, "produced")), 400, "Production already completed"),
+        ],
+    )
+    publish_order_event(OrderEventType.status_changed, order)
+    await record_order_stats(order, {"produced": 1}, order["last_updated"])
+    return order
+
+
+async def finalize(order_id: str, manufacturer_id: str, finalization: dict) -> dict:
+    """
+    Store the finalization data and mark the order ready to take.
+    Finalizing again refreshes the data and the ready_to_take entry. Returns the document as it was before the update,
+    so callers can tell a first finalize (no ready_to_take entry yet) from a correction.
+    """
+    update = {
+        **finalization,
+        **_transition_set(OrderStatus.READY_TO_TAKE, "ready_to_take", manufacturer_id),
+    }
+    order = await _transition(
+        {"order_id": order_id},
+        {
+            "manufacturer_id": manufacturer_id,
+            "order_timing_table.produced": {"$ne": None},
+            **NOT_CANCELLED,
+        },
+        {"$set": update},
+        [
+            _owned_by(manufacturer_id),
+            _NOT_CANCELLED_PRECONDITION,
+            Precondition(lambda o: not _timing(o, "produced"), 400, "Production must be completed first"),
+        ],
+        return_document=ReturnDocument.BEFORE,
+    )
+    finalized = {**order, **update}
+    publish_order_event(OrderEventType.status_changed, finalized)
+
+    # A repeated finalize moves the completion to today with the corrected amounts
+    previous = _timing(order, "ready_to_take")
+    if previous:
+        await record_order_stats(order, completed_counters(order, sign=-1), as_datetime(previous.get("timestamp")))
+    await record_order_stats(finalized, completed_counters(finalized), finalized["last_updated"])
+
+    spend = (finalized.get("final_price") or 0.0) - ((order.get("final_price") or 0.0) if previous else 0.0)
+    await record_customer_stats(order["user_id"], {"completed": 0 if previous else 1, "total_spend": spend})
+    if not previous:
+        await notify_order_ready(finalized)
+    return order
+
+
+# ==================== CUSTOMER ====================
+async def cancel(order_id: str, user_id: str) -> Optional[dict]:
+    """Cancel a customer's own order; None if it was already cancelled"""
+    scope = {"order_id": order_id, "user_id": user_id}
+    order = await orders.find_one_and_update(
+        {**scope, "order_timing_table.ready_to_take": None, **NOT_CANCELLED},
+        {"$set": {"is_cancelled": True, **status_fields(OrderStatus.CANCELLED)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if order is not None:
+        publish_order_event(OrderEventType.cancelled, order)
+        await record_order_stats(order, {"cancelled": 1}, order["last_updated"])
+        await record_customer_stats(user_id, {"cancelled": 1})
+        return order
+
+    # Cancelling twice is not an error, the customer just gets told so
+    if await orders.count_documents({**scope, "is_cancelled": True}, limit=1):
+        return None
+    await _diagnose(scope, [
+        Precondition(lambda o: bool(_timing(o, "ready_to_take")), 400, "Cannot cancel order that is already ready to take"),
+    ])
@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import Optional, Tuple
+from crud.codec import utcnow
+from routes.order.models import OrderStatus
+
+# Timing table keys in the order an order moves through them, the step is the 1-based position
+ORDER_STEPS = [
+    ("order_received", OrderStatus.ORDER_RECEIVED),
+    ("assigned_to_manufacturer", OrderStatus.ASSIGNED_TO_MANUFACTURER),
+    ("started_manufacturing", OrderStatus.STARTED_MANUFACTURING),
+    ("produced", OrderStatus.PRODUCED),
+    ("ready_to_take", OrderStatus.READY_TO_TAKE),
+]
+TOTAL_STEPS = len(ORDER_STEPS)
+STEP_OF_STATUS = {status: step for step, (_, status) in enumerate(ORDER_STEPS, start=1)}
+STATUS_OF_STEP = {step: status for status, step in STEP_OF_STATUS.items()}
+
+
+def status_fields(status: OrderStatus, now: Optional[datetime] = None) -> dict:
+    """
+    Denormalized status fields of an order.
+    Written in the same $set as the matching timing table entry so both always agree.
+    Cancelling keeps current_step, the progress bar still shows where the order stopped.
+    """
+    fields = {"status": status.value, "last_updated": now or utcnow()}
+    if status in STEP_OF_STATUS:
+        fields["current_step"] = STEP_OF_STATUS[status]
+    return fields
+
+
+def derive_status(order: dict) -> Tuple[OrderStatus, int]:
+    """Status and step from the timing table, for orders written before the status field existed"""
+    timing_table = order.get("order_timing_table") or {}
+    current_step = 1
+    for step, (key, _) in enumerate(ORDER_STEPS, start=1):
+        if timing_table.get(key):
+            current_step = step
+
+    if order.get("is_cancelled", False):
+        return OrderStatus.CANCELLED, current_step
+    return STATUS_OF_STEP[current_step], current_step
+
+
+def order_status(order: dict) -> Tuple[OrderStatus, int]:
+    """Stored status and step of an order, derived from the timing table until the backfill has reached it"""
+    status, current_step = order.get("status"), order.get("current_step")
+    if status in OrderStatus._value2member_map_ and current_step:
+        return OrderStatus(status), current_step
+    return derive_status(order)
@@ -1,16 +1,34 @@
-from fastapi import HTTPException, Depends
+from fastapi import HTTPException, Depends, Response
 from typing import List
 import logging
 from models.user import User
 from routes.authentication.auth_modules import get_session
 from app import app
 from datetime import datetime
-from crud.databases import orders, manufacturer_data, fs
+from crud.async_databases import manufacturer_data
 from pydantic import BaseModel
 from typing import Union, Dict, Optional
-import io
 from fastapi.responses import StreamingResponse
-from bson import ObjectId
+from crud.codec import as_datetime
+from crud.media import resolve_media_async, stream_media_async
+from crud.user import get_manufacturer_directory_async
+from routes.order.models import OrderStatus
+from routes.order.status import ORDER_STEPS, STATUS_OF_STEP, TOTAL_STEPS, order_status
+from routes.order import state_machine
+from crud.archive import find_order_async, find_orders_page_async
+from modules.pagination import (
+    NEXT_CURSOR_HEADER,
+    fetch_limit,
+    keyset_query,
+    page_size,
+    split_page,
+)
+
+COMPANY_TO_MANUFACTURER = {
+    "company1": "Medipol TTO",
+    "company2": "İTÜ TTO",
+    "company3": "GTÜ TTO",
+}
 
 # ==================== ORDER LIST MODELS ====================
 class OrderListResponse(BaseModel):
@@ -119,81 +137,55 @@ class CancelOrderResponse(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 def parse_timing_entry(entry_data: dict) -> Optional[OrderTimingEntryResponse]:
-    """Parse a timing table entry"""
-    if not entry_data:
+    """Parse a timing table entry, skipped when its timestamp cannot be read"""
+    timestamp = as_datetime(entry_data.get("timestamp")) if entry_data else None
+    if timestamp is None:
         return None
     
-    timestamp = entry_data.get("timestamp")
-    if isinstance(timestamp, str):
-        try:
-            timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-        except:
-            timestamp = datetime.now()
-    
     return OrderTimingEntryResponse(
         user_id=entry_data.get("user_id", ""),
-        timestamp=timestamp or datetime.now(),
+        timestamp=timestamp,
         status=entry_data.get("status", "")
     )
 
 
-def get_current_step(timing_table: dict) -> int:
-    """Determine current step number"""
-    if timing_table.get("ready_to_take"):
-        return 5
-    elif timing_table.get("produced"):
-        return 4
-    elif timing_table.get("started_manufacturing"):
-        return 3
-    elif timing_table.get("assigned_to_manufacturer"):
-        return 2
-    return 1
+STATUS_LABELS = {
+    OrderStatus.ORDER_RECEIVED.value: "Order Received",
+    OrderStatus.ASSIGNED_TO_MANUFACTURER.value: "Assigned to Manufacturer",
+    OrderStatus.STARTED_MANUFACTURING.value: "In Production",
+    OrderStatus.PRODUCED.value: "Production Completed",
+    OrderStatus.READY_TO_TAKE.value: "Ready to Pickup",
+    OrderStatus.CANCELLED.value: "Cancelled",
+}
+
+STEP_LABELS = {
+    "order_received": "Order Received",
+    "assigned_to_manufacturer": "Assigned",
+    "started_manufacturing": "Manufacturing",
+    "produced": "Produced",
+    "ready_to_take": "Ready to Pickup",
+}
 
 
-def get_status_label(timing_table: dict, is_cancelled: bool) -> str:
+def get_status_label(status: str) -> str:
     """Get human-readable status label"""
-    if is_cancelled:
-        return "Cancelled"
-    
-    if timing_table.get("ready_to_take"):
-        return "Ready to Pickup"
-    elif timing_table.get("produced"):
-        return "Production Completed"
-    elif timing_table.get("started_manufacturing"):
-        return "In Production"
-    elif timing_table.get("assigned_to_manufacturer"):
-        return "Assigned to Manufacturer"
-    return "Order Received"
-
-
-def build_steps(timing_table: dict, is_cancelled: bool) -> List[StepInfo]:
+    return STATUS_LABELS.get(status, "Order Received")
+
+
+def build_steps(timing_table: dict, current_step: int, is_cancelled: bool) -> List[StepInfo]:
     """Build step information for UI progress bar"""
     
     step_definitions = [
-        {"id": 1, "key": "order_received", "label": "Order Received"},
-        {"id": 2, "key": "assigned_to_manufacturer", "label": "Assigned"},
-        {"id": 3, "key": "started_manufacturing", "label": "Manufacturing"},
-        {"id": 4, "key": "produced", "label": "Produced"},
-        {"id": 5, "key": "ready_to_take", "label": "Ready to Pickup"},
+        {"id": step, "key": key, "label": STEP_LABELS[key]}
+        for step, (key, _) in enumerate(ORDER_STEPS, start=1)
     ]
     
-    current_step = get_current_step(timing_table)
     steps = []
     
     for step_def in step_definitions:
         entry = timing_table.get(step_def["key"])
         
-        # Parse timestamp
-        timestamp = None
-        if entry and entry.get("timestamp"):
-            ts = entry.get("timestamp")
-            if isinstance(ts, str):
-                try:
-                    timestamp = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                except:
-                    pass
-            elif isinstance(ts, datetime):
-                timestamp = ts
+        timestamp = as_datetime(entry.get("timestamp")) if entry else None
         
         # Determine status
         is_completed = entry is not None
@@ -220,77 +212,58 @@ def build_steps(timing_table: dict, is_cancelled: bool) -> List[StepInfo]:
     return steps
 
 
-def parse_datetime(value) -> Optional[datetime]:
-    """Parse datetime from various formats"""
-    if not value:
-        return None
-    
-    if isinstance(value, datetime):
-        return value
-    
-    if isinstance(value, dict) and "$date" in value:
-        try:
-            return datetime.fromisoformat(value["$date"].replace("Z", "+00:00"))
-        except:
-            return None
-    
-    if isinstance(value, str):
-        try:
-            return datetime.fromisoformat(value.replace("Z", "+00:00"))
-        except:
-            return None
-    
-    return None
-
-
 # ==================== ENDPOINTS ====================
 @app.get("/order/list", response_model=List[OrderListResponse])
 async def list_orders(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[OrderStatus] = None,
     user: User = Depends(get_session)
 ):
-    """List all orders for current user with minimal data"""
+    """
+    List the current user's orders with minimal data, newest first.
+    Without a limit every order is returned; with one the list is paginated by keyset:
+    pass the X-Next-Cursor response header back as cursor.
+    Optionally filtered by status, e.g. ?status=Cancelled
+    """
     
     try:
-        # Fetch all orders for the current user
-        user_orders = list(orders.find({"user_id": str(user.id)}))
+        # Fetch one page of orders for the current user, sorted by Mongo
+        limit = page_size(limit)
+        sort_field = "order_timing_table.order_received.timestamp"
+        base_query = {"user_id": str(user.id)}
+        if status:
+            base_query["status"] = status.value
+        query = keyset_query(base_query, sort_field, cursor)
+        # Finished orders may already live in orders_archive, the page is merged from both
+        user_orders = await find_orders_page_async(query, sort_field, fetch_limit(limit))
+        user_orders, next_cursor = split_page(user_orders, limit, sort_field)
+        
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         if not user_orders:
             return []
         
+        # Resolve all manufacturers of the listing with one batched query
+        manufacturers = await get_manufacturer_directory_async(
+            order.get("manufacturer_id") for order in user_orders
+        )
+        
         # Format orders with only necessary fields
         formatted_orders = []
         for order in user_orders:
             try:
-                # Get timing table
-                timing_table = order.get("order_timing_table", {})
-                
-                # Determine current step
-                current_step = get_current_step(timing_table)
-                
-                # Get status text
-                status_map = {
-                    1: "Order Received",
-                    2: "Assigned to Manufacturer",
-                    3: "Started Manufacturing",
-                    4: "Produced",
-                    5: "Ready to Take"
-                }
+                # Current step is stored on the order, cancelled orders keep the step they stopped at
+                _, current_step = order_status(order)
                 
                 # Check if cancelled
                 is_cancelled = order.get("is_cancelled", False)
-                
-                # Get order_received timestamp for sorting
-                order_received_entry = timing_table.get("order_received", {})
-                order_received_timestamp = order_received_entry.get("timestamp") if order_received_entry else None
-
-                company_to_manufacturer = {
-                    "company1": "Medipol TTO",
-                    "company2": "İTÜ TTO",
-                    "company3": "GTÜ TTO",
-                }
-                manufacturer = manufacturer_data.find_one({"user_id": order.get("manufacturer_id")})
+
+                manufacturer = manufacturers.get(order.get("manufacturer_id"))
                 if manufacturer:
-                    manufacturer_company_name = company_to_manufacturer[manufacturer.get("company")]
+                    manufacturer_company_name = COMPANY_TO_MANUFACTURER[manufacturer.get("company")]
                 else: 
                     manufacturer_company_name = " "
 
@@ -298,35 +271,23 @@ async def list_orders(
                 order_response = OrderListResponse(
                     order_id=order["order_id"],
                     order_number="#" + order["order_id"][:8].upper(),
-                    preview_id=order.get("preview_id", ""),
-                    status=status_map.get(current_step, "Order Received"),
+                    preview_id=order.get("preview_id") or "",
+                    status=STATUS_OF_STEP.get(current_step, OrderStatus.ORDER_RECEIVED).value,
                     current_step=current_step,
                     manufacturer=manufacturer_company_name,
                     is_cancelled=is_cancelled
                 )
                 
-                # Store timestamp temporarily for sorting
-                order_response._sort_timestamp = order_received_timestamp
-                
                 formatted_orders.append(order_response)
                 
             except Exception as e:
                 logging.error(f"Error parsing order {order.get('order_id', 'unknown')}: {e}")
                 continue
         
-        # Sort by order_received timestamp (newest first)
-        formatted_orders.sort(
-            key=lambda x: getattr(x, '_sort_timestamp', datetime.min) or datetime.min,
-            reverse=True
-        )
-        
-        # Remove temporary sorting attribute
-        for order in formatted_orders:
-            if hasattr(order, '_sort_timestamp'):
-                delattr(order, '_sort_timestamp')
-        
         return formatted_orders
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching orders: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch orders: {str(e)}")
@@ -350,7 +311,7 @@ async def get_order_detail(
     
     try:
         # ==================== FIND ORDER ====================
-        order = orders.find_one({"order_id": order_id, "user_id": str(user.id)})
+        order = await find_order_async({"order_id": order_id, "user_id": str(user.id)})
         
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
@@ -358,8 +319,8 @@ async def get_order_detail(
         # ==================== PARSE BASIC INFO ====================
         timing_table = order.get("order_timing_table", {})
         is_cancelled = order.get("is_cancelled", False)
-        current_step = get_current_step(timing_table)
-        is_completed = timing_table.get("ready_to_take") is not None
+        status, current_step = order_status(order)
+        is_completed = current_step == TOTAL_STEPS
         
         # ==================== PARSE ESTIMATIONS ====================
         estimations_data = order.get("estimations", {})
@@ -380,26 +341,14 @@ async def get_order_detail(
         
         # ==================== GET MANUFACTURER INFO ====================
         manufacturer_id = order.get("manufacturer_id")
-        manufacturer = ManufacturerInfoResponse(manufacturer_id=manufacturer_id)
-
-        company_to_manufacturer = {
-            "company1": "Medipol TTO",
-            "company2": "İTÜ TTO",
-            "company3": "GTÜ TTO",
-        }
-        manufacturer = manufacturer_data.find_one({"user_id": order.get("manufacturer_id")})
-        if manufacturer:
-            manufacturer_company_name = company_to_manufacturer[manufacturer.get("company")]
-        else: 
-            manufacturer_company_name = " "
-
+        manufacturer = None
 
         if manufacturer_id:
-            mfr_data = manufacturer_data.find_one({"user_id": manufacturer_id})
+            mfr_data = await manufacturer_data.find_one({"user_id": manufacturer_id})
             if mfr_data:
                 manufacturer = ManufacturerInfoResponse(
                     manufacturer_id=manufacturer_id,
-                    company=manufacturer_company_name,
+                    company=COMPANY_TO_MANUFACTURER[mfr_data.get("company")],
                     name=mfr_data.get("name"),
                     phone=mfr_data.get("phone")
                 )
@@ -412,7 +361,7 @@ async def get_order_detail(
                 final_price=order.get("final_price"),
                 delivery_address=order.get("delivery_address"),
                 manufacturer_notes=order.get("manufacturer_notes"),
-                product_image_uploaded_at=parse_datetime(order.get("product_image_uploaded_at"))
+                product_image_uploaded_at=order.get("product_image_uploaded_at")
             )
         
         # ==================== PARSE FILE INFO ====================
@@ -432,15 +381,11 @@ async def get_order_detail(
         )
         
         # ==================== BUILD STEPS ====================
-        steps = build_steps(timing_table, is_cancelled)
+        steps = build_steps(timing_table, current_step, is_cancelled)
         
-        # ==================== PARSE TIMESTAMPS ====================
-        created_at = None
-        order_received = timing_table.get("order_received")
-        if order_received:
-            created_at = parse_datetime(order_received.get("timestamp"))
-        
-        last_updated = parse_datetime(order.get("last_updated"))
+        # ==================== TIMESTAMPS ====================
+        created_at = as_datetime((timing_table.get("order_received") or {}).get("timestamp"))
+        last_updated = as_datetime(order.get("last_updated"))
         
         # ==================== BUILD RESPONSE ====================
         return OrderDetailResponse(
@@ -452,8 +397,8 @@ async def get_order_detail(
             
             # Status
             current_step=current_step,
-            total_steps=5,
-            status_label=get_status_label(timing_table, is_cancelled),
+            total_steps=TOTAL_STEPS,
+            status_label=get_status_label(status.value),
             is_cancelled=is_cancelled,
             is_completed=is_completed,
             
@@ -488,37 +433,16 @@ async def cancel_order(
     """Cancel an order - set is_cancelled to True"""
     
     try:
-        # Find order
-        order = orders.find_one({"order_id": order_id, "user_id": str(user.id)})
+        # Not cancelled and not ready to take yet, checked in the same update
+        order = await state_machine.cancel(order_id, str(user.id))
         
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-        
-        # Check if already cancelled
-        if order.get("is_cancelled", False):
+        if order is None:
             return CancelOrderResponse(
                 success=False,
                 message="Order is already cancelled",
                 order_id=order_id
             )
         
-        # Check if order can be cancelled (e.g., not if ready to take)
-        timing_table = order.get("order_timing_table", {})
-        if timing_table.get("ready_to_take"):
-            raise HTTPException(
-                status_code=400, 
-                detail="Cannot cancel order that is already ready to take"
-            )
-        
-        # Update order to cancelled
-        result = orders.update_one(
-            {"order_id": order_id, "user_id": str(user.id)},
-            {"$set": {"is_cancelled": True}}
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(status_code=500, detail="Failed to cancel order")
-        
         logging.info(f"Order {order_id} cancelled by user {user.id}")
         
         return CancelOrderResponse(
@@ -546,7 +470,7 @@ async def get_product_image(
     
     try:
         # Find the order
-        order = orders.find_one({
+        order = await find_order_async({
             "order_id": order_id,
             "user_id": str(user.id)
         })
@@ -560,46 +484,16 @@ async def get_product_image(
         if not product_file_id:
             raise HTTPException(status_code=404, detail="Product image not found")
         
-        # Try to find the file
-        file_data = None
-        content_type = "image/jpeg"
+        # Resolve the logical file id through the media index
+        media_entry = await resolve_media_async(product_file_id)
         
-        # Method 1: Try as ObjectId
-        try:
-            file_data = fs.get(ObjectId(product_file_id))
-            if file_data.content_type:
-                content_type = file_data.content_type
-        except Exception:
-            pass
-        
-        # Method 2: Try finding by filename
-        if not file_data:
-            try:
-                file_data = fs.find_one({"filename": product_file_id})
-                if file_data and file_data.content_type:
-                    content_type = file_data.content_type
-            except Exception:
-                pass
-        
-        # Method 3: Try finding by metadata
-        if not file_data:
-            try:
-                file_data = fs.find_one({"metadata.file_id": product_file_id})
-                if file_data and file_data.content_type:
-                    content_type = file_data.content_type
-            except Exception:
-                pass
-        
-        if not file_data:
+        if not media_entry:
             raise HTTPException(status_code=404, detail="Product image file not found")
         
-        # Read file content
-        file_content = file_data.read()
-        
         # Return as streaming response
         return StreamingResponse(
-            io.BytesIO(file_content),
-            media_type=content_type,
+            stream_media_async(media_entry),
+            media_type=media_entry.get("content_type") or "image/jpeg",
             headers={
                 "Content-Disposition": f"inline; filename=product_{order_id}.jpg",
                 "Cache-Control": "public, max-age=3600"
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from fastapi import Depends, HTTPException
+from pydantic import BaseModel
+from app import app
+from models.user import User, UserRoles
+from routes.authentication.auth_modules import get_session
+from crud.archive import find_orders_page_async
+from crud.async_databases import orders
+from crud.codec import as_datetime
+from crud.indexes import ORDER_RECEIVED_TS
+from crud.user import find_user_ids_by_name_async, full_name, get_user_directory_async
+from modules.pagination import DEFAULT_PAGE_SIZE, fetch_limit, keyset_query, keyset_sort, page_size, split_page
+from routes.order.models import OrderStatus, OrderType
+from routes.order import state_machine
+from routes.manifacturer_pool.routes import OrderSummary, extract_order_detail_fields
+
+SHORT_NUMBER_RE = re.compile(r"^#?([0-9a-fA-F-]{1,36})$")
+FACET_FIELDS = {
+    "status": "$status",
+    "material": "$order_detail.material",
+    "order_type": "$order_type",
+}
+
+
+class OrderSearchResponse(BaseModel):
+    success: bool
+    count: int
+    orders: List[OrderSummary]
+    facets: Dict[str, Dict[str, int]]
+    timestamp: datetime
+    next_cursor: str | None = None
+
+
+def search_summary(order: dict, customers: Dict[str, dict]) -> OrderSummary:
+    order_id = order.get("order_id", "")
+    return OrderSummary(
+        order_id=order_id,
+        order_id_short=order_id[:8].upper(),
+        # Stored as None when no preview was rendered
+        preview_id=order.get("preview_id") or "",
+        order_received_date=as_datetime(((order.get("order_timing_table") or {}).get("order_received") or {}).get("timestamp")),
+        customer_name=full_name(customers.get(order.get("user_id", ""))),
+        is_cancelled=order.get("is_cancelled", False),
+        **extract_order_detail_fields(order)
+    )
+
+
+def scope_query(user: User) -> dict:
+    """Admins and managers search everything, manufacturers their own orders and the pool they can see"""
+    if user.role in (UserRoles.admin, UserRoles.manager):
+        return {}
+    if user.role == UserRoles.manufacturer:
+        return {"$or": [
+            {"manufacturer_id": user.id},
+            {"$and": [
+                state_machine.UNASSIGNED,
+                state_machine.NOT_CANCELLED,
+                {"rejected_manufacturers": {"$ne": user.id}},
+            ]},
+        ]}
+    raise HTTPException(status_code=403, detail="Insufficient permissions.")
+
+
+def order_number_query(number: str) -> dict:
+    """#XXXXXXXX short numbers are the upper-cased start of the order_id, an anchored prefix uses its index"""
+    match = SHORT_NUMBER_RE.match(number.strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Invalid order number")
+    return {"order_id": {"$regex": f"^{re.escape(match.group(1).lower())}"}}
+
+
+def facets_pipeline(query: dict, include_archived: bool = False) -> list:
+    archived = [{"$unionWith": {"coll": "orders_archive", "pipeline": [{"$match": query}]}}] if include_archived else []
+    return [
+        {"$match": query},
+        *archived,
+        {"$facet": {
+            name: [{"$group": {"_id": field, "count": {"$sum": 1}}}, {"$sort": {"count": -1}}]
+            for name, field in FACET_FIELDS.items()
+        }},
+    ]
+
+
+@app.get("/orders/search", tags=["orders"], response_model=OrderSearchResponse)
+async def search_orders(
+    number: Optional[str] = None,
+    status: Optional[OrderStatus] = None,
+    order_type: Optional[OrderType] = None,
+    material: Optional[str] = None,
+    brand: Optional[str] = None,
+    color: Optional[str] = None,
+    customer: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    include_archived: bool = False,
+    user: User = Depends(get_session)
+):
+    """
+    Search orders by short number ("#1A2B3C4D"), status, order type, material, brand, color,
+    customer name and received date range. Filters combine with AND.
+    Newest first; pass next_cursor back as cursor. Facet counts cover the whole result, not only the page.
+    With include_archived, finished orders moved to orders_archive are searched too (slower, the
+    archive is only indexed for customer listings).
+    """
+    
+    filters = [scope_query(user)]
+    
+    try:
+        if number:
+            filters.append(order_number_query(number))
+        if status:
+            filters.append({"status": status.value})
+        if order_type:
+            filters.append({"order_type": order_type.value})
+        for field, value in (("material", material), ("brand", brand), ("color", color)):
+            if value:
+                filters.append({f"order_detail.{field}": value})
+        if date_from or date_to:
+            received = {}
+            if date_from:
+                received["$gte"] = datetime.combine(date_from, datetime.min.time())
+            if date_to:
+                received["$lt"] = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+            filters.append({ORDER_RECEIVED_TS: received})
+        if customer:
+            filters.append({"user_id": {"$in": await find_user_ids_by_name_async(customer)}})
+        
+        query = {"$and": [f for f in filters if f]} if any(filters) else {}
+        
+        limit = page_size(limit)
+        page_query = keyset_query(query, ORDER_RECEIVED_TS, cursor)
+        if include_archived:
+            # Heap merge of both collections, the cursor works across them
+            page_task = find_orders_page_async(page_query, ORDER_RECEIVED_TS, fetch_limit(limit))
+        else:
+            page_task = orders.find(page_query).sort(keyset_sort(ORDER_RECEIVED_TS)).limit(limit + 1).to_list(length=limit + 1)
+        page, facets = await asyncio.gather(
+            page_task,
+            orders.aggregate(facets_pipeline(query, include_archived)).to_list(length=1),
+        )
+        page, next_cursor = split_page(page, limit, ORDER_RECEIVED_TS)
+        
+        customers = await get_user_directory_async(order.get("user_id") for order in page)
+        summaries = [search_summary(order, customers) for order in page]
+        
+        facet_counts = facets[0] if facets else {}
+        return OrderSearchResponse(
+            success=True,
+            count=len(summaries),
+            orders=summaries,
+            facets={
+                name: {str(row["_id"]): row["count"] for row in facet_counts.get(name, []) if row["_id"] is not None}
+                for name in FACET_FIELDS
+            },
+            timestamp=datetime.now(),
+            next_cursor=next_cursor
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error searching orders: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to search orders: {str(e)}")
@@ -1,4 +1,3 @@
-from bson import ObjectId
 import httpx
 from app import app
 from models.user import (
@@ -16,6 +15,8 @@ from routes.authentication.auth_modules import (
 )
 from fastapi import Depends, File, HTTPException, Response, UploadFile
 from crud.databases import fs, users, manufacturer_data  # manufacturer_data eklendi
+from modules.sessions import invalidate_session
+from crud.media import MediaKind, media_document, register_media, resolve_media, open_media, remove_media
 from routes.user.user_functions import (
     change_password,
     register_user,
@@ -81,10 +82,11 @@ def update_password_route(
 
 
 @app.post("/update_profile_picture/", tags=["user operations"])
-async def create_file(
+def create_file(
     profile_picture: UploadFile = File(...), user: User = Depends(get_session)
 ):
-    file_content = await profile_picture.read()  # Read the file once
+    # Sync route: GridFS and the media index are written with the sync client, off the event loop
+    file_content = profile_picture.file.read()  # Read the file once
     file_size = len(file_content)  # Calculate the file size
 
     file_id = fs.put(
@@ -93,10 +95,21 @@ async def create_file(
         content_type=profile_picture.content_type,
     )
 
+    register_media(media_document(
+        str(file_id),
+        file_id,
+        MediaKind.profile_picture,
+        content_type=profile_picture.content_type,
+        length=file_size,
+        filename=profile_picture.filename,
+        owner_id=user.id,
+    ))
+
     if user.pp:
-        fs.delete(ObjectId(user.pp))
+        remove_media(user.pp)
 
     users.find_one_and_update({"id": user.id}, {"$set": {"pp": str(file_id)}})
+    invalidate_session(user.id)
 
     return {"filename": profile_picture.filename, "file_size": file_size}
 
@@ -113,7 +126,13 @@ def get_profile_picture(id: str):
         return Response(content=resp.content, media_type="image/webp")
 
     # Assuming 'fs' is a GridFS instance initialized elsewhere to handle file storage
-    return Response(content=fs.get(ObjectId(user["pp"])).read(), media_type="image")
+    media_entry = resolve_media(user["pp"])
+    if not media_entry:
+        raise HTTPException(status_code=404, detail="Profile picture not found")
+    return Response(
+        content=open_media(media_entry).read(),
+        media_type=media_entry.get("content_type") or "image",
+    )
 
 
 # ==================== MANUFACTURER ROUTES ====================
@@ -18,8 +18,9 @@ from models.user import (
     UserSettingsProfileCredentials,
 )
 from models.utils import Message
-from redmail import gmail, EmailSender
+from crud.outbox import enqueue_email
 from modules.config import config
+from modules.sessions import invalidate_session, revoke_sessions
 from os import getenv
 
 
@@ -27,6 +28,7 @@ def change_password(password: str, user: User):
     users.find_one_and_update(
         {"id": user.id}, {"$set": {"hashed_password": get_password_hash(password)}}
     )
+    invalidate_session(user.id)
     return "Password changed."
 
 
@@ -66,10 +68,13 @@ def register_user(data: UserRegister) -> bool:
     return Message(text="Error occurred, please contact with us!", status=False)
 
 
+PASSWORD_RESET_MINUTES = 15
+
+
 def get_password_reset_token(user: User) -> str:
     token = create_jwt_token(
         data={"email": user.email},
-        expires_delta=timedelta(minutes=15),
+        expires_delta=timedelta(minutes=PASSWORD_RESET_MINUTES),
     )
     return token
 
@@ -79,21 +84,16 @@ def send_password_reset_link(email: str) -> None:
     if user:
         token = get_password_reset_token(user)
 
-        email_service = EmailSender(
-            host=getenv("HELPER_EMAIL_HOST"),  # Replace with your SMTP host
-            port=int(getenv("HELPER_EMAIL_PORT")),  # SMTP port, usually 587 for TLS
-            username=getenv("HELPER_EMAIL"),
-            password=getenv("HELPER_EMAIL_PASSWORD"),
-        )
-
-        email_service.send(
-            sender=getenv("HELPER_EMAIL"),  # From email address
+        # Sent by the outbox dispatcher, the request only stores the message
+        enqueue_email(
             receivers=[email],
             subject=f"{getenv("HELPER_EMAIL_APP_NAME")} - Password Reset",
             html=f"""
                 <h1>Hii {user.username}, you can reset your password with following link:</h1>
                 <a href="{getenv("APP_URI")}/reset_password/?reset={token}" target="_blank">{getenv("APP_URI")}/reset_password/?reset={token}</a>
             """,
+            kind="password_reset",
+            expires_in=timedelta(minutes=PASSWORD_RESET_MINUTES),
         )
 
 
@@ -105,6 +105,8 @@ def reset_password(data: ResetPassword) -> None:
             {"_id": user.get("_id")},
             {"$set": {"hashed_password": get_password_hash(data.password)}},
         )
+        # Whoever knew the old password is logged out
+        revoke_sessions([user.get("id")])
     else:
         raise Exception("User dont exist!")
 
@@ -121,6 +123,7 @@ def update_profile(profile_data: UserSettingsProfileCredentials, user: User):
             }
         },
     )
+    invalidate_session(user.id)
 
     return "ok"
 
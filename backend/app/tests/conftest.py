@@ -0,0 +1,72 @@
+"""
+Run from backend/app:
+    pip install -r requirements.txt -r requirements-dev.txt
+    python -m pytest -q
+
+The clients in crud/ connect lazily, so importing the application needs no running MongoDB;
+tests touching collections use mongomock.
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        # sort, limit, skip... chain like Motor's cursor
+        method = getattr(self.cursor, name)
+
+        def chain(*args, **kwargs):
+            self.cursor = method(*args, **kwargs)
+            return self
+
+        return chain
+
+    async def to_list(self, length=None):
+        documents = list(self.cursor)
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.cursor:
+            yield document
+
+
+class AsyncCollection:
+    """Awaitable facade over a mongomock collection, standing in for the Motor one"""
+
+    def __init__(self, collection):
+        self.sync = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.sync.find(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs):
+        return AsyncCursor(self.sync.aggregate(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+@pytest.fixture
+def mongo():
+    mongomock = pytest.importorskip("mongomock")
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def async_collection(mongo):
+    return lambda name: AsyncCollection(mongo[name])
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from benchmarks.import_time import parse_importtime
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |       numpy.core
+import time:        50 |        150 |     numpy
+import time:        20 |         20 |     redmail.email
+import time:        10 |        180 |   modules.mailer
+import time:        30 |        210 | app
+"""
+
+
+def test_parse_importtime_sums_self_time_of_nested_packages():
+    assert dict(parse_importtime(IMPORTTIME)) == {"numpy": 150.0, "redmail": 20.0, "modules": 10.0, "app": 30.0}
+
+
+def test_mailer_imports_redmail_lazily():
+    probe = "import sys, modules.mailer; sys.exit('redmail' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", probe]).returncode == 0
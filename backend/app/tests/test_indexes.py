@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("pymongo")
+
+from pymongo.errors import OperationFailure
+
+from crud import indexes
+
+
+class FakeCollection:
+    def __init__(self, failing: set):
+        self.failing = failing
+        self.created = []
+
+    def create_indexes(self, models):
+        (model,) = models
+        name = model.document["name"]
+        if name in self.failing:
+            raise OperationFailure("Index already exists with different options", code=85)
+        self.created.append(name)
+        return [name]
+
+
+def test_one_conflicting_index_does_not_block_the_rest(monkeypatch):
+    names = [model.document["name"] for model in indexes.INDEXES["orders"]]
+    collection = FakeCollection({names[0]})
+    monkeypatch.setattr(indexes, "db", {"orders": collection})
+
+    results = indexes.ensure_collection_indexes("orders")
+
+    assert collection.created == names[1:]
+    assert "different options" in results[names[0]]
+    assert all(results[name] is None for name in names[1:])
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import app  # noqa: F401  route modules import each other, app loads them in a working order
+from crud.codec import utcnow
+from routes.manifacturer_pool.routes import build_manufacturer_summary
+
+
+def summary_with_pool(**pool):
+    return build_manufacturer_summary({"pool": [{"count": 3, **pool}]})
+
+
+def test_oldest_waiting_uses_the_older_of_date_and_legacy_string():
+    now = utcnow()
+    summary = summary_with_pool(
+        oldest=now - timedelta(hours=1),
+        oldest_legacy=(now - timedelta(hours=5)).isoformat(),
+    )
+    assert summary.pool.oldest_waiting_seconds == pytest.approx(5 * 3600, abs=60)
+
+
+def test_unparseable_legacy_timestamps_are_skipped():
+    summary = summary_with_pool(oldest=utcnow() - timedelta(hours=1), oldest_legacy="yesterday")
+    assert summary.pool.oldest_waiting_seconds == pytest.approx(3600, abs=60)
+    assert summary_with_pool(oldest_legacy="yesterday").pool.oldest_waiting_seconds is None
+
+
+def test_empty_pool():
+    summary = build_manufacturer_summary({})
+    assert summary.pool.count == 0
+    assert summary.pool.oldest_waiting_seconds is None
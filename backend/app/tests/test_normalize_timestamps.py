@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("pymongo")
+
+from migrations.normalize_timestamps import build_operation, parse_offset, to_utc
+
+
+def test_naive_strings_are_read_in_the_given_zone():
+    assert to_utc("2024-05-01T12:30:00.123456", parse_offset("+03:00")) == datetime(2024, 5, 1, 9, 30, 0, 123456)
+    assert to_utc("2024-05-01T12:30:00", parse_offset("-0500")) == datetime(2024, 5, 1, 17, 30)
+
+
+def test_naive_strings_default_to_the_local_zone():
+    expected = datetime(2024, 5, 1, 12, 30).astimezone().astimezone(parse_offset("+00:00")).replace(tzinfo=None)
+    assert to_utc("2024-05-01T12:30:00") == expected
+
+
+def test_explicit_offsets_and_extended_json_ignore_the_zone():
+    zone = parse_offset("+03:00")
+    assert to_utc("2024-05-01T12:30:00Z", zone) == datetime(2024, 5, 1, 12, 30)
+    assert to_utc("2024-05-01T12:30:00+02:00", zone) == datetime(2024, 5, 1, 10, 30)
+    assert to_utc({"$date": "2024-05-01T12:30:00Z"}, zone) == datetime(2024, 5, 1, 12, 30)
+    assert to_utc("not a date", zone) is None
+
+
+def test_build_operation_skips_clean_orders():
+    clean = {"_id": 1, "last_updated": datetime(2024, 5, 1)}
+    assert build_operation(clean) is None
+    legacy = {"_id": 2, "last_updated": "2024-05-01T12:30:00"}
+    operation = build_operation(legacy, parse_offset("+01:00"))
+    assert operation._doc == {"$set": {"last_updated": datetime(2024, 5, 1, 11, 30)}}
+
+
+def test_parse_offset_rejects_garbage():
+    with pytest.raises(Exception):
+        parse_offset("three hours")
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import app  # noqa: F401  route modules import each other, app loads them in a working order
+from fastapi import HTTPException
+
+from crud.stream_tickets import issue_stream_ticket
+from models.user import AccountStatus, User, UserRoles
+from modules.events import OrderEvent, OrderEventType
+from routes.events.routes import get_stream_session, order_event_view
+
+
+def user(role: UserRoles, user_id: str) -> User:
+    return User(
+        id=user_id, hashed_password="", activated=True, status=AccountStatus.normal,
+        first_name="Ada", last_name="Lovelace", email="ada@example.com", username=user_id, role=role,
+    )
+
+
+ASSIGNED = OrderEvent(type=OrderEventType.assigned, order_id="o1", user_id="u1", manufacturer_id="m1", status="Assigned", current_step=2)
+
+
+def test_adopting_manufacturer_and_admins_get_the_whole_event():
+    assert order_event_view(user(UserRoles.manufacturer, "m1"))(ASSIGNED) == ASSIGNED
+    assert order_event_view(user(UserRoles.admin, "a1"))(ASSIGNED) == ASSIGNED
+
+
+def test_competitors_only_learn_that_the_order_left_the_pool():
+    seen = order_event_view(user(UserRoles.manufacturer, "m2"))(ASSIGNED)
+    assert seen.type == OrderEventType.left_pool
+    assert seen.order_id == "o1"
+    assert seen.manufacturer_id == "" and seen.status is None and seen.user_id == ""
+
+
+def test_others_orders_stay_private():
+    produced = OrderEvent(type=OrderEventType.status_changed, order_id="o1", user_id="u1", manufacturer_id="m1")
+    rejected = OrderEvent(type=OrderEventType.rejected, order_id="o2", rejected_by="m3")
+    assert order_event_view(user(UserRoles.manufacturer, "m2"))(produced) is None
+    assert order_event_view(user(UserRoles.manufacturer, "m2"))(rejected) is None
+    assert order_event_view(user(UserRoles.user, "u2"))(produced) is None
+    assert order_event_view(user(UserRoles.user, "u1"))(produced) == produced
+
+
+@pytest.fixture
+def tickets(monkeypatch, mongo, async_collection):
+    from crud import stream_tickets
+    from modules import sessions
+    from routes.authentication import auth_modules
+
+    monkeypatch.setattr(stream_tickets, "async_databases", SimpleNamespace(stream_tickets=async_collection("stream_tickets")))
+    monkeypatch.setattr(auth_modules, "users", mongo.users)
+    monkeypatch.setattr(sessions, "session_invalidations", mongo.session_invalidations)
+    mongo.users.insert_one(user(UserRoles.user, "u1").model_dump())
+    return mongo.stream_tickets
+
+
+def open_stream(ticket: str) -> User:
+    return asyncio.run(get_stream_session(ticket))
+
+
+def test_stream_tickets_are_single_use(tickets):
+    ticket = asyncio.run(issue_stream_ticket({"sub": "u1", "ver": 0, "fam": "f1"}))
+    assert tickets.find_one()["_id"] != ticket  # only the hash is stored
+    assert open_stream(ticket).id == "u1"
+    with pytest.raises(HTTPException) as error:
+        open_stream(ticket)
+    assert error.value.status_code == 401
+
+
+def test_expired_tickets_and_revoked_families_are_refused(tickets):
+    from modules.sessions import revoke_token_family
+
+    expired = asyncio.run(issue_stream_ticket({"sub": "u1", "ver": 0, "fam": "f1"}))
+    tickets.update_many({}, {"$set": {"expires_at": datetime(2000, 1, 1)}})
+    revoked = asyncio.run(issue_stream_ticket({"sub": "u1", "ver": 0, "fam": "f2"}))
+    revoke_token_family("f2")
+    for ticket in (expired, revoked, "never issued"):
+        with pytest.raises(HTTPException) as error:
+            open_stream(ticket)
+        assert error.value.status_code == 401
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import app  # noqa: F401  route modules import each other, app loads them in a working order
+from conftest import AsyncCollection
+from fastapi import HTTPException
+
+from crud import archive
+from models.user import AccountStatus, User, UserRoles
+from routes.manifacturer_pool import routes as pool_routes
+from routes.order.models import OrderStatus
+from routes.order_search import routes as search_routes
+from routes.order_search.routes import search_orders, search_summary
+
+
+def test_summary_of_order_without_preview():
+    order = {
+        "order_id": "1a2b3c4d-0000-0000-0000-000000000000",
+        "user_id": "u1",
+        "preview_id": None,
+        "order_detail": {"material": "PLA"},
+    }
+    summary = search_summary(order, {"u1": {"first_name": "Ada", "last_name": "Lovelace"}})
+    assert summary.preview_id == ""
+    assert summary.order_id_short == "1A2B3C4D"
+    assert summary.material == "PLA"
+
+
+def user(role: UserRoles, user_id: str = "m1") -> User:
+    return User(
+        id=user_id, hashed_password="", activated=True, status=AccountStatus.normal,
+        first_name="Ada", last_name="Lovelace", email="ada@example.com", username=user_id, role=role,
+    )
+
+
+def stored_order(number: int, received: datetime, status: OrderStatus, manufacturer_id: str = "m1", **fields) -> dict:
+    entry = {"user_id": "u1", "timestamp": received, "status": status.value}
+    return {
+        "_id": number,
+        "order_id": f"{number:08x}-0000-0000-0000-000000000000",
+        "user_id": "u1",
+        "manufacturer_id": manufacturer_id,
+        "status": status.value,
+        "is_cancelled": status == OrderStatus.CANCELLED,
+        "order_type": "FDM",
+        "order_detail": {"material": "PLA"},
+        "order_timing_table": {"order_received": entry},
+        **fields,
+    }
+
+
+@pytest.fixture
+def stores(monkeypatch, mongo):
+    monkeypatch.setattr(search_routes, "orders", AsyncCollection(mongo.orders))
+    monkeypatch.setattr(archive, "async_databases", SimpleNamespace(
+        orders=AsyncCollection(mongo.orders), orders_archive=AsyncCollection(mongo.orders_archive)
+    ))
+
+    async def no_customers(user_ids):
+        return {}
+
+    monkeypatch.setattr(search_routes, "get_user_directory_async", no_customers)
+    mongo.orders.insert_many([
+        stored_order(0x1A2B3C4D, datetime(2024, 6, 3), OrderStatus.PRODUCED),
+        stored_order(0x1A2B0000, datetime(2024, 6, 2), OrderStatus.STARTED_MANUFACTURING),
+        stored_order(0x5555, datetime(2024, 6, 1), OrderStatus.PRODUCED, manufacturer_id="m2"),
+    ])
+    mongo.orders_archive.insert_one(stored_order(0x1A2B9999, datetime(2023, 1, 5), OrderStatus.READY_TO_TAKE))
+    return mongo
+
+
+def search(**filters):
+    params = {
+        "number": None, "status": None, "order_type": None, "material": None, "brand": None,
+        "color": None, "customer": None, "date_from": None, "date_to": None, "limit": 50,
+        "cursor": None, "include_archived": False, "user": user(UserRoles.admin),
+    }
+    return asyncio.run(search_orders(**{**params, **filters}))
+
+
+def short_numbers(response) -> list:
+    return [summary.order_id_short for summary in response.orders]
+
+
+def test_short_number_prefix_and_status(stores):
+    assert short_numbers(search(number="#1a2b")) == ["1A2B3C4D", "1A2B0000"]
+    assert short_numbers(search(number="1A2B", status=OrderStatus.PRODUCED)) == ["1A2B3C4D"]
+    with pytest.raises(HTTPException) as error:
+        search(number="#not-hex!")
+    assert error.value.status_code == 400
+
+
+def test_date_range_includes_the_whole_last_day(stores):
+    response = search(date_from=date(2024, 6, 2), date_to=date(2024, 6, 2))
+    assert short_numbers(response) == ["1A2B0000"]
+
+
+def test_manufacturers_only_see_their_orders_and_the_pool(stores):
+    stores.orders.insert_one(stored_order(0x7777, datetime(2024, 6, 4), OrderStatus.ORDER_RECEIVED, manufacturer_id=""))
+    response = search(user=user(UserRoles.manufacturer, "m2"))
+    assert short_numbers(response) == ["00007777", "00005555"]
+    assert response.facets["status"] == {"Order Received": 1, "Produced": 1}
+
+    with pytest.raises(HTTPException) as error:
+        search(user=user(UserRoles.user, "u1"))
+    assert error.value.status_code == 403
+
+
+def test_archived_orders_only_with_include_archived(monkeypatch, stores):
+    # mongomock has no $unionWith, the facet pipeline is checked on its own below
+    facets_pipeline = search_routes.facets_pipeline
+    monkeypatch.setattr(search_routes, "facets_pipeline", lambda query, include_archived: facets_pipeline(query))
+
+    assert short_numbers(search(number="1a2b")) == ["1A2B3C4D", "1A2B0000"]
+    first = search(number="1a2b", include_archived=True, limit=2)
+    assert short_numbers(first) == ["1A2B3C4D", "1A2B0000"]
+    rest = search(number="1a2b", include_archived=True, limit=2, cursor=first.next_cursor)
+    assert short_numbers(rest) == ["1A2B9999"]
+    assert rest.next_cursor is None
+
+
+def test_facets_count_the_archive_with_include_archived():
+    pipeline = search_routes.facets_pipeline({"status": "x"}, include_archived=True)
+    assert pipeline[1] == {"$unionWith": {"coll": "orders_archive", "pipeline": [{"$match": {"status": "x"}}]}}
+    assert "$unionWith" not in str(search_routes.facets_pipeline({"status": "x"}))
+
+
+def test_adopted_orders_tolerate_a_null_preview(monkeypatch, mongo):
+    monkeypatch.setattr(pool_routes, "orders", mongo.orders)
+    monkeypatch.setattr(pool_routes, "get_user_directory", lambda user_ids: {})
+    mongo.orders.insert_one(stored_order(1, datetime(2024, 6, 1), OrderStatus.PRODUCED, preview_id=None))
+    response = pool_routes.get_adopted_orders(limit=None, cursor=None, status=None, user=user(UserRoles.manufacturer))
+    assert [summary.preview_id for summary in response.orders] == ["default_preview"]
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("pydantic")
+
+from routes.order.models import OrderStatus
+from routes.order.status import order_status
+
+SHIPPED_TIMING = {
+    key: {"user_id": "m1"}
+    for key in ("order_received", "assigned_to_manufacturer", "started_manufacturing", "produced", "ready_to_take")
+}
+
+
+def test_stored_fields_win():
+    order = {"status": OrderStatus.PRODUCED.value, "current_step": 4, "order_timing_table": SHIPPED_TIMING}
+    assert order_status(order) == (OrderStatus.PRODUCED, 4)
+
+
+def test_orders_not_backfilled_yet_are_derived_from_the_timing_table():
+    assert order_status({"order_timing_table": SHIPPED_TIMING}) == (OrderStatus.READY_TO_TAKE, 5)
+    cancelled = {"order_timing_table": {"order_received": {"user_id": "u1"}}, "is_cancelled": True}
+    assert order_status(cancelled) == (OrderStatus.CANCELLED, 1)
+    # A status without its step is not trusted either
+    assert order_status({"status": "Order Received", "order_timing_table": SHIPPED_TIMING})[1] == 5
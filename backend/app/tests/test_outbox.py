@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+pytest.importorskip("redmail")
+
+from crud import outbox
+from crud.outbox import FAILED, PENDING, SENT, email_document, is_expired, result_update
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+def message(**fields):
+    return {"_id": "m1", "lease_id": "l1", **email_document(["a@example.com"], "s", "<p/>", "test"), **fields}
+
+
+def test_sent_message_is_marked_for_purge():
+    update = result_update(message(), None, NOW)
+    assert update["status"] == SENT
+    assert update["purge_at"] > NOW
+
+
+def test_failure_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(outbox.config, "email_retry_base_seconds", 30)
+    update = result_update(message(attempts=1), RuntimeError("421"), NOW)
+    assert update["status"] == PENDING
+    assert update["next_attempt_at"] == NOW + timedelta(seconds=60)
+
+
+def test_no_retry_past_expiry():
+    update = result_update(message(expires_at=NOW + timedelta(seconds=10)), RuntimeError("421"), NOW)
+    assert update["status"] == FAILED
+
+
+def test_expiry():
+    assert is_expired(message(expires_at=NOW), NOW)
+    assert not is_expired(message(expires_at=None), NOW)
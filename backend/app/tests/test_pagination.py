@@ -0,0 +1,119 @@
+import heapq
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+bson = pytest.importorskip("bson")
+
+from fastapi import HTTPException
+from pymongo import ASCENDING
+
+from modules.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    fetch_limit,
+    keyset_query,
+    keyset_sort,
+    page_size,
+    sort_key,
+    split_page,
+)
+
+FIELD = "order_timing_table.order_received.timestamp"
+
+
+def order(oid: int, value=None, missing=False):
+    doc = {"_id": bson.ObjectId(f"{oid:024x}")}
+    if not missing:
+        doc["order_timing_table"] = {"order_received": {"timestamp": value}}
+    return doc
+
+
+def test_sort_key_orders_mixed_types_like_mongodb():
+    docs = [
+        order(1, datetime(2024, 5, 1)),
+        order(2, "2024-05-02T10:00:00"),
+        order(3, None),
+        order(4, missing=True),
+        order(5, datetime(2024, 6, 1)),
+    ]
+    ranked = sorted(docs, key=lambda doc: sort_key(doc, FIELD), reverse=True)
+    # Dates above strings above null/missing, _id breaking ties
+    assert [doc["_id"] for doc in ranked] == [docs[i]["_id"] for i in (4, 0, 1, 3, 2)]
+
+
+def test_merge_of_hot_and_archive_with_legacy_values():
+    key = lambda doc: sort_key(doc, FIELD)
+    hot = sorted([order(1, datetime(2024, 1, 1)), order(2, None)], key=key, reverse=True)
+    cold = sorted([order(3, "legacy"), order(4, datetime(2023, 1, 1))], key=key, reverse=True)
+    merged = list(heapq.merge(hot, cold, key=key, reverse=True))
+    assert [doc["_id"] for doc in merged] == [hot[0]["_id"], cold[0]["_id"], cold[1]["_id"], hot[1]["_id"]]
+
+
+def cursor_after(value, oid: int) -> str:
+    return encode_cursor({"_id": bson.ObjectId(f"{oid:024x}"), "v": value}, "v")
+
+
+def test_page_size_keeps_unpaged_requests_unpaged():
+    assert page_size(None) is None
+    assert fetch_limit(None) == 0
+    assert page_size(0) == DEFAULT_PAGE_SIZE
+    assert page_size(10_000) == MAX_PAGE_SIZE
+    assert fetch_limit(20) == 21
+    docs = [order(i) for i in range(3)]
+    assert split_page(docs, None, FIELD) == (docs, None)
+
+
+def test_descending_cursor_reaches_lower_types_and_nulls():
+    after = keyset_query({}, "v", cursor_after("legacy", 9))["$or"]
+    assert {"v": None} in after
+    assert {"v": {"$type": "double"}} in after
+    assert {"v": {"$type": "date"}} not in after
+    assert {"v": {"$lt": "legacy"}} in after
+
+
+def test_descending_cursor_on_null_only_walks_remaining_nulls():
+    after = keyset_query({}, "v", cursor_after(None, 9))["$or"]
+    assert after == [{"v": None, "_id": {"$lt": bson.ObjectId(f"{9:024x}")}}]
+
+
+def test_ascending_cursor_on_null_moves_on_to_every_other_type():
+    after = keyset_query({}, "v", cursor_after(None, 9), direction=ASCENDING)["$or"]
+    assert {"v": {"$ne": None}} in after
+    after = keyset_query({}, "v", cursor_after(3, 9), direction=ASCENDING)["$or"]
+    assert {"v": None} not in after
+    assert {"v": {"$type": "date"}} in after
+    assert {"v": {"$type": "double"}} not in after
+
+
+def test_keyset_walk_returns_every_document_once():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.orders
+    docs = [order(1, datetime(2024, 5, 1)), order(2, "2024-05-02T10:00:00"), order(3, None), order(4, missing=True)]
+    docs += [order(i, datetime(2024, 6, i % 3 + 1)) for i in range(5, 12)]
+    collection.insert_many(docs)
+
+    seen, cursor = [], None
+    while True:
+        page = list(collection.find(keyset_query({}, FIELD, cursor)).sort(keyset_sort(FIELD)).limit(fetch_limit(3)))
+        page, cursor = split_page(page, 3, FIELD)
+        seen += [doc["_id"] for doc in page]
+        if not cursor:
+            break
+    expected = sorted(docs, key=lambda doc: sort_key(doc, FIELD), reverse=True)
+    assert seen == [doc["_id"] for doc in expected]
+
+
+def test_cursor_round_trips_dates_and_ids():
+    value, last_id = decode_cursor(cursor_after(datetime(2024, 5, 1, 12, 30), 7))
+    assert value.replace(tzinfo=None) == datetime(2024, 5, 1, 12, 30)
+    assert last_id == bson.ObjectId(f"{7:024x}")
+
+
+def test_tampered_cursor_is_a_bad_request():
+    with pytest.raises(HTTPException) as error:
+        keyset_query({}, "v", "not-a-cursor")
+    assert error.value.status_code == 400
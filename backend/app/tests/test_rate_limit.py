@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("starlette")
+
+from modules import rate_limit
+from modules.rate_limit import MemoryStore, RateLimitMiddleware, RateLimitRule
+
+RULE = RateLimitRule(path="/token/", limit=3, window_seconds=60, per=["ip", "account"], account_field="username")
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(600.0)
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def check(limiter: RateLimitMiddleware, *subjects: str):
+    return asyncio.run(limiter._check(RULE, list(subjects) or ["ip:1.2.3.4"]))
+
+
+def test_limit_within_one_window(clock):
+    limiter = RateLimitMiddleware(None, rules=[RULE], store=MemoryStore())
+    assert [check(limiter) for _ in range(3)] == [None, None, None]
+    # The window started at 600, the full previous window still counts at its start
+    assert check(limiter) == 61
+
+
+def test_refused_requests_are_not_counted(clock):
+    store = MemoryStore()
+    limiter = RateLimitMiddleware(None, rules=[RULE], store=store)
+    for _ in range(10):
+        check(limiter)
+    assert asyncio.run(store.get(["/token/|ip:1.2.3.4|10"])) == [3]
+
+
+def test_retry_after_is_when_the_window_has_slid_enough(clock):
+    limiter = RateLimitMiddleware(None, rules=[RULE], store=MemoryStore())
+    for _ in range(3):
+        check(limiter)
+
+    # Halfway through the next window the previous 3 weigh 1.5
+    clock.now = 690.0
+    assert [check(limiter), check(limiter)] == [None, None]
+    # 2 + 3 * overlap only drops below 3 once more than 40s of the window have passed
+    retry_after = check(limiter)
+    assert retry_after == 11
+
+    clock.now += retry_after - 1
+    assert check(limiter) is not None
+    clock.now += 1
+    assert check(limiter) is None
+
+
+def test_any_subject_over_the_limit_refuses_and_counts_none(clock):
+    store = MemoryStore()
+    limiter = RateLimitMiddleware(None, rules=[RULE], store=store)
+    for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+        assert check(limiter, f"ip:{ip}", "account:ada") is None
+    assert check(limiter, "ip:4.4.4.4", "account:ada") == 61
+    assert asyncio.run(store.get(["/token/|ip:4.4.4.4|10"])) == [0]
+
+
+def test_middleware_answers_429_with_retry_after(clock):
+    calls = []
+
+    async def endpoint(scope, receive, send):
+        calls.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    limiter = RateLimitMiddleware(endpoint, rules=[RULE], store=MemoryStore())
+
+    async def request():
+        body = b"username=ada&password=secret"
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/token/",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/x-www-form-urlencoded")],
+            "client": ("1.2.3.4", 5000),
+        }
+        await limiter(scope, receive, send)
+        return sent[0]
+
+    statuses = [asyncio.run(request()) for _ in range(4)]
+    assert [start["status"] for start in statuses] == [200, 200, 200, 429]
+    assert (b"retry-after", b"61") in statuses[-1]["headers"]
+    assert len(calls) == 3
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("motor")
+
+from crud import refresh_tokens
+from crud.codec import utcnow
+from crud.refresh_tokens import consume_refresh_token, issue_refresh_token, token_hash
+from modules import sessions
+
+
+@pytest.fixture
+def tokens(monkeypatch, mongo, async_collection):
+    collection = async_collection("refresh_tokens")
+    monkeypatch.setattr(refresh_tokens, "async_databases", SimpleNamespace(refresh_tokens=collection))
+    # Revoking a family broadcasts it to the other API workers
+    monkeypatch.setattr(sessions, "session_invalidations", mongo.session_invalidations)
+    return collection.sync
+
+
+def test_rotation_keeps_the_family(tokens):
+    async def scenario():
+        first, family = await issue_refresh_token("u1")
+        assert (await consume_refresh_token(first))["family_id"] == family
+        second, same_family = await issue_refresh_token("u1", family)
+        assert same_family == family
+        assert (await consume_refresh_token(second))["user_id"] == "u1"
+
+    asyncio.run(scenario())
+
+
+def test_reusing_a_rotated_token_revokes_the_family(tokens):
+    async def scenario():
+        first, family = await issue_refresh_token("u1")
+        await consume_refresh_token(first)
+        second, _ = await issue_refresh_token("u1", family)
+        other, _ = await issue_refresh_token("u1")
+
+        # The copied token is presented again: nothing is issued and the thief's rotation dies too
+        assert await consume_refresh_token(first) is None
+        assert await consume_refresh_token(second) is None
+        # Other sessions of the user are untouched
+        assert await consume_refresh_token(other) is not None
+
+    asyncio.run(scenario())
+    assert {doc["revoked"] for doc in tokens.find({"user_id": "u1"})} == {True, False}
+
+
+def test_expired_and_unknown_tokens_do_not_revoke(tokens):
+    async def scenario():
+        token, family = await issue_refresh_token("u1")
+        sibling, _ = await issue_refresh_token("u1", family)
+        tokens.update_one({"_id": token_hash(token)}, {"$set": {"expires_at": utcnow() - timedelta(seconds=1)}})
+
+        assert await consume_refresh_token(token) is None
+        assert await consume_refresh_token("never issued") is None
+        assert await consume_refresh_token(sibling) is not None
+
+    asyncio.run(scenario())
+
+
+def test_reuse_rejects_the_access_tokens_of_the_family(monkeypatch, mongo, tokens):
+    from fastapi import HTTPException
+
+    from models.user import AccountStatus, User
+    from routes.authentication import auth_modules
+
+    user = User(
+        id="u1", hashed_password="", activated=True, status=AccountStatus.normal,
+        first_name="Ada", last_name="Lovelace", email="ada@example.com", username="ada",
+    )
+    mongo.users.insert_one(user.model_dump())
+    monkeypatch.setattr(auth_modules, "users", mongo.users)
+
+    async def scenario():
+        stolen = await auth_modules.issue_tokens(user)
+        other_session = await auth_modules.issue_tokens(user)
+        await consume_refresh_token(stolen.refresh_token)
+        assert auth_modules.get_session(stolen.access_token).id == "u1"
+
+        assert await consume_refresh_token(stolen.refresh_token) is None
+        return stolen, other_session
+
+    stolen, other_session = asyncio.run(scenario())
+    with pytest.raises(HTTPException) as error:
+        auth_modules.get_session(stolen.access_token)
+    assert error.value.status_code == 401
+    assert auth_modules.get_session(other_session.access_token).id == "u1"
+    # The other API workers learn about it through the invalidation channel
+    assert mongo.session_invalidations.find_one({"family_id": {"$exists": True}})
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from routes.order import state_machine
+
+
+@pytest.fixture
+def orders(monkeypatch, async_collection):
+    collection = async_collection("orders")
+    monkeypatch.setattr(state_machine, "orders", collection)
+
+    async def ignore(*args, **kwargs):
+        return None
+
+    # Side effects of a transition are not under test
+    monkeypatch.setattr(state_machine, "publish_order_event", lambda *args, **kwargs: None)
+    for name in ("record_order_stats", "record_customer_stats", "notify_order_ready"):
+        monkeypatch.setattr(state_machine, name, ignore)
+
+    collection.sync.insert_one({
+        "order_id": "o1",
+        "user_id": "customer",
+        "manufacturer_id": "",
+        "is_cancelled": False,
+        "order_timing_table": {"order_received": {"user_id": "customer", "status": "Order Received"}},
+    })
+    return collection.sync
+
+
+def fails_with(coroutine, status_code: int) -> str:
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(coroutine)
+    assert error.value.status_code == status_code
+    return error.value.detail
+
+
+def test_only_one_manufacturer_wins_the_assignment(orders):
+    async def race():
+        return await asyncio.gather(
+            state_machine.assign("o1", "m1"), state_machine.assign("o1", "m2"), return_exceptions=True
+        )
+
+    results = asyncio.run(race())
+    winners = [result for result in results if isinstance(result, dict)]
+    losers = [result for result in results if isinstance(result, HTTPException)]
+    assert len(winners) == 1 and len(losers) == 1
+    assert losers[0].status_code == 409
+    assert orders.find_one({"order_id": "o1"})["manufacturer_id"] == winners[0]["manufacturer_id"]
+
+
+def test_failed_preconditions_map_to_their_errors(orders):
+    asyncio.run(state_machine.assign("o1", "m1"))
+    assert fails_with(state_machine.assign("o1", "m1"), 400) == "You have already adopted this order"
+    assert fails_with(state_machine.start_production("o1", "m2"), 403) == "Not your order"
+    assert fails_with(state_machine.complete_production("o1", "m1"), 400) == "Production not started yet"
+    assert fails_with(state_machine.assign("missing", "m1"), 404) == "Order not found"
+
+
+def test_steps_only_apply_once_and_in_order(orders):
+    asyncio.run(state_machine.assign("o1", "m1"))
+    asyncio.run(state_machine.start_production("o1", "m1"))
+    assert fails_with(state_machine.start_production("o1", "m1"), 400) == "Production already started"
+    asyncio.run(state_machine.complete_production("o1", "m1"))
+
+    before = asyncio.run(state_machine.finalize("o1", "m1", {"final_price": 10.0}))
+    assert "ready_to_take" not in before["order_timing_table"]
+    # A second finalize is a correction, the returned document tells the caller so
+    again = asyncio.run(state_machine.finalize("o1", "m1", {"final_price": 12.0}))
+    assert again["order_timing_table"]["ready_to_take"]
+    assert orders.find_one({"order_id": "o1"})["final_price"] == 12.0
+
+
+def test_cancel_is_idempotent_and_blocks_later_steps(orders):
+    assert asyncio.run(state_machine.cancel("o1", "customer"))["is_cancelled"] is True
+    assert asyncio.run(state_machine.cancel("o1", "customer")) is None
+    assert fails_with(state_machine.assign("o1", "m1"), 400) == "Cannot assign a cancelled order"
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("motor")
+
+from conftest import AsyncCollection
+from crud import archive, order_stats
+from crud.customer_stats import customer_stats_pipeline
+
+
+def finished_order(oid: int, user_id: str, price: float) -> dict:
+    day = datetime(2024, 5, oid)
+    entry = {"user_id": "m1", "timestamp": day, "status": "x"}
+    return {
+        "_id": oid,
+        "order_id": f"o{oid}",
+        "user_id": user_id,
+        "manufacturer_id": "m1",
+        "order_type": "FDM",
+        "order_detail": {"material": "PLA"},
+        "status": "Ready to Take",
+        "final_price": price,
+        "last_updated": day,
+        "order_timing_table": {
+            "order_received": entry,
+            "assigned_to_manufacturer": entry,
+            "ready_to_take": entry,
+        },
+    }
+
+
+@pytest.fixture
+def stores(monkeypatch, mongo):
+    monkeypatch.setattr(order_stats, "db", mongo)
+    monkeypatch.setattr(order_stats, "orders", mongo.orders)
+    monkeypatch.setattr(order_stats, "orders_archive", mongo.orders_archive)
+    monkeypatch.setattr(order_stats, "order_stats_daily", mongo.order_stats_daily)
+    monkeypatch.setattr(archive, "async_databases", SimpleNamespace(
+        orders=AsyncCollection(mongo.orders), orders_archive=AsyncCollection(mongo.orders_archive)
+    ))
+    mongo.orders.insert_many([finished_order(1, "u1", 10.0), finished_order(2, "u1", 5.0)])
+    return mongo
+
+
+def test_rebuild_keeps_archived_orders(stores):
+    assert asyncio.run(archive.archive_batch({"_id": 1}, 10)) == 1
+    # An interrupted archival left order 2 in both collections
+    stores.orders_archive.insert_one(stores.orders.find_one({"_id": 2}))
+
+    order_stats.rebuild_order_stats()
+
+    buckets = list(stores.order_stats_daily.find({"manufacturer_id": "m1"}))
+    assert sum(bucket.get("completed", 0) for bucket in buckets) == 2
+    assert sum(bucket.get("revenue", 0) for bucket in buckets) == 15.0
+
+
+def test_customer_stats_pipeline_reads_the_archive_once_per_order(mongo):
+    pipeline = customer_stats_pipeline()
+    stages = [next(iter(stage)) for stage in pipeline]
+    assert stages.index("$unionWith") < stages.index("$group")
+    # Grouped by order first, so an order copied to both collections counts once
+    assert pipeline[stages.index("$group")]["$group"]["_id"] == "$_id"
+
+    # mongomock has no $unionWith or $merge, the counting stages run on the orders alone
+    mongo.orders.insert_many([finished_order(1, "u1", 10.0), finished_order(2, "u1", 5.0)])
+    mongo.orders.insert_one({"_id": 3, "user_id": "u1", "is_cancelled": True, "final_price": 7.0})
+    counting = [stage for stage in pipeline if next(iter(stage)) not in ("$unionWith", "$merge", "$project")]
+    assert list(mongo.orders.aggregate(counting)) == [{"_id": "u1", "completed": 2, "cancelled": 1, "total_spend": 15.0}]
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pymongo")
+
+from fastapi import HTTPException
+
+from routes.admin import modules
+from routes.admin.modules import check_import_file, parse_import_rows
+
+HEADER = "first_name,last_name,email,username,password\n"
+
+
+def text_stream(data: bytes) -> io.TextIOWrapper:
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+
+
+def test_too_many_rows_is_refused_before_any_insert(monkeypatch):
+    monkeypatch.setattr(modules, "MAX_IMPORT_ROWS", 3)
+    rows = "".join(f"A,B,a{i}@example.com,a{i},pw\n" for i in range(4))
+    with pytest.raises(HTTPException) as error:
+        check_import_file(text_stream((HEADER + rows).encode()))
+    assert error.value.status_code == 400
+
+
+def test_invalid_encoding_is_refused_up_front():
+    data = (HEADER + "A,B,a@example.com,a,pw\n").encode() + b"\xff\xfe,\xff,bad@example.com,b,pw\n"
+    with pytest.raises(HTTPException) as error:
+        check_import_file(text_stream(data))
+    assert error.value.status_code == 400
+
+
+def test_valid_file_is_rewound_for_the_import():
+    stream = text_stream((HEADER + "A,B,a@example.com,a,pw\n").encode())
+    check_import_file(stream)
+    assert stream.readline() == HEADER
+
+
+def test_rows_report_invalid_and_repeated_entries():
+    data = HEADER + (
+        "A,B,a@example.com,a,pw\n"
+        "A,B,not-an-email,b,pw\n"
+        "A,B,a@example.com,c,pw\n"
+        "A,B,,d,pw\n"
+    )
+    parsed = list(parse_import_rows(text_stream(data.encode())))
+    assert [row_number for row_number, _, _ in parsed] == [2, 3, 4, 5]
+    assert parsed[0][1] is not None and parsed[0][2] is None
+    assert [failure.ok for _, _, failure in parsed[1:]] == [False, False, False]
+    assert parsed[2][2].detail == "Duplicate in file"
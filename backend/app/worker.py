@@ -0,0 +1,126 @@
+"""
+Geometry worker: runs the CPU-heavy jobs of the jobs collection outside the API.
+
+Run from backend/app:
+    python worker.py                         # worker_processes processes
+    python worker.py --processes 4 --max-jobs 100
+
+A supervisor keeps the configured number of worker processes alive. Each process claims jobs
+one at a time, heartbeats the lease while a job runs, and exits after max-jobs jobs. The
+supervisor then starts a fresh process, which bounds the memory trimesh and matplotlib leave behind.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from typing import List, Optional
+
+
+def _heartbeat_loop(job: dict, stop: threading.Event, interval: float) -> None:
+    from crud.jobs import heartbeat
+
+    while not stop.wait(interval):
+        try:
+            if not heartbeat(job):
+                logging.warning(f"Lost the lease of job {job['_id']}")
+                return
+        except Exception as e:
+            logging.error(f"Heartbeat of job {job['_id']} failed: {str(e)}")
+
+
+def run_job(job: dict) -> None:
+    from crud.jobs import complete_job, fail_job
+    from modules.config import config
+    from routes.order.jobs import JOB_HANDLERS
+
+    if job["attempts"] > job.get("max_attempts", config.job_max_attempts):
+        # Claimed again after its worker died each time, most likely the job kills the process
+        fail_job(job, job.get("error") or "Worker died while running the job")
+        return
+
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat_loop, args=(job, stop, config.job_lease_seconds / 3), daemon=True
+    )
+    beat.start()
+    try:
+        result = JOB_HANDLERS[job["kind"]](job["payload"])
+        complete_job(job, result)
+    except Exception as e:
+        logging.error(f"Job {job['_id']} ({job['kind']}) failed: {str(e)}")
+        fail_job(job, f"{str(e)}\n{traceback.format_exc(limit=5)}")
+    finally:
+        stop.set()
+        beat.join()
+
+
+def worker_process(index: int, max_jobs: int) -> None:
+    """Entry point of one worker process; returns after max_jobs jobs to be replaced"""
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s worker-{index} %(levelname)s %(message)s")
+    from crud.jobs import claim_job
+    from modules.config import config
+    from routes.order.jobs import JOB_HANDLERS
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    kinds = list(JOB_HANDLERS)
+    done = 0
+    while done < max_jobs:
+        job = claim_job(worker_id, kinds)
+        if job is None:
+            time.sleep(config.job_poll_seconds)
+            continue
+        run_job(job)
+        done += 1
+    logging.info(f"Recycling after {done} jobs")
+
+
+def supervise(processes: int, max_jobs: int) -> None:
+    # spawn: every worker starts from a fresh interpreter with its own MongoClient
+    context = multiprocessing.get_context("spawn")
+    slots: List[Optional[multiprocessing.Process]] = [None] * processes
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping.is_set():
+        for index, process in enumerate(slots):
+            if process is not None and process.is_alive():
+                continue
+            if process is not None and process.exitcode:
+                logging.warning(f"Worker {index} exited with {process.exitcode}, restarting")
+            slots[index] = context.Process(target=worker_process, args=(index, max_jobs), daemon=True)
+            slots[index].start()
+        stopping.wait(1)
+
+    for process in slots:
+        if process is not None and process.is_alive():
+            process.terminate()
+    for process in slots:
+        if process is not None:
+            process.join(timeout=10)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from modules.config import config
+
+    parser = argparse.ArgumentParser(description="Run the geometry job worker")
+    parser.add_argument("--processes", type=int, default=config.worker_processes)
+    parser.add_argument("--max-jobs", type=int, default=config.worker_max_jobs)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s supervisor %(levelname)s %(message)s")
+    logging.info(f"Starting {args.processes} worker processes, recycled every {args.max_jobs} jobs")
+    supervise(args.processes, args.max_jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import {
   HttpErrorResponse,
   HttpResponse,
 } from "@angular/common/http";
-import { Observable, catchError, tap, throwError } from "rxjs";
+import { Observable, catchError, switchMap, tap, throwError } from "rxjs";
 import { AuthService } from "./auth-service.service";
 
 @Injectable()
@@ -18,24 +18,29 @@ export class AuthInterceptorInterceptor implements HttpInterceptor {
     request: HttpRequest<unknown>,
     next: HttpHandler
   ): Observable<HttpEvent<unknown>> {
-    const authToken = this.authService.getToken();
-
-    if (authToken) {
-      // Clone the request and set the authorization header
-      request = request.clone({
-        setHeaders: {
-          Authorization: `Bearer ${authToken}`,
-        },
-      });
-    }
-
-    return next.handle(request).pipe(
+    return next.handle(this.withToken(request)).pipe(
       tap((event: HttpEvent<any>) => {
         if (event instanceof HttpResponse) {
           // Successful response handling
         }
       }),
       catchError((error: HttpErrorResponse) => {
+        // Access tokens are short-lived, renew once with the refresh token before giving up
+        if (
+          error.status === 401 &&
+          !request.url.includes("/token/") &&
+          this.authService.getRefreshToken()
+        ) {
+          return this.authService.refreshToken().pipe(
+            switchMap(() => next.handle(this.withToken(request))),
+            catchError((refreshError: HttpErrorResponse) => {
+              console.log("Session expired. Redirecting to login page.");
+              this.authService.logout();
+              return throwError(() => refreshError);
+            })
+          );
+        }
+
         if (error.status === 401) {
           console.log("Unauthorized request. Redirecting to login page.");
           this.authService.logout();
@@ -45,4 +50,18 @@ export class AuthInterceptorInterceptor implements HttpInterceptor {
       })
     );
   }
+
+  private withToken(request: HttpRequest<unknown>): HttpRequest<unknown> {
+    const authToken = this.authService.getToken();
+
+    if (!authToken) {
+      return request;
+    }
+    // Clone the request and set the authorization header
+    return request.clone({
+      setHeaders: {
+        Authorization: `Bearer ${authToken}`,
+      },
+    });
+  }
 }
@@ -1,7 +1,7 @@
 import { EventEmitter, Injectable, Output } from "@angular/core";
 import { HttpClient, HttpParams, HttpHeaders } from "@angular/common/http";
 import { BehaviorSubject, Observable } from "rxjs";
-import { tap } from "rxjs";
+import { finalize, shareReplay, tap } from "rxjs";
 import { Router } from "@angular/router";
 import { environment } from "../environment";
 
@@ -11,6 +11,8 @@ import { environment } from "../environment";
 export class AuthService {
   private readonly apiUrl = `${environment.api}/token/`;
   private readonly tokenKey = "token";
+  private readonly refreshTokenKey = "refresh_token";
+  private refreshInFlight: Observable<any> | null = null;
   token_status: boolean = false;
 
   constructor(private http: HttpClient, private router: Router) {
@@ -31,6 +33,27 @@ export class AuthService {
     return localStorage.getItem(this.tokenKey);
   }
 
+  getRefreshToken(): string | null {
+    return localStorage.getItem(this.refreshTokenKey);
+  }
+
+  // Requests failing together share one refresh, a refresh token works only once
+  refreshToken(): Observable<any> {
+    if (!this.refreshInFlight) {
+      this.refreshInFlight = this.http
+        .post<any>(`${this.apiUrl}refresh/`, { refresh_token: this.getRefreshToken() })
+        .pipe(
+          tap((response) => {
+            localStorage.setItem(this.tokenKey, response.access_token);
+            localStorage.setItem(this.refreshTokenKey, response.refresh_token);
+          }),
+          finalize(() => (this.refreshInFlight = null)),
+          shareReplay(1)
+        );
+    }
+    return this.refreshInFlight;
+  }
+
   getUser(): any {
     const userStr = localStorage.getItem("user");
     return userStr ? JSON.parse(userStr) : null;
@@ -66,6 +89,7 @@ export class AuthService {
       .pipe(
         tap((response) => {
           localStorage.setItem(this.tokenKey, response.access_token);
+          localStorage.setItem(this.refreshTokenKey, response.refresh_token);
           localStorage.setItem("user", JSON.stringify(response.user));
           this.isAuthenticatedSubject.next(true);
           
@@ -90,7 +114,14 @@ export class AuthService {
   }
 
   logout(): void {
+    const refreshToken = this.getRefreshToken();
+    if (refreshToken) {
+      this.http
+        .post(`${environment.api}/logout/`, { refresh_token: refreshToken })
+        .subscribe({ error: () => {} });
+    }
     localStorage.removeItem(this.tokenKey);
+    localStorage.removeItem(this.refreshTokenKey);
     localStorage.removeItem("user");
     this.isAuthenticatedSubject.next(false);
     this.router.navigate(["/login"]);